@@ -0,0 +1,338 @@
+import typing
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# benchmark suite: synthetic road networks from 1e3 to 1e7 segments, every case in its own process
+# so peak RSS is per case. Compare a run against a stored baseline JSON to flag regressions.
+
+CRS = "EPSG:3857"
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+TARGETS = ("merge_at_points", "DLV.run")
+DEFAULT_TARGETS = ("merge_at_points",)
+DLV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "duplicatedLineStringValidator")
+
+
+def _segments(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # segment geometries from start (n, 2) and end (n, 2) coordinates
+    return shapely.linestrings(np.stack([a, b], axis=1))
+
+
+def _to_gdfs(
+    a: np.ndarray, b: np.ndarray, pt_xy: np.ndarray
+) -> typing.Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    lines = gpd.GeoDataFrame(
+        {"LINK_ID": np.arange(len(a)), "ROAD_TYPE": np.arange(len(a)) % 3 == 0},
+        geometry=_segments(a, b),
+        crs=CRS,
+    )
+    points = gpd.GeoDataFrame({"NODE_ID": np.arange(len(pt_xy))}, geometry=shapely.points(pt_xy), crs=CRS)
+    return lines, points
+
+
+def make_chain(n: int, seed: int = 0) -> typing.Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    # one serpentine polyline of n segments, a joint point at every inner vertex
+    w = max(2, int(np.sqrt(n)))
+    k = np.arange(n + 1)
+    row, col = np.divmod(k, w)
+    xy = np.column_stack([np.where(row % 2 == 0, col, w - 1 - col), row]).astype(float) * 10.0
+    return _to_gdfs(xy[:-1], xy[1:], xy[1:-1])
+
+
+def make_grid(n: int, seed: int = 0) -> typing.Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    # m x m street grid, every block edge split in two at a joint point, crossings are degree-4 points
+    # 4 m (m - 1) half edges >= n
+    m = max(2, int(np.ceil(0.5 + np.sqrt(0.25 + n / 4))))
+    i, j = np.meshgrid(np.arange(m), np.arange(m - 1), indexing="ij")
+    i, j = i.ravel(), j.ravel()
+    h0, h1 = np.column_stack([j, i]), np.column_stack([j + 1, i])
+    v0, v1 = np.column_stack([i, j]), np.column_stack([i, j + 1])
+    s0 = np.concatenate([h0, v0]).astype(float) * 100.0
+    s1 = np.concatenate([h1, v1]).astype(float) * 100.0
+    mid = (s0 + s1) / 2
+    a = np.concatenate([s0, mid])[:n]
+    b = np.concatenate([mid, s1])[:n]
+    ii, jj = np.meshgrid(np.arange(m), np.arange(m), indexing="ij")
+    crossings = np.column_stack([ii.ravel(), jj.ravel()]).astype(float) * 100.0
+    return _to_gdfs(a, b, np.concatenate([mid, crossings]))
+
+
+def make_star(
+    n: int, seed: int = 0, spokes: int = 8, spoke_len: int = 25
+) -> typing.Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    # hubs of `spokes` polylines with `spoke_len` segments each, joint points on every spoke vertex
+    # and a point on every hub (more than 2 lines, logged as error)
+    per_hub = spokes * spoke_len
+    hubs = max(1, -(-n // per_hub))
+    side = int(np.ceil(np.sqrt(hubs)))
+    hub_xy = np.column_stack(np.divmod(np.arange(hubs), side)).astype(float) * (2.5 * spoke_len * 10.0)
+    angle = np.arange(spokes) * 2 * np.pi / spokes
+    step = np.arange(spoke_len + 1) * 10.0
+    # (spokes, spoke_len + 1, 2) vertices around the origin
+    ray = np.stack([np.cos(angle)[:, None] * step, np.sin(angle)[:, None] * step], axis=-1)
+    verts = hub_xy[:, None, None, :] + ray[None]
+    a = verts[:, :, :-1].reshape(-1, 2)[:n]
+    b = verts[:, :, 1:].reshape(-1, 2)[:n]
+    pts = np.concatenate([verts[:, :, 1:-1].reshape(-1, 2), hub_xy])
+    return _to_gdfs(a, b, pts)
+
+
+def make_clustered(
+    n: int, seed: int = 0, walk_len: int = 20, tol: float = 0.2
+) -> typing.Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    # realistic mix: random-walk roads around gaussian town centres, joint points jittered within tol,
+    # some points far from any line and some roads crossing at shared vertices
+    rng = np.random.default_rng(seed)
+    walks = max(1, -(-n // walk_len))
+    towns = max(1, walks // 50)
+    centre = rng.uniform(0, 2_000.0 * np.sqrt(towns), size=(towns, 2))
+    start = centre[rng.integers(0, towns, walks)] + rng.normal(0, 300.0, size=(walks, 2))
+    heading = rng.uniform(0, 2 * np.pi, walks)[:, None] + np.cumsum(
+        rng.normal(0, 0.3, (walks, walk_len)), axis=1
+    )
+    length = rng.uniform(5.0, 40.0, (walks, walk_len))
+    steps = np.stack([np.cos(heading) * length, np.sin(heading) * length], axis=-1)
+    verts = np.concatenate([start[:, None, :], start[:, None, :] + np.cumsum(steps, axis=1)], axis=1)
+    a = verts[:, :-1].reshape(-1, 2)[:n]
+    b = verts[:, 1:].reshape(-1, 2)[:n]
+    inner = verts[:, 1:-1].reshape(-1, 2)
+    inner = inner + rng.uniform(-tol / 2, tol / 2, inner.shape)
+    stray = rng.uniform(inner.min(axis=0), inner.max(axis=0), (len(inner) // 20, 2))
+    return _to_gdfs(a, b, np.concatenate([inner, stray]))
+
+
+NETWORKS = {
+    "chain": make_chain,
+    "grid": make_grid,
+    "star": make_star,
+    "clustered": make_clustered,
+}
+
+
+def _peak_rss_mb() -> typing.Optional[float]:
+    # None where the resource module is missing (Windows)
+    from jointpointLinemerge import RunMetrics
+
+    rss = RunMetrics.peak_rss_bytes()
+    return None if rss is None else rss / (1024 * 1024)
+
+
+def run_case(
+    network: str,
+    size: int,
+    target: str,
+    tol: float = 0.2,
+    seed: int = 0,
+    matcher: str = "strtree",
+    workers: int = 1,
+) -> dict:
+    # run one case in this process and return its measurements
+    phases = {}
+    t0 = time.perf_counter()
+    lines, points = NETWORKS[network](size, seed)
+    phases["generate"] = time.perf_counter() - t0
+    t_run = time.perf_counter()
+    if target == "merge_at_points":
+        from jointpointLinemerge import merge_at_points, RunMetrics
+
+        metrics = RunMetrics()
+        out, errors = merge_at_points(
+            lines, points, tol, use_point_id_col="NODE_ID", metrics=metrics, matcher=matcher, workers=workers
+        )
+        phases.update(metrics.phases)
+        counts = dict(metrics.counts, lines=len(lines), points=len(points), out_lines=len(out))
+    elif target == "DLV.run":
+        if DLV_DIR not in sys.path:
+            sys.path.insert(0, DLV_DIR)
+        from DLV import DLV
+
+        # every 20th line gets a slightly shifted duplicate
+        dup = lines.iloc[::20].copy()
+        dup["LINK_ID"] += len(lines)
+        dup.geometry = dup.geometry.translate(0.01, 0.01)
+        lines = pd.concat([lines, dup], ignore_index=True)
+        t = time.perf_counter()
+        dlv = DLV(lines, buffer_size=0.1, min_threshold="50p", as_idx="LINK_ID")
+        phases["buffer"] = time.perf_counter() - t
+        t = time.perf_counter()
+        result = dlv.run()
+        phases["run"] = time.perf_counter() - t
+        counts = {"lines": len(lines), "pairs": len(dlv._pairs), "overlaps": len(result)}
+    else:
+        raise ValueError(f"target must be one of {TARGETS}.")
+    return {
+        "network": network,
+        "size": size,
+        "target": target,
+        "workers": workers,
+        "wall_s": time.perf_counter() - t_run,
+        "phases_s": phases,
+        "peak_rss_mb": _peak_rss_mb(),
+        "counts": counts,
+    }
+
+
+def run_case_subprocess(
+    network: str,
+    size: int,
+    target: str,
+    tol: float = 0.2,
+    seed: int = 0,
+    timeout=None,
+    matcher: str = "strtree",
+    workers: int = 1,
+) -> dict:
+    # fresh interpreter per case, so peak RSS and import state do not leak between cases
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", network, str(size), target]
+    cmd += ["--tol", str(tol), "--seed", str(seed), "--matcher", matcher, "--workers", str(workers)]
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(
+            [os.path.dirname(os.path.abspath(__file__)), os.environ.get("PYTHONPATH", "")]
+        ),
+    )
+    proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, env=env)
+    if proc.returncode != 0:
+        raise RuntimeError(f"benchmark case {network}/{size}/{target} failed:\n{proc.stderr[-2000:]}")
+    # the case prints progress, the result is the last line
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def case_key(result: dict) -> str:
+    # cases with a process pool carry their worker count, serial keys match older baselines
+    workers = result.get("workers", 1)
+    return f"{result['target']}/{result['network']}/{result['size']}" + (
+        f"/w{workers}" if workers > 1 else ""
+    )
+
+
+def speedups(results: typing.List[dict]) -> typing.Dict[str, float]:
+    # serial wall time over pooled wall time of every case run with workers > 1 and serially
+    serial = {case_key(r): r["wall_s"] for r in results if r.get("workers", 1) == 1}
+    return {
+        case_key(r): serial[case_key(dict(r, workers=1))] / r["wall_s"]
+        for r in results
+        if r.get("workers", 1) > 1 and case_key(dict(r, workers=1)) in serial and r["wall_s"] > 0
+    }
+
+
+def compare_to_baseline(
+    results: typing.List[dict], baseline: typing.List[dict], time_tol: float = 0.25, rss_tol: float = 0.25
+) -> typing.List[dict]:
+    # flag cases slower (wall time) or bigger (peak RSS) than the baseline by more than the tolerance
+    base = {case_key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(case_key(r))
+        if b is None:
+            continue
+        for metric, allowed in (("wall_s", time_tol), ("peak_rss_mb", rss_tol)):
+            if b[metric] is None or r[metric] is None:
+                continue
+            if b[metric] > 0 and r[metric] > b[metric] * (1 + allowed):
+                regressions.append(
+                    {
+                        "case": case_key(r),
+                        "metric": metric,
+                        "baseline": b[metric],
+                        "current": r[metric],
+                        "ratio": r[metric] / b[metric],
+                    }
+                )
+    return regressions
+
+
+def _parse_args(argv=None):
+    from jointpointLinemerge import MATCHERS
+
+    p = argparse.ArgumentParser(
+        description="Benchmark merge_at_points and DLV.run on synthetic road networks.",
+        epilog=(
+            "Examples:\n"
+            "  # record a baseline\n"
+            "  python bench_jointpointLinemerge.py --sizes 1000 10000 100000 --save-baseline bench_baseline.json\n\n"
+            "  # nightly: compare against it, exit code 1 on regressions\n"
+            "  python bench_jointpointLinemerge.py --sizes 1000 10000 100000 --baseline bench_baseline.json\n"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    p.add_argument("--networks", nargs="+", choices=sorted(NETWORKS), default=sorted(NETWORKS))
+    p.add_argument(
+        "--sizes",
+        nargs="+",
+        type=lambda v: int(float(v)),
+        default=DEFAULT_SIZES,
+        help="Segments per network, 1e3 .. 1e7.",
+    )
+    p.add_argument("--targets", nargs="+", choices=TARGETS, default=DEFAULT_TARGETS)
+    p.add_argument("--tol", type=float, default=0.2)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--matcher", choices=tuple(MATCHERS), default="strtree")
+    p.add_argument(
+        "--workers",
+        nargs="+",
+        type=int,
+        default=(1,),
+        help="Process pool sizes of merge_at_points, every case runs once per size. "
+        "Pass 1 along with larger sizes to report speedups.",
+    )
+    p.add_argument("--timeout", type=float, default=None, help="Per case timeout in seconds.")
+    p.add_argument("--out", default=None, help="Write all results as JSON.")
+    p.add_argument("--baseline", default=None, help="Baseline JSON to compare against.")
+    p.add_argument("--save-baseline", default=None, help="Write the results as new baseline JSON.")
+    p.add_argument("--time-tol", type=float, default=0.25, help="Allowed relative wall time increase.")
+    p.add_argument("--rss-tol", type=float, default=0.25, help="Allowed relative peak RSS increase.")
+    p.add_argument("--child", nargs=3, metavar=("NETWORK", "SIZE", "TARGET"), help=argparse.SUPPRESS)
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    if args.child:
+        network, size, target = args.child
+        (workers,) = args.workers
+        print(json.dumps(run_case(network, int(size), target, args.tol, args.seed, args.matcher, workers)))
+        return 0
+
+    results = []
+    for target in args.targets:
+        for network in args.networks:
+            for size in args.sizes:
+                # DLV.run has no process pool
+                for workers in args.workers if target == "merge_at_points" else (1,):
+                    r = run_case_subprocess(
+                        network, size, target, args.tol, args.seed, args.timeout, args.matcher, workers
+                    )
+                    results.append(r)
+                    phases = " ".join(f"{k} {v:.2f}s" for k, v in r["phases_s"].items())
+                    rss = "n/a" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.1f}"
+                    print(f"[BENCH] {case_key(r):<36} {r['wall_s']:9.2f}s {rss:>9} MB  ({phases})")
+    for key, ratio in speedups(results).items():
+        print(f"[SPEEDUP] {key:<36} x{ratio:.2f}")
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_to_baseline(results, json.load(f), args.time_tol, args.rss_tol)
+        for reg in regressions:
+            print(
+                f"[REGRESSION] {reg['case']}: {reg['metric']} {reg['baseline']:.2f} -> {reg['current']:.2f} "
+                f"(x{reg['ratio']:.2f})"
+            )
+        if regressions:
+            return 1
+        print(f"[Done] no regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
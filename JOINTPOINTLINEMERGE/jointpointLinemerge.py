@@ -1,55 +1,135 @@
+from __future__ import annotations
+
 import typing
 import argparse
-from dataclasses import dataclass
-import pyproj
-import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point, LineString, MultiLineString
-from shapely.ops import unary_union, linemerge, snap
+import collections
+import contextlib
+import concurrent.futures
+import csv
+import hashlib
+import importlib.util
+import json
+import math
+import os
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import time
+import warnings
+from dataclasses import MISSING, dataclass, fields, replace
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _lazy_import(name: str):
+    # module that is loaded on first attribute access, so --help, argument errors and --serve startup
+    # do not pay the numpy / pandas / geopandas / pyproj import (annotations are strings, see __future__)
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+np = _lazy_import("numpy")
+pyproj = _lazy_import("pyproj")
+pd = _lazy_import("pandas")
+gpd = _lazy_import("geopandas")
+pyogrio = _lazy_import("pyogrio")
+shapely = _lazy_import("shapely")
 
 
 @dataclass
 class Param:
     lines_path: str
-    points_path: str
+    points_path: typing.Optional[str]  # None derives the joint points from the lines
     out_lines_path: str
     out_errors_path: str
     tol: float
     point_id_col: typing.Optional[str] = None
     val_chk_col: typing.Tuple[str, ...] = tuple()
+    engine: str = "graph"
+    workers: int = 1
+    tiles: typing.Optional[int] = None
+    window_size: typing.Optional[float] = None
+    line_id_col: typing.Optional[str] = None
+    state_path: typing.Optional[str] = None
+    agg: typing.Optional[typing.Dict[str, str]] = None
+    metrics_path: typing.Optional[str] = None
+    matcher: str = "strtree"
+    prometheus_path: typing.Optional[str] = None
+    memory_budget: typing.Optional[int] = None  # bytes, see estimate_working_set
+    plan_only: bool = False  # write the merge plan (plan_merges) instead of merged lines
+    spatial_sort: typing.Optional[str] = None  # "hilbert" or "morton", see spatial_order
+    cache_dir: typing.Optional[str] = None  # endpoint cache directory, see endpoint_cache
+
 
+ERROR_COLUMNS = ("point_id", "count", "line_ids", "issue", "geometry")
 
-class errlog:
+
+class ErrorLog:
+    # per-run error collector, one list per column, only the first issue of a point is kept
+    # worker shards are merged with extend, to_frame / to_gdf build the errors table without row dicts
     def __init__(self):
-        self.rows = []
+        self.columns = {c: [] for c in ERROR_COLUMNS}
         self.pset = set()
 
+    def __len__(self) -> int:
+        return len(self.pset)
+
+    def __contains__(self, pid) -> bool:
+        return pid in self.pset
+
     def enroll(self, pid, count, line_ids, issue, geometry):
-        already_enrolled = pid in self.pset
+        if pid in self.pset:
+            return
         self.pset.add(pid)
-        if not already_enrolled:
-            self.rows.append(
-                {
-                    "point_id": pid,
-                    "count": count,
-                    "line_ids": line_ids,
-                    "issue": issue,
-                    "geometry": geometry,
-                }
-            )
+        for c, v in zip(ERROR_COLUMNS, (pid, count, line_ids, issue, geometry)):
+            self.columns[c].append(v)
 
+    def extend(self, other: "ErrorLog"):
+        # append a shard, points already logged here keep their first issue
+        if not self.pset.isdisjoint(other.pset):
+            keep = [pid not in self.pset for pid in other.columns["point_id"]]
+            other_columns = {c: [v for v, k in zip(vals, keep) if k] for c, vals in other.columns.items()}
+        else:
+            other_columns = other.columns
+        for c in ERROR_COLUMNS:
+            self.columns[c].extend(other_columns[c])
+        self.pset |= other.pset
 
-errlog = errlog()
+    def relabel(self, start: int, members: typing.Callable[[typing.Any], list]):
+        # swap the line ids of the entries from position start on, every id for the list members gives
+        col = self.columns["line_ids"]
+        col[start:] = [v if v is None else [m for k in v for m in members(k)] for v in col[start:]]
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.columns, columns=list(ERROR_COLUMNS))
+
+    def to_gdf(self, crs) -> gpd.GeoDataFrame:
+        # line_ids joined as text so the layer can be written to GPKG / SHP
+        df = self.to_frame()
+        df["line_ids"] = [None if v is None else ",".join(map(str, v)) for v in df["line_ids"]]
+        return gpd.GeoDataFrame(df, geometry="geometry", crs=crs)
 
 
 def validate_inputs(
     lines_gdf: gpd.GeoDataFrame,
-    points_gdf: gpd.GeoDataFrame,
+    points_gdf: typing.Optional[gpd.GeoDataFrame],
     tol: float,
     use_point_id_col: typing.Optional[str],
     val_chk_col: typing.Tuple[str, ...],
 ):
-    # input validation function
+    # input validation function, points_gdf None when joint points are derived from the lines
     def chk_crs(crs: typing.Union[str, dict, pyproj.CRS]) -> bool:
         try:
             crs = pyproj.CRS.from_user_input(crs)
@@ -65,40 +145,535 @@ def validate_inputs(
 
     if lines_gdf.empty:
         raise ValueError("lines_gdf is empty.")
-    if points_gdf.empty:
+    if points_gdf is not None and points_gdf.empty:
         raise ValueError("points_gdf is empty.")
     if not all(lines_gdf.geometry.type.isin(["LineString", "MultiLineString"])):
         raise ValueError("lines_gdf must contain only LineString or MultiLineString geometries.")
-    if not all(points_gdf.geometry.type == "Point"):
+    if points_gdf is not None and not all(points_gdf.geometry.type == "Point"):
         raise ValueError("points_gdf must contain only Point geometries.")
     if tol <= 0:
         raise ValueError("tol must be a positive number.")
-    if use_point_id_col and use_point_id_col not in points_gdf.columns:
+    if points_gdf is not None and use_point_id_col and use_point_id_col not in points_gdf.columns:
         raise ValueError(f"use_point_id_col '{use_point_id_col}' not found in points_gdf columns.")
     if val_chk_col:
         for c in val_chk_col:
             if c not in lines_gdf.columns:
                 raise ValueError(f"val_chk_col '{c}' not found in lines_gdf columns.")
-    if lines_gdf.crs is None or points_gdf.crs is None:
+    layers = [lines_gdf] if points_gdf is None else [lines_gdf, points_gdf]
+    if any(gdf.crs is None for gdf in layers):
         raise ValueError("layers must have a defined CRS.")
-    if (chk_crs(lines_gdf.crs) and chk_crs(points_gdf.crs)) is False:
+    if not all(chk_crs(gdf.crs) for gdf in layers):
         raise ValueError("layers must have a projected CRS with meter unit.")
 
 
-def iter_endpoints(geom: typing.Union[LineString, MultiLineString]):
+def iter_endpoints(geom: typing.Union[shapely.LineString, shapely.MultiLineString]):
     # yield start and end points of a LineString or MultiLineString
-    if isinstance(geom, LineString):
+    if isinstance(geom, shapely.LineString):
         cs = list(geom.coords)
-        yield Point(cs[0])
-        yield Point(cs[-1])
-    elif isinstance(geom, MultiLineString):
+        yield shapely.Point(cs[0])
+        yield shapely.Point(cs[-1])
+    elif isinstance(geom, shapely.MultiLineString):
         for part in geom.geoms:
             cs = list(part.coords)
-            yield Point(cs[0])
-            yield Point(cs[-1])
+            yield shapely.Point(cs[0])
+            yield shapely.Point(cs[-1])
+
+
+def endpoint_arrays(geoms) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # start and end coordinates of every line part at once, end slot is part * 2 + (0 start, 1 end)
+    parts, line_idx = shapely.get_parts(np.asarray(geoms, dtype=object), return_index=True)
+    part_no = np.arange(len(parts)) - np.searchsorted(line_idx, line_idx)
+    keep = ~shapely.is_empty(parts)
+    parts, line_idx, part_no = parts[keep], line_idx[keep], part_no[keep]
+    xy = np.empty((len(parts) * 2, 2))
+    xy[0::2] = shapely.get_coordinates(shapely.get_point(parts, 0))
+    xy[1::2] = shapely.get_coordinates(shapely.get_point(parts, -1))
+    end_slot = np.repeat(part_no * 2, 2) + np.tile([0, 1], len(parts))
+    return xy, np.repeat(line_idx, 2), end_slot
+
+
+def _point_xy(pt_geoms) -> np.ndarray:
+    return np.column_stack([shapely.get_x(pt_geoms), shapely.get_y(pt_geoms)])
+
+
+def _strtree_pairs(
+    end_xy: np.ndarray, pt_xy: np.ndarray, tol: float, metrics: "RunMetrics"
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    with metrics.phase("index"):
+        tree = shapely.STRtree(shapely.points(end_xy))
+    with metrics.phase("match"):
+        return tree.query(shapely.points(pt_xy), predicate="dwithin", distance=tol)
+
+
+def _kdtree_pairs(
+    end_xy: np.ndarray, pt_xy: np.ndarray, tol: float, metrics: "RunMetrics"
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    # KD-trees over both coordinate sets and one batched radius join, no geometry objects at all
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError as e:
+        raise ImportError('matcher "kdtree" needs scipy, install it with: pip install scipy') from e
+    with metrics.phase("index"):
+        end_ok = np.flatnonzero(np.isfinite(end_xy).all(axis=1))
+        pt_ok = np.flatnonzero(np.isfinite(pt_xy).all(axis=1))
+        end_tree = cKDTree(end_xy[end_ok])
+        pt_tree = cKDTree(pt_xy[pt_ok])
+    with metrics.phase("match"):
+        pairs = pt_tree.sparse_distance_matrix(end_tree, tol, output_type="ndarray")
+    return pt_ok[pairs["i"]], end_ok[pairs["j"]]
+
+
+GRID_CELL = 8.0  # cell size of the precision grid of _grid_pairs, in multiples of tol
 
 
-def merge_two_lines(l1: LineString, l2: LineString, snap_tol: float) -> LineString:
+def _grid_lookup(sorted_keys: np.ndarray, keys: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+    # exact key join against a sorted key array: (keys pos, sorted_keys pos) of every equal pair
+    lo = np.searchsorted(sorted_keys, keys, side="left")
+    n = np.searchsorted(sorted_keys, keys, side="right") - lo
+    offset = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    return np.repeat(np.arange(len(keys)), n), np.repeat(lo, n) + offset
+
+
+def _cell_key(cells: np.ndarray) -> np.ndarray:
+    # hash of integer grid cells, collisions only add candidates that the distance test drops
+    return (cells[:, 0] * 73856093) ^ (cells[:, 1] * 19349663)
+
+
+def _grid_pairs(
+    a_xy: np.ndarray, b_xy: np.ndarray, tol: float, metrics: typing.Optional["RunMetrics"] = None
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    # all (a pos, b pos) pairs within tol, no spatial index: b is snapped to a precision grid of GRID_CELL * tol
+    # cells keyed by exact integer cell keys (sorted keys and searchsorted as the hash table). An a probes a
+    # neighbour cell only when it lies within tol of that border, the distance test keeps pairs within tol.
+    # Extents too large for exact keys use hashed cells (_cell_key) instead.
+    metrics = RunMetrics() if metrics is None else metrics
+    empty = np.empty(0, dtype=np.intp)
+    with metrics.phase("index"):
+        a_ok = np.flatnonzero(np.isfinite(a_xy).all(axis=1))
+        b_ok = np.flatnonzero(np.isfinite(b_xy).all(axis=1))
+        if len(a_ok) == 0 or len(b_ok) == 0:
+            return empty, empty
+        cell = GRID_CELL * tol if tol > 0 else 1.0
+        b_cells = np.floor(b_xy[b_ok] / cell).astype(np.int64)
+        lo = b_cells.min(axis=0)
+        span = b_cells.max(axis=0) - lo + 1
+        exact = float(span[0]) * float(span[1]) < 2**62
+        if exact:
+            key = lambda c: (c[:, 0] - lo[0]) * span[1] + (c[:, 1] - lo[1])
+        else:
+            key = _cell_key
+        b_key = key(b_cells)
+        order = np.argsort(b_key, kind="stable")
+        b_key, b_pos = b_key[order], b_ok[order]
+    with metrics.phase("match"):
+        a_cells = np.floor(a_xy[a_ok] / cell).astype(np.int64)
+        offset = a_xy[a_ok] - a_cells * cell
+        reach = tol * (1 + 1e-9)  # rounding of the cell assignment only adds probes
+        near = {-1: offset <= reach, 0: np.ones_like(offset, dtype=bool), 1: cell - offset <= reach}
+        pairs_i, pairs_j = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                probe = np.flatnonzero(near[dx][:, 0] & near[dy][:, 1])
+                c = a_cells[probe] + (dx, dy)
+                if exact:
+                    inside = ((c >= lo) & (c < lo + span)).all(axis=1)
+                    probe, c = probe[inside], c[inside]
+                qi, ki = _grid_lookup(b_key, key(c))
+                pairs_i.append(a_ok[probe[qi]])
+                pairs_j.append(b_pos[ki])
+        i, j = np.concatenate(pairs_i), np.concatenate(pairs_j)
+        close = np.hypot(*(a_xy[i] - b_xy[j]).T) <= tol
+        i, j = i[close], j[close]
+        if not exact:
+            # neighbour cells hashing to the same key report a pair twice
+            pairs = np.unique(np.column_stack([i, j]), axis=0)
+            i, j = pairs[:, 0], pairs[:, 1]
+    return i, j
+
+
+def _grid_matcher_pairs(
+    end_xy: np.ndarray, pt_xy: np.ndarray, tol: float, metrics: "RunMetrics"
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    return _grid_pairs(pt_xy, end_xy, tol, metrics)
+
+
+MATCHERS = {
+    "strtree": _strtree_pairs,
+    "kdtree": _kdtree_pairs,
+    "grid": _grid_matcher_pairs,
+}
+
+
+def _query_endpoints(
+    end_xy: np.ndarray,
+    pt_xy: np.ndarray,
+    tol: float,
+    matcher: str = "strtree",
+    metrics: typing.Optional["RunMetrics"] = None,
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    # all (point pos, endpoint pos) pairs within tol in one bulk query, as int arrays in any order
+    metrics = RunMetrics() if metrics is None else metrics
+    return MATCHERS[matcher](end_xy, pt_xy, tol, metrics)
+
+
+def _nearest_ends(
+    pt_i: np.ndarray,
+    e_i: np.ndarray,
+    ends: typing.Tuple[np.ndarray, np.ndarray, np.ndarray],
+    pt_xy: np.ndarray,
+    line_rank: typing.Optional[np.ndarray] = None,
+) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # keep the nearest end per point-line pair (lowest end on ties, whatever order the pairs come in)
+    # returns (point pos, line pos, end slot) sorted by point then line (by line_rank[line pos] if given)
+    xy, line_idx, end_slot = ends
+    dist = np.hypot(*(xy[e_i] - pt_xy[pt_i]).T)
+    line_i, end_k = line_idx[e_i], end_slot[e_i]
+    order = np.lexsort((e_i, dist, line_i if line_rank is None else line_rank[line_i], pt_i))
+    pt_i, line_i, end_k = pt_i[order], line_i[order], end_k[order]
+    first = np.ones(len(pt_i), dtype=bool)
+    first[1:] = (pt_i[1:] != pt_i[:-1]) | (line_i[1:] != line_i[:-1])
+    return pt_i[first], line_i[first], end_k[first]
+
+
+def _match_endpoints(
+    ends: typing.Tuple[np.ndarray, np.ndarray, np.ndarray],
+    pt_xy: np.ndarray,
+    tol: float,
+    metrics: typing.Optional["RunMetrics"] = None,
+    matcher: str = "strtree",
+    line_rank: typing.Optional[np.ndarray] = None,
+    cache: typing.Optional["EndpointCache"] = None,
+) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # match all points to line endpoints within tol, see _nearest_ends for the result layout
+    # ends of an EndpointCache are matched through its stored block index (strtree matcher)
+    metrics = RunMetrics() if metrics is None else metrics
+    if cache is not None and matcher == "strtree":
+        pt_i, e_i = cache.pairs(pt_xy, tol, metrics)
+    else:
+        pt_i, e_i = _query_endpoints(ends[0], pt_xy, tol, matcher, metrics)
+    with metrics.phase("match"):
+        hits = _nearest_ends(pt_i, e_i, ends, pt_xy, line_rank)
+    metrics.count("candidates", len(hits[0]))
+    return hits
+
+
+CACHE_VERSION = 1
+# endpoint cache entries kept per cache_dir, the least recently used ones are removed past this
+CACHE_ENTRIES = 4
+
+
+class EndpointCache:
+    # endpoint arrays of a line layer plus a block index over them, saved as .npy files and memory-mapped
+    # on load. The index is the endpoints in Hilbert order cut into blocks of BLOCK with their bounds,
+    # it does not depend on tol, so one cache serves any points layer and tolerance.
+    BLOCK = 8
+    ARRAYS = ("xy", "line_idx", "end_slot", "order", "block_bounds")
+
+    def __init__(self, xy, line_idx, end_slot, order, block_bounds):
+        self.xy, self.line_idx, self.end_slot = xy, line_idx, end_slot
+        self.order, self.block_bounds = order, block_bounds
+
+    @property
+    def ends(self) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self.xy, self.line_idx, self.end_slot
+
+    @classmethod
+    def build(cls, geoms) -> "EndpointCache":
+        xy, line_idx, end_slot = endpoint_arrays(geoms)
+        order = spatial_order(xy, "hilbert")
+        padded = np.full((-(-len(xy) // cls.BLOCK) * cls.BLOCK, 2), np.nan)
+        padded[: len(xy)] = xy[order]
+        blocks = padded.reshape(-1, cls.BLOCK, 2)
+        with np.errstate(all="ignore"), warnings.catch_warnings():
+            # blocks of empty lines only have no bounds
+            warnings.simplefilter("ignore", RuntimeWarning)
+            block_bounds = np.column_stack([np.nanmin(blocks, axis=1), np.nanmax(blocks, axis=1)])
+        return cls(xy, line_idx, end_slot, order, block_bounds)
+
+    @classmethod
+    def load(cls, path: str) -> typing.Optional["EndpointCache"]:
+        # None when path holds no (complete) cache
+        try:
+            return cls(*(np.load(os.path.join(path, f"{a}.npy"), mmap_mode="r") for a in cls.ARRAYS))
+        except (OSError, ValueError):
+            return None
+
+    def save(self, path: str):
+        # written to a temporary directory next to path and moved in place, readers never see a partial cache
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+        try:
+            for a in self.ARRAYS:
+                np.save(os.path.join(tmp, f"{a}.npy"), np.ascontiguousarray(getattr(self, a)))
+            os.replace(tmp, path)
+        except OSError:
+            # another run saved the same cache first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def pairs(
+        self, pt_xy: np.ndarray, tol: float, metrics: "RunMetrics"
+    ) -> typing.Tuple[np.ndarray, np.ndarray]:
+        # (point pos, endpoint pos) pairs within tol, the same pairs as _strtree_pairs
+        # blocks are found by bounding boxes only (no GEOS distance per candidate), the distance test runs
+        # on all BLOCK endpoints of every candidate block at once
+        with metrics.phase("index"):
+            blocks = np.flatnonzero(np.isfinite(self.block_bounds).all(axis=1))
+            tree = shapely.STRtree(shapely.box(*np.asarray(self.block_bounds)[blocks].T))
+        with metrics.phase("match"):
+            pt_i, b = tree.query(shapely.box(*(pt_xy - tol).T, *(pt_xy + tol).T))
+            pos = (blocks[b] * self.BLOCK)[:, None] + np.arange(self.BLOCK)
+            valid = pos < len(self.order)
+            e_i = np.asarray(self.order)[np.where(valid, pos, 0)]
+            d = np.asarray(self.xy)[e_i] - pt_xy[pt_i, None]
+            close = valid & (np.hypot(d[..., 0], d[..., 1]) <= tol)
+        return np.broadcast_to(pt_i[:, None], pos.shape)[close], e_i[close]
+
+
+def lines_fingerprint(lines_gdf: gpd.GeoDataFrame) -> str:
+    # hex digest of the line geometries (coordinates and part layout), reads every coordinate once
+    geoms = np.asarray(lines_gdf.geometry)
+    parts = shapely.get_parts(geoms)
+    h = hashlib.blake2b(f"lines:{CACHE_VERSION}:{len(geoms)}".encode(), digest_size=16)
+    h.update(shapely.get_num_geometries(geoms).astype(np.int64).tobytes())
+    h.update(shapely.get_num_coordinates(parts).astype(np.int64).tobytes())
+    h.update(np.ascontiguousarray(shapely.get_coordinates(parts)).tobytes())
+    return h.hexdigest()
+
+
+def file_fingerprint(path: str) -> str:
+    # hex digest of the file identity (absolute path, size, modification time), changes whenever the file does
+    st = os.stat(path)
+    key = f"file:{CACHE_VERSION}:{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def endpoint_cache(
+    lines_gdf: gpd.GeoDataFrame,
+    cache_dir: str,
+    key: typing.Optional[str] = None,
+    metrics: typing.Optional["RunMetrics"] = None,
+    max_entries: int = CACHE_ENTRIES,
+) -> EndpointCache:
+    # the EndpointCache of lines_gdf from cache_dir, built and saved on a miss
+    # key identifies the geometry, default lines_fingerprint(lines_gdf), pass file_fingerprint for files
+    # a miss removes the least recently used entries past max_entries (stale keys of changed files)
+    metrics = RunMetrics() if metrics is None else metrics
+    with metrics.phase("endpoints"):
+        path = os.path.join(cache_dir, f"endpoints-{key or lines_fingerprint(lines_gdf)}")
+        cache = EndpointCache.load(path)
+        hit = cache is not None
+        metrics.count("cache_hits" if hit else "cache_misses")
+        if not hit:
+            cache = EndpointCache.build(np.asarray(lines_gdf.geometry))
+            cache.save(path)
+        # the last use as mtime for _prune_cache, set explicitly since directory mtimes are coarse
+        with contextlib.suppress(OSError):
+            now = time.time_ns()
+            os.utime(path, ns=(now, now))
+        if not hit:
+            _prune_cache(cache_dir, max_entries)
+    return cache
+
+
+def _prune_cache(cache_dir: str, keep: int):
+    # remove all but the keep most recently used entries, by directory mtime (see endpoint_cache)
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.startswith("endpoints-"):
+            with contextlib.suppress(OSError):
+                entries.append((os.stat(os.path.join(cache_dir, name)).st_mtime_ns, name))
+    for _, name in sorted(entries, reverse=True)[keep:]:
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+
+def _components(n: int, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    # connected components of an edge list, labelled by their smallest member
+    label = np.arange(n)
+    while True:
+        prev = label.copy()
+        np.minimum.at(label, i, label[j])
+        np.minimum.at(label, j, label[i])
+        label = label[label]
+        if np.array_equal(label, prev):
+            return label
+
+
+def derive_joint_points(lines_gdf: gpd.GeoDataFrame, tol: float) -> gpd.GeoDataFrame:
+    # joint points of a line network without a points layer: endpoints clustered within tol
+    # (transitively) where the cluster is exactly one end of each of two different lines.
+    # The point sits on the first of the two endpoints, point_id numbers the points 0..k-1.
+    xy, line_idx, _ = endpoint_arrays(lines_gdf.geometry)
+    i, j = _grid_pairs(xy, xy, tol)
+    label = _components(len(xy), i[i < j], j[i < j])
+    order = np.argsort(label, kind="stable")
+    starts = (
+        np.flatnonzero(np.r_[True, label[order][1:] != label[order][:-1]]) if len(xy) else np.empty(0, int)
+    )
+    sizes = np.diff(np.r_[starts, len(xy)])
+    e0, e1 = order[starts[sizes == 2]], order[starts[sizes == 2] + 1]
+    e0 = e0[line_idx[e0] != line_idx[e1]]
+    return gpd.GeoDataFrame(
+        {"point_id": np.arange(len(e0))}, geometry=shapely.points(xy[e0]), crs=lines_gdf.crs
+    )
+
+
+def _iter_point_hits(
+    pt_i: np.ndarray, line_i: np.ndarray, end_k: np.ndarray, n_points: int
+) -> typing.Iterator[typing.Tuple[int, typing.List[int], typing.List[int]]]:
+    # yield (point pos, line ids, end slots) for every point with at least one hit, in point order
+    bounds = np.searchsorted(pt_i, np.arange(n_points + 1))
+    for p in np.flatnonzero(np.diff(bounds)):
+        lo, hi = bounds[p], bounds[p + 1]
+        yield int(p), line_i[lo:hi].tolist(), end_k[lo:hi].tolist()
+
+
+@dataclass
+class MergeStats:
+    # how often merge_two_lines took each path
+    fast: int = 0
+    overlay: int = 0
+    manual: int = 0
+
+    def __str__(self) -> str:
+        return f"fast {self.fast}, overlay {self.overlay}, manual {self.manual}"
+
+
+class RunMetrics:
+    # structured instrumentation of one run: per-phase wall time (accumulated when a phase repeats),
+    # counts, per-iteration counts and peak memory. callback(event) gets every phase end and iteration
+    # as a dict, to_json / to_prometheus write the totals for operations.
+    # The OS only keeps the peak RSS of the whole process: peak_rss_bytes includes earlier runs of a
+    # --serve or --batch worker, peak_rss_growth_bytes is how far this run raised it (0 when an earlier
+    # run peaked higher)
+    def __init__(self, callback: typing.Optional[typing.Callable[[dict], None]] = None):
+        self.callback = callback
+        self.phases: typing.Dict[str, float] = {}
+        self.counts: typing.Dict[str, int] = {}
+        self.iterations: typing.List[dict] = []
+        self.started = time.perf_counter()
+        self.rss_at_start = self.peak_rss_bytes()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t0
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self._emit({"event": "phase", "phase": name, "seconds": seconds})
+
+    def count(self, name: str, n: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def iteration(self, **counts):
+        self.iterations.append(counts)
+        self._emit(dict(counts, event="iteration", iteration=len(self.iterations)))
+
+    def _emit(self, event: dict):
+        if self.callback is not None:
+            self.callback(event)
+
+    @staticmethod
+    def peak_rss_bytes() -> typing.Optional[int]:
+        # peak resident set size of this process since it started, None where the resource module is missing
+        # (Windows)
+        if resource is None:
+            return None
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+    def to_dict(self) -> dict:
+        peak = self.peak_rss_bytes()
+        return {
+            "wall_seconds": time.perf_counter() - self.started,
+            "phases": dict(self.phases),
+            "counts": dict(self.counts),
+            "iterations": list(self.iterations),
+            "peak_rss_bytes": peak,
+            "peak_rss_growth_bytes": None if peak is None else peak - self.rss_at_start,
+        }
+
+    def to_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    def to_prometheus(self, path: str, prefix: str = "jointpoint_linemerge"):
+        # node_exporter textfile format, written to a temp file and renamed so scrapes never see half a file
+        d = self.to_dict()
+        lines = [
+            f"# HELP {prefix}_wall_seconds Wall time of the run.",
+            f"# TYPE {prefix}_wall_seconds gauge",
+            f"{prefix}_wall_seconds {d['wall_seconds']:.6f}",
+            f"# HELP {prefix}_phase_seconds Wall time per phase.",
+            f"# TYPE {prefix}_phase_seconds gauge",
+        ]
+        lines += [f'{prefix}_phase_seconds{{phase="{k}"}} {v:.6f}' for k, v in d["phases"].items()]
+        lines += [f"# HELP {prefix}_count Items counted during the run.", f"# TYPE {prefix}_count gauge"]
+        lines += [f'{prefix}_count{{name="{k}"}} {v}' for k, v in d["counts"].items()]
+        if d["peak_rss_bytes"] is not None:
+            lines += [
+                f"# HELP {prefix}_peak_rss_bytes Peak resident set size of the process, earlier runs too.",
+                f"# TYPE {prefix}_peak_rss_bytes gauge",
+                f"{prefix}_peak_rss_bytes {d['peak_rss_bytes']}",
+                f"# HELP {prefix}_peak_rss_growth_bytes Growth of the process peak RSS in this run.",
+                f"# TYPE {prefix}_peak_rss_growth_bytes gauge",
+                f"{prefix}_peak_rss_growth_bytes {d['peak_rss_growth_bytes']}",
+            ]
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+
+def _join_ends(e1: np.ndarray, e2: np.ndarray, tol: float) -> typing.Optional[np.ndarray]:
+    # (i, k): end i of line 1 meets end k of line 2 (0 start, 1 end), e1 / e2 hold (start, end) coordinates
+    # returns None when no or more than one endpoint pair is within tol (rings, loops, gaps)
+    # plain float math, this runs once per joint and numpy's per-call overhead dominated 2 x 2 ends
+    hit = None
+    for i in (0, 1):
+        for k in (0, 1):
+            if math.hypot(e1[i][0] - e2[k][0], e1[i][1] - e2[k][1]) <= tol:
+                if hit is not None:
+                    return None
+                hit = (i, k)
+    return hit
+
+
+def _merge_coords(c1: np.ndarray, c2: np.ndarray, tol: float) -> typing.Optional[np.ndarray]:
+    # join two coordinate arrays at their single shared endpoint, keeping l1 direction
+    # returns None when the ends do not join (see _join_ends)
+    if len(c1) < 2 or len(c2) < 2:
+        return None
+    hit = _join_ends(c1[[0, -1]].tolist(), c2[[0, -1]].tolist(), tol)
+    if hit is None:
+        return None
+    i, k = hit
+    if i == 1:
+        # l1 end joins l2, drop the joint vertex of l2
+        return np.concatenate([c1, (c2 if k == 0 else c2[::-1])[1:]])
+    # l1 start joins l2, l2 goes first
+    return np.concatenate([c2 if k == 1 else c2[::-1], c1[1:]])
+
+
+def merge_two_lines(
+    l1: shapely.LineString, l2: shapely.LineString, snap_tol: float, stats: typing.Optional[MergeStats] = None
+) -> shapely.LineString:
+    # fast path: plain coordinate concatenation at the shared endpoint
+    if l1.geom_type == "LineString" and l2.geom_type == "LineString" and l1.has_z == l2.has_z:
+        coords = _merge_coords(
+            shapely.get_coordinates(l1, include_z=l1.has_z),
+            shapely.get_coordinates(l2, include_z=l2.has_z),
+            snap_tol or 0.0,
+        )
+        if coords is not None:
+            if stats is not None:
+                stats.fast += 1
+            return shapely.LineString(coords)
+
+    from shapely.ops import unary_union, linemerge, snap
+
     # to avoid TopologyException, snap each line to itself first
     u = unary_union([l1, l2])
     if snap_tol and snap_tol > 0:
@@ -109,8 +684,8 @@ def merge_two_lines(l1: LineString, l2: LineString, snap_tol: float) -> LineStri
     # raise error if not LineString NOTE: 이런경우는 직접 데이터를 봐야하므로 무리하게 처리하지 않음
     if m.geom_type != "LineString":
         # find Commonality of two lines and connect coordinates manually
-        l1_start, l1_end = Point(list(l1.coords)[0]), Point(list(l1.coords)[-1])
-        l2_start, l2_end = Point(list(l2.coords)[0]), Point(list(l2.coords)[-1])
+        l1_start, l1_end = shapely.Point(list(l1.coords)[0]), shapely.Point(list(l1.coords)[-1])
+        l2_start, l2_end = shapely.Point(list(l2.coords)[0]), shapely.Point(list(l2.coords)[-1])
         common_pts = None
         for p1 in [l1_start, l1_end]:
             for p2 in [l2_start, l2_end]:
@@ -123,7 +698,7 @@ def merge_two_lines(l1: LineString, l2: LineString, snap_tol: float) -> LineStri
                     if p1.distance(p2) <= snap_tol:
                         common_pts = p1
         if common_pts is None:
-            raise ValueError("Merged geometry is not LineString.")
+            raise ValueError("LineString Conversion Failed: no common endpoint within tolerance.")
 
         if common_pts.equals(l1_start):
             l1_coords = list(l1.coords)[::-1]
@@ -135,173 +710,2010 @@ def merge_two_lines(l1: LineString, l2: LineString, snap_tol: float) -> LineStri
             l2_coords = list(l2.coords)[::-1][1:]
         try:
             merged_coords = l1_coords + l2_coords
-            m = LineString(merged_coords)
+            m = shapely.LineString(merged_coords)
             if m.geom_type != "LineString":
                 raise ValueError("Merged geometry is not LineString.")
         except Exception as e:
             raise ValueError(f"Error in manual merging: {e}")
+        if stats is not None:
+            stats.manual += 1
+        return m
 
+    if stats is not None:
+        stats.overlay += 1
     return m
 
 
-def merge_at_points(
+# first_input / last_input take the member first / last in input row order, not along the chain
+AGG_FUNCS = ("sum", "mean", "wmean", "min", "max", "first_input", "last_input", "concat")
+
+
+def check_agg(agg: typing.Optional[typing.Dict[str, str]], columns) -> typing.Dict[str, str]:
+    # agg maps an attribute column to one of AGG_FUNCS, columns not listed keep the representative row's value
+    agg = dict(agg or {})
+    for col, fn in agg.items():
+        if col not in columns:
+            raise ValueError(f"agg column '{col}' not found in lines_gdf columns.")
+        if fn not in AGG_FUNCS:
+            raise ValueError(f"agg function '{fn}' for column '{col}' must be one of {AGG_FUNCS}.")
+    return agg
+
+
+def aggregate_chains(
+    table: pd.DataFrame, lengths: np.ndarray, chain: np.ndarray, agg: typing.Dict[str, str]
+) -> pd.DataFrame:
+    # one groupby over all merged rows: table holds the member rows of every chain back to back
+    # in input order, chain the chain number (0..k-1, ascending) of each row and lengths its line length
+    # wmean is the mean weighted by line length, first_input / last_input / concat follow the input row
+    # order so every engine gives the same result
+    table = table[list(agg)].reset_index(drop=True)
+    chain = np.asarray(chain)
+    grouped = table.groupby(chain, sort=True)
+    starts = np.flatnonzero(np.r_[True, chain[1:] != chain[:-1]])
+    stops = np.r_[starts[1:], len(chain)] - 1
+    out = {}
+    for col, fn in agg.items():
+        if fn == "wmean":
+            w = pd.Series(lengths, dtype=float).where(table[col].notna(), 0.0)
+            out[col] = (table[col] * w).groupby(chain).sum() / w.groupby(chain).sum()
+        elif fn == "first_input":
+            out[col] = table[col].iloc[starts].set_axis(chain[starts])
+        elif fn == "last_input":
+            out[col] = table[col].iloc[stops].set_axis(chain[stops])
+        elif fn == "concat":
+            out[col] = grouped[col].agg(lambda v: ",".join(map(str, v)))
+        else:
+            out[col] = grouped[col].agg(fn)
+    return pd.DataFrame(out)
+
+
+def attr_keys(table: pd.DataFrame, cols: typing.Sequence[str]) -> np.ndarray:
+    # one int64 key per row over cols: equal keys <=> equal values, so value checks are integer compares
+    # a row with a missing value gets a (negative) key of its own, missing values never match
+    keys = np.zeros(len(table), dtype=np.int64)
+    if not cols or not len(table):
+        return keys
+    keys[:] = table.groupby(list(cols), sort=False, dropna=False).ngroup().to_numpy()
+    missing = np.flatnonzero(table[list(cols)].isna().any(axis=1).to_numpy())
+    keys[missing] = -1 - missing
+    return keys
+
+
+# coordinate grid of geometry fingerprints, in CRS units
+DEDUP_PRECISION = 1e-6
+
+
+def geometry_fingerprint(geom, precision: float = DEDUP_PRECISION) -> bytes:
+    # 16 byte digest of the coordinates snapped to precision, the same for a line and its reverse
+    # empty and missing geometries share the empty fingerprint
+    if geom is None or geom.is_empty:
+        return b""
+    q = np.round(shapely.get_coordinates(geom, include_z=geom.has_z) / precision).astype(np.int64)
+    h = hashlib.blake2b(f"{geom.geom_type}:{shapely.get_num_geometries(geom)}".encode(), digest_size=16)
+    h.update(min(q.tobytes(), q[::-1].tobytes()))
+    return h.digest()
+
+
+class _LineStore:
+    # positional line table keyed by row id, merges read and write it in O(1)
+    # original rows keep ids 0..n-1, merged rows get new ids and point to the attribute row they copy
+    # retired rows drop their geometry, so merged lines replace their members instead of adding to them
+    # rank is the input position of every original row when the table was reordered (spatial_sort),
+    # "first" rows, output order and merged_from follow it
+    def __init__(
+        self,
+        lines_gdf: gpd.GeoDataFrame,
+        agg: typing.Optional[typing.Dict[str, str]] = None,
+        rank: typing.Optional[np.ndarray] = None,
+    ):
+        self.crs = lines_gdf.crs
+        self.geom_col = lines_gdf.geometry.name
+        self.table = lines_gdf.drop(columns=self.geom_col).reset_index(drop=True)
+        self.geoms = list(lines_gdf.geometry)
+        # wmean weights by member length, taken before the members are retired
+        self.lengths = (
+            shapely.length(np.asarray(self.geoms, dtype=object)) if "wmean" in (agg or {}).values() else None
+        )
+        n = len(self.geoms)
+        self.src = list(range(n))
+        self.members = [[i] for i in range(n)]
+        self.points = [[] for _ in range(n)]
+        self.alive = [True] * n
+        self.fingerprints = {}  # fingerprint -> first row with it, see drop_duplicate_geoms
+        self.fingerprinted = 0
+        self.rank = list(range(n)) if rank is None else np.asarray(rank).tolist()
+        self.order = list(range(n)) if rank is None else np.argsort(rank, kind="stable").tolist()
+
+    def __len__(self) -> int:
+        return len(self.geoms)
+
+    def attr_keys(self, cols: typing.Sequence[str]) -> np.ndarray:
+        # keys of the original rows, a merged row i compares as its attribute row self.src[i]
+        return attr_keys(self.table, cols)
+
+    def add(self, geom, src: int, members: typing.List[int], points: list) -> int:
+        self.geoms.append(geom)
+        self.src.append(src)
+        self.members.append(members)
+        self.points.append(points)
+        self.alive.append(True)
+        return len(self.geoms) - 1
+
+    def retire(self, i: int):
+        self.alive[i] = False
+        self.geoms[i] = None
+
+    def key(self, i: int) -> int:
+        # input position of the attribute row of row i, orders rows as the input did
+        return self.rank[self.src[i]]
+
+    def first(self, rows: typing.Iterable[int]) -> int:
+        # attribute row for a merge of rows: the one first in input order
+        return self.src[min(rows, key=self.key)]
+
+    def alive_ids(self) -> typing.List[int]:
+        # original rows in input order, then merged rows as added
+        n = len(self.order)
+        return [i for i in self.order if self.alive[i]] + [
+            i for i in range(n, len(self.alive)) if self.alive[i]
+        ]
+
+    def drop_duplicate_geoms(self) -> int:
+        # keep the first of identical geometries (either direction, see geometry_fingerprint)
+        # only rows added since the last call are fingerprinted, the first call takes the original rows too
+        # returns the number of rows dropped
+        dropped = 0
+        rows = range(self.fingerprinted, len(self.geoms))
+        if self.fingerprinted == 0:
+            rows = self.order + list(range(len(self.order), len(self.geoms)))
+        for i in rows:
+            if not self.alive[i]:
+                continue
+            key = geometry_fingerprint(self.geoms[i])
+            first = self.fingerprints.get(key)
+            if first is not None and self.alive[first]:
+                self.retire(i)
+                dropped += 1
+            else:
+                self.fingerprints[key] = i
+        self.fingerprinted = len(self.geoms)
+        return dropped
+
+    def to_gdf(self, agg: typing.Optional[typing.Dict[str, str]] = None) -> gpd.GeoDataFrame:
+        # materialize alive rows, merge columns stay empty for untouched lines
+        # agg columns of merged rows are evaluated over their members in one pass (see aggregate_chains)
+        ids = self.alive_ids()
+        out = self.table.iloc[[self.src[i] for i in ids]].reset_index(drop=True)
+        merged = [len(self.members[i]) > 1 for i in ids]
+        merged_ids = [i for i, mg in zip(ids, merged) if mg]
+        if agg and merged_ids:
+            sizes = [len(self.members[i]) for i in merged_ids]
+            flat = np.concatenate([sorted(self.members[i], key=self.key) for i in merged_ids])
+            lengths = self.lengths[flat] if self.lengths is not None else np.zeros(len(flat))
+            chain = np.repeat(np.arange(len(merged_ids)), sizes)
+            values = aggregate_chains(self.table.iloc[flat], lengths, chain, agg)
+            rows = np.flatnonzero(merged)
+            for col in agg:
+                col_values = out[col].to_numpy(dtype=object)
+                col_values[rows] = values[col].to_numpy(dtype=object)
+                out[col] = pd.Series(col_values).infer_objects()
+        out["merged_from"] = [
+            ",".join(str(self.rank[m]) for m in self.members[i]) if mg else None for i, mg in zip(ids, merged)
+        ]
+        out["merge_point_id"] = [
+            ",".join(str(p) for p in self.points[i]) if mg else None for i, mg in zip(ids, merged)
+        ]
+        out["merged_count"] = pd.array(
+            [len(self.points[i]) if mg else None for i, mg in zip(ids, merged)], dtype="Int64"
+        )
+        out[self.geom_col] = [self.geoms[i] for i in ids]
+        return gpd.GeoDataFrame(out, geometry=self.geom_col, crs=self.crs)
+
+
+def _merge_iterative(
     lines_gdf: gpd.GeoDataFrame,
     points_gdf: gpd.GeoDataFrame,
     tol: float,
     use_point_id_col: str = None,
     val_chk_col: typing.Tuple[str, ...] = None,
+    stats: typing.Optional[MergeStats] = None,
+    agg: typing.Optional[typing.Dict[str, str]] = None,
+    errlog: typing.Optional[ErrorLog] = None,
+    metrics: typing.Optional[RunMetrics] = None,
+    matcher: str = "strtree",
+    rank: typing.Optional[np.ndarray] = None,
+    cache: typing.Optional[EndpointCache] = None,
 ) -> typing.Tuple[gpd.GeoDataFrame, pd.DataFrame]:
-    global errlog
+    # pass based engine: every pass matches the points against the current lines, schedules all legal
+    # joints at once (chains in a _JointGraph) and merges them, until a pass merges nothing.
+    # A point whose line end is already taken by an earlier point of the same pass is retried on the
+    # next pass, so the pass count does not grow with chain length.
+    errlog = ErrorLog() if errlog is None else errlog
+    metrics = RunMetrics() if metrics is None else metrics
     # variable setup
     iteration = 0
     iterlim = 100
     total_merged = 0
-    line_raw = lines_gdf.copy()
-    lines = None
+    store = _LineStore(lines_gdf, agg, rank)
+    keys = store.attr_keys(val_chk_col) if val_chk_col else None
+    pt_geoms = np.asarray(points_gdf.geometry)
+    pt_xy = _point_xy(pt_geoms)
+    if use_point_id_col and use_point_id_col in points_gdf.columns:
+        pids = points_gdf[use_point_id_col].tolist()
+    else:
+        pids = points_gdf.index.tolist()
+    same_values = None
+    if keys is not None:
+        # merged rows compare as their attribute row
+        same_values = lambda a, b: keys[store.src[a]] == keys[store.src[b]]
     ###############
     while iteration < iterlim:
-        lines = (
-            line_raw.copy().reset_index(drop=True) if lines is None else lines.copy().reset_index(drop=True)
-        )
-        lines["__row_id__"] = lines.index
-        # collect endpoints from line GeoDataFrame to intersect with points
-        end_rows = []
-        for i, geom in enumerate(lines.geometry):
-            for k, pt in enumerate(iter_endpoints(geom)):
-                end_rows.append({"__row_id__": i, "which": f"end{k%2}", "geometry": pt})
-        ends = gpd.GeoDataFrame(end_rows, geometry="geometry", crs=lines.crs)
-        sidx = ends.sindex
-        pts = points_gdf.copy()
-        if use_point_id_col and use_point_id_col in pts.columns:
-            pts["_pt_id_"] = pts[use_point_id_col]
+        ids = store.alive_ids()
+        # match every point to line endpoints at once, the first pass sees the input lines (cache)
+        if iteration > 0:
+            cache = None
+        if cache is not None:
+            # cached ends are numbered by row of the (possibly spatially sorted) table, not by alive_ids
+            ids = list(range(len(store)))
+            ends = cache.ends
         else:
-            pts["_pt_id_"] = pts.index
+            with metrics.phase("endpoints"):
+                ends = endpoint_arrays([store.geoms[i] for i in ids])
+        line_rank = None if rank is None else np.array([store.key(i) for i in ids], dtype=np.int64)
+        hits = _match_endpoints(ends, pt_xy, tol, metrics, matcher, line_rank, cache)
+        n_errors = len(errlog)
 
-        # define iteration variables
-        used_line = set()
-        merged_rows = []
-
-        untouched_ids = set(lines["__row_id__"].tolist())
-        merge_count = 0
-        ###############
+        # schedule: per-point rules in point order, accepted joints form chains
+        with metrics.phase("graph"):
+            graph = _JointGraph(key=store.key)
+            for p, line_pos, end_slots in _iter_point_hits(*hits, len(pids)):
+                if pids[p] in errlog:
+                    continue
+                line_ids = [ids[k] for k in line_pos]
+                if len(line_ids) != 2 or (same_values is not None and not same_values(*line_ids)):
+                    _add_joint(
+                        graph, errlog, pids[p], pt_geoms[p], line_ids, end_slots, same_values, val_chk_col
+                    )
+                else:
+                    # a taken line end is not an error here, the point is retried on the next pass
+                    graph.add(pids[p], pt_geoms[p], line_ids[0], end_slots[0], line_ids[1], end_slots[1])
 
         # main loop
-        for _, prow in pts.iterrows():
-            # find candidate line ends using spatial index intersection
-            pt = prow.geometry
-            pid = prow["_pt_id_"]
-            if pid in errlog.pset:
-                continue
-            buf = pt.buffer(tol)
-            cand_idx = list(sidx.intersection(buf.bounds))
-            if not cand_idx:
-                continue
-            cand = ends.iloc[cand_idx]
-            hits = cand[cand.intersects(buf)]
-            line_ids = set(hits["__row_id__"].tolist())
-
-            # check only 2 lines joined
-            if len(line_ids) != 2:
-                errlog.enroll(
-                    pid,
-                    len(line_ids),
-                    sorted(line_ids) if len(line_ids) > 0 else None,
-                    "Not exactly 2 lines to merge.",
-                    pt,
-                )
-                continue
+        with metrics.phase("merge"):
+            chains = [
+                (members, joint_ids, [store.geoms[m] for m in members], [graph.joints[j] for j in joint_ids])
+                for members, joint_ids in graph.chains(errlog)
+            ]
+            results = _merge_chains(chains, tol, stats, errlog)
+        # errors name merged rows of the store, log their original member rows instead
+        errlog.relabel(n_errors, lambda i: sorted(store.members[i], key=store.key))
 
-            # check used lines
-            a_id, b_id = sorted(line_ids)
-            if a_id in used_line or b_id in used_line:
-                continue
-
-            try:
-                # join, write new row
-                l1 = lines.loc[lines["__row_id__"] == a_id, "geometry"].iloc[0]
-                l2 = lines.loc[lines["__row_id__"] == b_id, "geometry"].iloc[0]
-                if val_chk_col:
-                    v1 = lines.loc[lines["__row_id__"] == a_id, val_chk_col].iloc[0]
-                    v2 = lines.loc[lines["__row_id__"] == b_id, val_chk_col].iloc[0]
-                    if not all(v1 == v2):
-                        errlog.enroll(
-                            pid,
-                            len(line_ids),
-                            sorted(line_ids) if len(line_ids) > 0 else None,
-                            f"Value check failed at columns {val_chk_col}.",
-                            pt,
-                        )
-                        continue
-                merged_geom = merge_two_lines(l1, l2, snap_tol=tol)
-                # TODO: add arguments to control merged attributes like.. sum, average, first, last etc..
-                rep_row = lines.loc[lines["__row_id__"] == a_id].copy().iloc[[0]]
-                rep_row.loc[:, "geometry"] = [merged_geom]
-                rep_row.loc[:, "merged_from"] = [f"{a_id},{b_id}"]
-                rep_row.loc[:, "merge_point_id"] = [pid]
-                rep_row.loc[:, "merged_count"] = (
-                    rep_row.loc[:, "merged_count"] + 1 if "merged_count" in rep_row.columns else 1
-                )
-                merged_rows.append(rep_row)
-                merge_count += 1
-                used_line.update({a_id, b_id})
-                untouched_ids.discard(a_id)
-                untouched_ids.discard(b_id)
-
-            except Exception as e:
-                errlog.enroll(
-                    pid,
-                    len(line_ids),
-                    sorted(line_ids) if len(line_ids) > 0 else None,
-                    f"Error in merging: {e}",
-                    pt,
-                )
-                continue
-
-        # reconstruct lines and unjoined lines(remain)
-        remain = lines[lines["__row_id__"].isin(untouched_ids)].copy()
-        if merged_rows:
-            lines = gpd.GeoDataFrame(
-                pd.concat([remain] + merged_rows, ignore_index=True), geometry="geometry", crs=lines.crs
+        # merged rows follow in order of their representative (lowest) original row
+        merge_count = 0
+        pieces = [piece for chain_pieces in results for piece in chain_pieces]
+        for part_members, part_joints, geom in sorted(pieces, key=lambda p: min(map(store.key, p[0]))):
+            points = list(store.points[part_members[0]])
+            for j, m in zip(part_joints, part_members[1:]):
+                points += [graph.joints[j][0]] + store.points[m]
+            store.add(
+                geom,
+                store.first(part_members),
+                [o for m in part_members for o in store.members[m]],
+                points,
             )
+            for m in part_members:
+                store.retire(m)
+            merge_count += len(part_joints)
+
+        metrics.iteration(candidates=len(hits[0]), merges=merge_count, errors=len(errlog) - n_errors)
+        if pieces:
             # drop duplicates
-            lines["__wkb__"] = lines.geometry.apply(lambda g: g.wkb if g else None)
-            lines = lines.drop_duplicates(subset="__wkb__").drop(columns="__wkb__")
+            with metrics.phase("dedup"):
+                metrics.count("duplicates", store.drop_duplicate_geoms())
 
             # pipeline control
             total_merged += merge_count
             print(f"[INFO] iter {iteration + 1}: merged {merge_count} lines")
-            if merge_count == 0:
-                break
-            lines = lines.copy()
         else:
             print(
-                f"[INFO] No more line merges possible. - Total {total_merged} lines merged, {len(errlog.rows)} errors."
+                f"[INFO] No more line merges possible. - Total {total_merged} lines merged, {len(errlog)} errors."
             )
-            lines = remain
             break
 
         iteration += 1
     print(f"[INFO] max iterations reached. Check data if necessary.") if iteration >= iterlim else None
-    errors = pd.DataFrame(errlog.rows, columns=["point_id", "count", "line_ids", "issue", "geometry"])
-    return lines, errors
+    metrics.count("merges", total_merged)
+    metrics.count("errors", len(errlog))
+    with metrics.phase("materialize"):
+        out = store.to_gdf(agg)
+    return out, errlog.to_frame()
 
 
-def run(Param: Param):
-    lines = gpd.read_file(Param.lines_path)
-    points = gpd.read_file(Param.points_path)
+class _JointGraph:
+    # line network as a graph: lines are edges, accepted joint points are degree-2 nodes
+    # lines are keyed by any hashable, sortable id so the graph can also grow window by window
+    def __init__(self, key: typing.Optional[typing.Callable[[typing.Any], typing.Any]] = None):
+        # key orders line ids for picking chain starts, default the ids themselves
+        self.links = {}
+        self.joints = []
+        self.slots = set()
+        self.key = key
 
-    validate_inputs(lines, points, Param.tol, Param.point_id_col, Param.val_chk_col)
-    out_gdf, err_df = merge_at_points(
-        lines, points, Param.tol, use_point_id_col=Param.point_id_col, val_chk_col=Param.val_chk_col
+    def add(self, pid, geometry, a_id: int, a_end: int, b_id: int, b_end: int) -> bool:
+        # accept a joint only if both line ends are still free and no line would branch
+        if (a_id, a_end) in self.slots or (b_id, b_end) in self.slots:
+            return False
+        if len(self.links.get(a_id, ())) >= 2 or len(self.links.get(b_id, ())) >= 2:
+            return False
+        j = len(self.joints)
+        self.joints.append((pid, geometry, a_id, a_end, b_id, b_end))
+        self.slots.update({(a_id, a_end), (b_id, b_end)})
+        self.links.setdefault(a_id, []).append(j)
+        self.links.setdefault(b_id, []).append(j)
+        return True
+
+    def chains(
+        self, errlog: typing.Optional[ErrorLog] = None
+    ) -> typing.Iterator[typing.Tuple[typing.List[int], typing.List[int]]]:
+        # yield (ordered line ids, joint ids between them) for every maximal chain
+        # the joint closing a ring is logged to errlog, its point sees a single (merged) line
+        seen = set()
+        ids = sorted(self.links, key=self.key)
+        # open chains start from a line with a single joint, lowest row id first
+        for start in ids:
+            if start not in seen and len(self.links[start]) == 1:
+                yield self._walk(start, seen, errlog)
+        # whatever is left is a closed ring
+        for start in ids:
+            if start not in seen:
+                yield self._walk(start, seen, errlog)
+
+    def chain_of(
+        self, line_id, errlog: typing.Optional[ErrorLog] = None
+    ) -> typing.Tuple[typing.List[int], typing.List[int]]:
+        # the chain holding line_id, walked from the same start as chains() would
+        component, stack = {line_id}, [line_id]
+        while stack:
+            for j in self.links.get(stack.pop(), ()):
+                _, _, a_id, _, b_id, _ = self.joints[j]
+                for other in (a_id, b_id):
+                    if other not in component:
+                        component.add(other)
+                        stack.append(other)
+        open_ends = [m for m in component if len(self.links.get(m, ())) == 1]
+        return self._walk(min(open_ends or component, key=self.key), set(), errlog)
+
+    def _walk(
+        self, start, seen: set, errlog: typing.Optional[ErrorLog] = None
+    ) -> typing.Tuple[typing.List[int], typing.List[int]]:
+        members, joint_ids = [start], []
+        seen.add(start)
+        cur, prev_j = start, None
+        while True:
+            nxt = [j for j in self.links.get(cur, ()) if j != prev_j]
+            if not nxt:
+                break
+            j = nxt[0]
+            _, _, a_id, _, b_id, _ = self.joints[j]
+            other = b_id if a_id == cur else a_id
+            if other in seen:
+                # ring closed at this joint, nothing left to merge
+                if errlog is not None:
+                    pid, pt = self.joints[j][:2]
+                    errlog.enroll(pid, 1, sorted(members, key=self.key), "Not exactly 2 lines to merge.", pt)
+                break
+            members.append(other)
+            joint_ids.append(j)
+            seen.add(other)
+            cur, prev_j = other, j
+        return members, joint_ids
+
+
+def _add_joint(
+    graph: _JointGraph,
+    errlog: ErrorLog,
+    pid,
+    pt: shapely.Point,
+    line_ids: list,
+    end_slots: list,
+    same_values: typing.Optional[typing.Callable[[typing.Any, typing.Any], bool]],
+    val_chk_col: typing.Tuple[str, ...],
+):
+    # apply the per-point rules, add the joint to the graph or log why it was refused
+    if len(line_ids) != 2:
+        errlog.enroll(
+            pid,
+            len(line_ids),
+            line_ids if len(line_ids) > 0 else None,
+            "Not exactly 2 lines to merge.",
+            pt,
+        )
+        return
+    a_id, b_id = line_ids
+    if same_values is not None and not same_values(a_id, b_id):
+        errlog.enroll(pid, 2, [a_id, b_id], f"Value check failed at columns {val_chk_col}.", pt)
+        return
+    if not graph.add(pid, pt, a_id, end_slots[0], b_id, end_slots[1]):
+        errlog.enroll(pid, 2, [a_id, b_id], "Line end already joined at another point.", pt)
+
+
+def _tile_ids(xy: np.ndarray, bounds: typing.Tuple[float, float, float, float], n_side: int) -> np.ndarray:
+    # row-major tile index of each coordinate on an n_side x n_side grid over bounds
+    x0, y0, x1, y1 = bounds
+    w = max(x1 - x0, 1e-9) / n_side
+    h = max(y1 - y0, 1e-9) / n_side
+    ix = np.clip(((xy[:, 0] - x0) // w).astype(np.int64), 0, n_side - 1)
+    iy = np.clip(((xy[:, 1] - y0) // h).astype(np.int64), 0, n_side - 1)
+    return iy * n_side + ix
+
+
+def _match_tile(args) -> typing.Tuple[np.ndarray, np.ndarray]:
+    # worker: match the points owned by one tile against the endpoints in the tile plus a tol halo
+    end_xy, end_pos, pt_xy, pt_pos, tol, matcher = args
+    pt_i, e_i = _query_endpoints(end_xy, pt_xy, tol, matcher)
+    return pt_pos[pt_i], end_pos[e_i]
+
+
+def _match_tiled(
+    ends: typing.Tuple[np.ndarray, np.ndarray, np.ndarray],
+    pt_xy: np.ndarray,
+    tol: float,
+    pool: concurrent.futures.Executor,
+    n_side: int,
+    matcher: str = "strtree",
+    line_rank: typing.Optional[np.ndarray] = None,
+) -> typing.Tuple[typing.Tuple[np.ndarray, np.ndarray, np.ndarray], np.ndarray, tuple]:
+    # tiled version of _match_endpoints, every point belongs to exactly one tile so the result is identical
+    end_xy = ends[0]
+    both = np.concatenate([end_xy, pt_xy]) if len(end_xy) else pt_xy
+    bounds = (*np.nanmin(both, axis=0), *np.nanmax(both, axis=0))
+    pt_tile = _tile_ids(pt_xy, bounds, n_side)
+    x0, y0, x1, y1 = bounds
+    w, h = max(x1 - x0, 1e-9) / n_side, max(y1 - y0, 1e-9) / n_side
+    jobs = []
+    for t in np.unique(pt_tile):
+        iy, ix = divmod(int(t), n_side)
+        tx0, ty0 = x0 + ix * w, y0 + iy * h
+        halo = (
+            (end_xy[:, 0] >= tx0 - tol)
+            & (end_xy[:, 0] <= tx0 + w + tol)
+            & (end_xy[:, 1] >= ty0 - tol)
+            & (end_xy[:, 1] <= ty0 + h + tol)
+        )
+        end_pos = np.flatnonzero(halo)
+        pt_pos = np.flatnonzero(pt_tile == t)
+        jobs.append((end_xy[end_pos], end_pos, pt_xy[pt_pos], pt_pos, tol, matcher))
+    pairs = list(pool.map(_match_tile, jobs))
+    pt_i = np.concatenate([p for p, _ in pairs] + [np.empty(0, dtype=np.int64)])
+    e_i = np.concatenate([e for _, e in pairs] + [np.empty(0, dtype=np.int64)])
+    return _nearest_ends(pt_i, e_i, ends, pt_xy, line_rank), pt_tile, bounds
+
+
+class LineBuffer:
+    # lines as one contiguous float64 coordinate buffer plus offsets (GeoArrow linestring layout), line i is
+    # coords[offsets[i]:offsets[i + 1]]. plain marks the LineStrings of 2+ coordinates, other rows (multi-part,
+    # empty, missing) hold no coordinates. has_z lines use the third column, coords has one only if any does.
+    # Chains are merged on views of the buffer, see _merge_chain.
+
+    def __init__(self, coords: np.ndarray, offsets: np.ndarray, plain: np.ndarray, has_z: np.ndarray):
+        self.coords = coords
+        self.offsets = offsets
+        self.plain = plain
+        self.has_z = has_z
+        # (start, end) x / y of every line, rows that are not plain get zeros
+        last = np.where(plain, offsets[1:] - 1, 0)
+        first = np.where(plain, offsets[:-1], 0)
+        self.ends_xy = np.zeros((len(plain), 2, 2))
+        if len(coords):
+            self.ends_xy[:, 0] = coords[first, :2]
+            self.ends_xy[:, 1] = coords[last, :2]
+
+    def __len__(self) -> int:
+        return len(self.plain)
+
+    @classmethod
+    def from_geoms(cls, geoms) -> "LineBuffer":
+        geoms = np.asarray(geoms, dtype=object)
+        counts = shapely.get_num_coordinates(geoms)
+        plain = (shapely.get_type_id(geoms) == shapely.GeometryType.LINESTRING) & (counts >= 2)
+        has_z = shapely.has_z(geoms) & plain
+        coords = shapely.get_coordinates(geoms[plain], include_z=bool(has_z.any()))
+        offsets = np.zeros(len(geoms) + 1, dtype=np.int64)
+        np.cumsum(np.where(plain, counts, 0), out=offsets[1:])
+        return cls(coords, offsets, plain, has_z)
+
+    @classmethod
+    def from_arrow(cls, array) -> "LineBuffer":
+        # GeoArrow linestring array, the geometry column of GeoParquet written with
+        # geometry_encoding="geoarrow" (see _read_lines). Interleaved coordinates (list<fixed_size_list<double>>) are used in place,
+        # separated ones (list<struct<x, y[, z]>>, geopandas' default) are interleaved once
+        if hasattr(array, "combine_chunks"):
+            array = array.combine_chunks()
+        offsets = array.offsets.to_numpy().astype(np.int64, copy=False)
+        values = array.values
+        if hasattr(values.type, "list_size"):
+            coords = values.flatten().to_numpy(zero_copy_only=True).reshape(-1, values.type.list_size)
+        else:
+            coords = np.column_stack([v.to_numpy(zero_copy_only=False) for v in values.flatten()])
+        plain = np.diff(offsets) >= 2
+        if array.null_count:
+            plain &= array.is_valid().to_numpy(zero_copy_only=False)
+        return cls(coords, offsets, plain, np.full(len(plain), coords.shape[1] == 3) & plain)
+
+    def take(self, rows: np.ndarray) -> "LineBuffer":
+        # buffer of the given rows in that order, their coordinates copied into one new array
+        rows = np.asarray(rows, dtype=np.int64)
+        start = self.offsets[rows]
+        n = self.offsets[rows + 1] - start
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(n, out=offsets[1:])
+        idx = np.repeat(start - offsets[:-1], n) + np.arange(offsets[-1])
+        return LineBuffer(self.coords[idx], offsets, self.plain[rows], self.has_z[rows])
+
+    def coords_of(self, row: int) -> np.ndarray:
+        # coordinate view of a plain row, x / y (/ z)
+        return self.coords[self.offsets[row] : self.offsets[row + 1], : 3 if self.has_z[row] else 2]
+
+    def endpoint_arrays(self) -> typing.Optional[typing.Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        # endpoint_arrays of the lines straight from the buffer, None unless every line is plain
+        if not self.plain.all():
+            return None
+        n = len(self.plain)
+        return self.ends_xy.reshape(-1, 2), np.repeat(np.arange(n), 2), np.tile([0, 1], n)
+
+
+class _CoordChain:
+    # coordinates of a growing chain as array views (LineBuffer rows or merged geometries), joined once by
+    # coords(). Extending a chain only looks at its two ends, so merging k lines stays linear in their size
+    def __init__(self, coords: np.ndarray):
+        self.parts = collections.deque([coords])
+        self.ends = coords[[0, -1]].tolist()
+        self.has_z = coords.shape[1] == 3
+
+    @classmethod
+    def of(cls, geom) -> typing.Optional["_CoordChain"]:
+        # None for anything the fast path of merge_two_lines would not take
+        coords = _line_coords(geom)
+        return None if coords is None else cls(coords)
+
+    def join(self, c2: typing.Optional[np.ndarray], tol: float, ends: typing.Optional[list] = None) -> bool:
+        # same rules and result as _merge_coords(self.coords(), c2), False leaves the chain as is
+        # ends: (start, end) coordinates of c2 when already known (LineBuffer.ends_xy)
+        if c2 is None or (c2.shape[1] == 3) != self.has_z:
+            return False
+        e2 = c2[[0, -1]].tolist() if ends is None else ends
+        hit = _join_ends(self.ends, e2, tol)
+        if hit is None:
+            return False
+        i, k = hit
+        if i == 1:
+            self.parts.append((c2 if k == 0 else c2[::-1])[1:])
+        else:
+            self.parts[0] = self.parts[0][1:]
+            self.parts.appendleft(c2 if k == 1 else c2[::-1])
+        self.ends[i] = e2[1 - k]
+        return True
+
+    def coords(self) -> np.ndarray:
+        return np.concatenate(self.parts)
+
+
+def _line_coords(geom) -> typing.Optional[np.ndarray]:
+    # coordinates of a LineString of 2+ coordinates, None for anything else
+    if geom is None or geom.geom_type != "LineString" or shapely.get_num_coordinates(geom) < 2:
+        return None
+    return shapely.get_coordinates(geom, include_z=geom.has_z)
+
+
+def _merge_chain(
+    members: typing.List[int],
+    joint_ids: typing.List[int],
+    geoms: list,
+    tol: float,
+    stats: MergeStats,
+    buf: typing.Optional[LineBuffer] = None,
+    rows: typing.Optional[typing.List[int]] = None,
+) -> typing.Tuple[list, typing.List[typing.Tuple[int, str]]]:
+    # merge one chain in order, a failed merge splits the chain at that joint
+    # returns merged pieces (members, joint ids, geometry) and failed joints (joint id, message)
+    # plain LineStrings are collected as coordinate views and built once per piece, only joints the
+    # fast path refuses go through merge_two_lines on the piece built so far.
+    # With buf (rows: buffer row of every member) the views are taken from the buffer, geoms may then be None
+    # for plain rows, they are built only when a merge needs them
+    def coords(k):
+        if buf is not None and buf.plain[rows[k]]:
+            return buf.coords_of(rows[k])
+        return _line_coords(geoms[k])
+
+    def join(k):
+        if buf is not None and buf.plain[rows[k]]:
+            return chain.join(buf.coords_of(rows[k]), tol, buf.ends_xy[rows[k]].tolist())
+        return chain.join(_line_coords(geoms[k]), tol)
+
+    def line(k):
+        if geoms[k] is None and buf is not None and buf.plain[rows[k]]:
+            return shapely.LineString(buf.coords_of(rows[k]))
+        return geoms[k]
+
+    def start(k):
+        c = coords(k)
+        return None if c is None else _CoordChain(c)
+
+    pieces = []
+    failures = []
+    part_members, part_joints, acc = [members[0]], [], geoms[0]
+    chain = start(0)
+    for k, (j, nxt) in enumerate(zip(joint_ids, members[1:]), start=1):
+        if chain is not None and join(k):
+            if stats is not None:
+                stats.fast += 1
+            part_members.append(nxt)
+            part_joints.append(j)
+            continue
+        if chain is not None:
+            acc = shapely.LineString(chain.coords())
+        geom = line(k)
+        try:
+            acc = merge_two_lines(acc, geom, tol, stats=stats)
+            part_members.append(nxt)
+            part_joints.append(j)
+            chain = _CoordChain.of(acc)
+        except Exception as e:
+            failures.append((j, str(e)))
+            if len(part_members) > 1:
+                pieces.append((part_members, part_joints, acc))
+            part_members, part_joints, acc = [nxt], [], geom
+            chain = start(k)
+    if len(part_members) > 1:
+        pieces.append(
+            (part_members, part_joints, shapely.LineString(chain.coords()) if chain is not None else acc)
+        )
+    return pieces, failures
+
+
+def _merge_chains(
+    chains: list, tol: float, stats: MergeStats, errlog: ErrorLog, buf: typing.Optional[LineBuffer] = None
+) -> list:
+    # merge (members, joint ids, geometries, joints) chains, failed joints are logged to errlog
+    # returns the merged pieces of every chain. buf holds the lines by member id, without it one is built
+    # over the chain geometries
+    own = buf is None
+    if own:
+        buf = LineBuffer.from_geoms([g for chain in chains for g in chain[2]])
+        bounds = np.cumsum([0] + [len(chain[0]) for chain in chains])
+    results = []
+    for c, (members, joint_ids, geoms, joints) in enumerate(chains):
+        rows = list(range(bounds[c], bounds[c + 1])) if own else members
+        pieces, failures = _merge_chain(members, joint_ids, geoms, tol, stats, buf, rows)
+        for j, msg in failures:
+            pid, pt, a_id, _, b_id, _ = joints[joint_ids.index(j)]
+            errlog.enroll(pid, 2, [a_id, b_id], f"Error in merging: {msg}", pt)
+        results.append(pieces)
+    return results
+
+
+def _merge_chain_batch(args) -> typing.Tuple[list, MergeStats]:
+    # worker: merge all chains assigned to one tile. The lines arrive as a LineBuffer of the chain members in
+    # chain order plus WKB of the rows it does not hold, so no geometry objects are pickled either way:
+    # members are buffer rows, piece geometries go back as WKB
+    # returns (pieces, failed joints) of every chain, see _merge_chain
+    buf, wkb, sizes, chain_joints, tol = args
+    geoms = [None] * len(buf)
+    for row, g in wkb.items():
+        geoms[row] = shapely.from_wkb(g)
+    stats = MergeStats()
+    results = []
+    start = 0
+    for size, joint_ids in zip(sizes, chain_joints):
+        rows = list(range(start, start + size))
+        pieces, failures = _merge_chain(rows, joint_ids, geoms[start : start + size], tol, stats, buf, rows)
+        results.append(([(m, j, shapely.to_wkb(g)) for m, j, g in pieces], failures))
+        start += size
+    return results, stats
+
+
+def _build_joint_graph(
+    ends: typing.Tuple[np.ndarray, np.ndarray, np.ndarray],
+    pt_geoms: np.ndarray,
+    pids: list,
+    tol: float,
+    keys: typing.Optional[np.ndarray],
+    val_chk_col: typing.Tuple[str, ...],
+    errlog: ErrorLog,
+    metrics: RunMetrics,
+    matcher: str = "strtree",
+    pool: typing.Optional[concurrent.futures.Executor] = None,
+    n_side: typing.Optional[int] = None,
+    key: typing.Optional[typing.Callable[[int], int]] = None,
+    line_rank: typing.Optional[np.ndarray] = None,
+    cache: typing.Optional[EndpointCache] = None,
+) -> typing.Tuple[_JointGraph, tuple, typing.Optional[tuple]]:
+    # match points to line ends (tile by tile with a pool) and accept joints, refused points go to errlog
+    # keys are the val_chk_col keys of the lines (attr_keys), None skips the value check
+    # key / line_rank order the lines as the input did when the tables were reordered (spatial_sort)
+    pt_xy = _point_xy(pt_geoms)
+    bounds = None
+    if pool is not None:
+        with metrics.phase("match"):
+            hits, _, bounds = _match_tiled(ends, pt_xy, tol, pool, n_side, matcher, line_rank)
+        metrics.count("candidates", len(hits[0]))
+    else:
+        hits = _match_endpoints(ends, pt_xy, tol, metrics, matcher, line_rank, cache)
+
+    with metrics.phase("graph"):
+        graph = _JointGraph(key=key)
+        same_values = None
+        if keys is not None:
+            same_values = lambda a, b: keys[a] == keys[b]
+        for p, line_ids, end_slots in _iter_point_hits(*hits, len(pids)):
+            if pids[p] not in errlog:
+                _add_joint(graph, errlog, pids[p], pt_geoms[p], line_ids, end_slots, same_values, val_chk_col)
+    return graph, hits, bounds
+
+
+def _merge_graph(
+    lines_gdf: gpd.GeoDataFrame,
+    points_gdf: gpd.GeoDataFrame,
+    tol: float,
+    use_point_id_col: str = None,
+    val_chk_col: typing.Tuple[str, ...] = None,
+    stats: typing.Optional[MergeStats] = None,
+    workers: int = 1,
+    tiles: typing.Optional[int] = None,
+    agg: typing.Optional[typing.Dict[str, str]] = None,
+    errlog: typing.Optional[ErrorLog] = None,
+    metrics: typing.Optional[RunMetrics] = None,
+    matcher: str = "strtree",
+    rank: typing.Optional[np.ndarray] = None,
+    cache: typing.Optional[EndpointCache] = None,
+    buf: typing.Optional[LineBuffer] = None,
+) -> typing.Tuple[gpd.GeoDataFrame, pd.DataFrame]:
+    # single pass engine: build the joint graph once and merge every maximal chain
+    # with workers > 1, matching and chain merging run per spatial tile in a process pool,
+    # chains crossing tile seams are stitched in the (global) joint graph in between
+    errlog = ErrorLog() if errlog is None else errlog
+    metrics = RunMetrics() if metrics is None else metrics
+    store = _LineStore(lines_gdf, agg, rank)
+    geoms = store.geoms
+
+    pt_geoms = np.asarray(points_gdf.geometry)
+    if use_point_id_col and use_point_id_col in points_gdf.columns:
+        pids = points_gdf[use_point_id_col].tolist()
+    else:
+        pids = points_gdf.index.tolist()
+    with metrics.phase("endpoints"):
+        # chain merging reads the lines from one buffer, tile workers get the slices of their chains
+        if buf is None:
+            buf = LineBuffer.from_geoms(geoms)
+        elif len(buf) != len(geoms):
+            raise ValueError("line buffer does not match lines_gdf.")
+        ends = cache.ends if cache is not None else buf.endpoint_arrays()
+        if ends is None:
+            ends = endpoint_arrays(geoms)
+
+    with contextlib.ExitStack() as stack:
+        pool = n_side = None
+        if workers > 1:
+            pool = stack.enter_context(concurrent.futures.ProcessPoolExecutor(max_workers=workers))
+            n_side = tiles or math.ceil(math.sqrt(4 * workers))
+        keys = store.attr_keys(val_chk_col) if val_chk_col else None
+        graph, hits, bounds = _build_joint_graph(
+            ends,
+            pt_geoms,
+            pids,
+            tol,
+            keys,
+            val_chk_col,
+            errlog,
+            metrics,
+            matcher,
+            pool,
+            n_side,
+            store.key,
+            None if rank is None else np.asarray(rank),
+            cache,
+        )
+
+        # merge chains, members are retired as soon as their chain is merged
+        with metrics.phase("merge"):
+            if pool is None:
+                results = []
+                n_chains = 0
+                for members, joint_ids in graph.chains(errlog):
+                    chain = (
+                        members,
+                        joint_ids,
+                        [geoms[m] for m in members],
+                        [graph.joints[j] for j in joint_ids],
+                    )
+                    chain_pieces = _merge_chains([chain], tol, stats, errlog, buf)[0]
+                    for part_members, _, _ in chain_pieces:
+                        for m in part_members:
+                            store.retire(m)
+                    results.append(chain_pieces)
+                    n_chains += 1
+            else:
+                chains = list(graph.chains(errlog))
+                n_chains = len(chains)
+                # a chain goes to the tile of the start point of its first line
+                first_end = np.searchsorted(ends[1], [members[0] for members, _ in chains])
+                chain_tile = _tile_ids(ends[0][first_end].reshape(-1, 2), bounds, n_side)
+                batches = [np.flatnonzero(chain_tile == t) for t in np.unique(chain_tile)]
+                batch_rows = [np.concatenate([chains[c][0] for c in batch]) for batch in batches]
+                jobs = []
+                for batch, rows in zip(batches, batch_rows):
+                    sub = buf.take(rows)
+                    other = np.flatnonzero(~sub.plain)
+                    wkb = dict(
+                        zip(other.tolist(), shapely.to_wkb(np.asarray(geoms, dtype=object)[rows[other]]))
+                    )
+                    jobs.append(
+                        (sub, wkb, [len(chains[c][0]) for c in batch], [chains[c][1] for c in batch], tol)
+                    )
+                results = [None] * len(chains)
+                for batch, rows, (batch_results, batch_stats) in zip(
+                    batches, batch_rows, pool.map(_merge_chain_batch, jobs)
+                ):
+                    # buffer rows of the batch back to line ids, piece geometries come back as WKB
+                    for c, (pieces, failures) in zip(batch, batch_results):
+                        results[c] = [
+                            ([int(rows[m]) for m in part_members], part_joints, shapely.from_wkb(geom))
+                            for part_members, part_joints, geom in pieces
+                        ]
+                        for j, msg in failures:
+                            pid, pt, a_id, _, b_id, _ = graph.joints[j]
+                            errlog.enroll(pid, 2, [a_id, b_id], f"Error in merging: {msg}", pt)
+                    stats.fast += batch_stats.fast
+                    stats.overlay += batch_stats.overlay
+                    stats.manual += batch_stats.manual
+
+    pieces = [piece for chain_pieces in results for piece in chain_pieces]
+
+    # merged rows follow the untouched ones, ordered by their representative (lowest) row id
+    merge_count = 0
+    for part_members, part_joints, geom in sorted(pieces, key=lambda p: min(map(store.key, p[0]))):
+        store.add(geom, store.first(part_members), part_members, [graph.joints[j][0] for j in part_joints])
+        for m in part_members:
+            store.retire(m)
+        merge_count += len(part_joints)
+    if pieces:
+        # drop duplicates
+        with metrics.phase("dedup"):
+            metrics.count("duplicates", store.drop_duplicate_geoms())
+    print(f"[INFO] graph: merged {merge_count} lines into {len(pieces)} chains, {len(errlog)} errors.")
+    metrics.iteration(candidates=len(hits[0]), merges=merge_count, errors=len(errlog))
+    metrics.count("chains", n_chains)
+    metrics.count("merges", merge_count)
+    metrics.count("errors", len(errlog))
+    with metrics.phase("materialize"):
+        out = store.to_gdf(agg)
+    return out, errlog.to_frame()
+
+
+PLAN_COLUMNS = ("chain_id", "line_ids", "point_ids", "merged_count")
+
+
+def plan_merges(
+    lines_gdf: gpd.GeoDataFrame,
+    points_gdf: gpd.GeoDataFrame,
+    tol: float,
+    use_point_id_col: str = None,
+    val_chk_col: typing.Tuple[str, ...] = None,
+    errlog: typing.Optional[ErrorLog] = None,
+    metrics: typing.Optional[RunMetrics] = None,
+    matcher: str = "strtree",
+    cache: typing.Optional[EndpointCache] = None,
+) -> typing.Tuple[pd.DataFrame, pd.DataFrame]:
+    # dry run of the graph engine: match and build chains, no geometry is merged
+    # returns one row per chain (line row positions in chain order, joint point ids between them) and the
+    # predicted errors. Points refused by the joint rules are predicted, merges failing on geometry are not.
+    errlog = ErrorLog() if errlog is None else errlog
+    metrics = RunMetrics() if metrics is None else metrics
+    pt_geoms = np.asarray(points_gdf.geometry)
+    if use_point_id_col and use_point_id_col in points_gdf.columns:
+        pids = points_gdf[use_point_id_col].tolist()
+    else:
+        pids = points_gdf.index.tolist()
+    if cache is not None:
+        ends = cache.ends
+    else:
+        with metrics.phase("endpoints"):
+            ends = endpoint_arrays(np.asarray(lines_gdf.geometry))
+    keys = None
+    if val_chk_col:
+        keys = attr_keys(lines_gdf.drop(columns=lines_gdf.geometry.name), val_chk_col)
+    graph, hits, _ = _build_joint_graph(
+        ends, pt_geoms, pids, tol, keys, val_chk_col, errlog, metrics, matcher, cache=cache
+    )
+
+    # chains in output order, by their lowest row id
+    chains = sorted(graph.chains(errlog), key=lambda c: min(c[0]))
+    plan = pd.DataFrame(
+        {
+            "chain_id": np.arange(len(chains), dtype=np.int64),
+            "line_ids": [",".join(map(str, members)) for members, _ in chains],
+            "point_ids": [",".join(str(graph.joints[j][0]) for j in joint_ids) for _, joint_ids in chains],
+            "merged_count": np.array([len(joint_ids) for _, joint_ids in chains], dtype=np.int64),
+        },
+        columns=list(PLAN_COLUMNS),
+    )
+    print(
+        f"[INFO] plan: {int(plan['merged_count'].sum())} merges in {len(plan)} chains, {len(errlog)} errors."
+    )
+    metrics.iteration(candidates=len(hits[0]), merges=int(plan["merged_count"].sum()), errors=len(errlog))
+    metrics.count("chains", len(plan))
+    metrics.count("errors", len(errlog))
+    return plan, errlog.to_frame()
+
+
+MERGE_ENGINES = {
+    "graph": _merge_graph,
+    "iterative": _merge_iterative,
+}
+
+
+SPATIAL_CURVES = ("hilbert", "morton")
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    # 16 bit integers with a zero bit inserted after every bit
+    v = v & 0xFFFF
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    return (v | (v << 1)) & 0x55555555
+
+
+def _hilbert_index(x: np.ndarray, y: np.ndarray, bits: int) -> np.ndarray:
+    # distance along the Hilbert curve of the 2**bits x 2**bits grid cells (x, y)
+    n = 1 << bits
+    d = np.zeros(len(x), dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant
+        flip = rx & ~ry
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+        s >>= 1
+    return d
+
+
+def spatial_order(
+    xy: np.ndarray,
+    curve: str = "hilbert",
+    bounds: typing.Optional[typing.Tuple[float, float, float, float]] = None,
+) -> np.ndarray:
+    # permutation that visits xy along a Hilbert or Morton (z-order) curve over bounds (default the
+    # bounds of xy) on a 65536 x 65536 grid, ties keep their input order, missing coordinates go last
+    if curve not in SPATIAL_CURVES:
+        raise ValueError(f"spatial order curve must be one of {SPATIAL_CURVES}.")
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    if not len(xy):
+        return np.empty(0, dtype=np.int64)
+    bits = 16
+    missing = np.isnan(xy).any(axis=1)
+    if bounds is None:
+        bounds = (*np.nanmin(xy, axis=0), *np.nanmax(xy, axis=0)) if not missing.all() else (0, 0, 1, 1)
+    x0, y0, x1, y1 = bounds
+    scale = ((1 << bits) - 1) / np.array([max(x1 - x0, 1e-9), max(y1 - y0, 1e-9)])
+    cells = np.clip((np.nan_to_num(xy - [x0, y0]) * scale).astype(np.int64), 0, (1 << bits) - 1)
+    if curve == "hilbert":
+        d = _hilbert_index(cells[:, 0], cells[:, 1], bits)
+    else:
+        d = _spread_bits(cells[:, 0]) | (_spread_bits(cells[:, 1]) << 1)
+    d[missing] = np.iinfo(np.int64).max
+    return np.argsort(d, kind="stable")
+
+
+def _sort_spatially(
+    lines_gdf: gpd.GeoDataFrame, points_gdf: gpd.GeoDataFrame, curve: str
+) -> typing.Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, np.ndarray]:
+    # both tables in curve order over their common bounds, lines by the centre of their bbox
+    # returns the reordered tables and the input position of every reordered line
+    b = shapely.bounds(np.asarray(lines_gdf.geometry))
+    line_xy = (b[:, :2] + b[:, 2:]) / 2
+    pt_xy = _point_xy(np.asarray(points_gdf.geometry))
+    both = np.concatenate([line_xy, pt_xy])
+    bounds = None
+    if len(both) and not np.isnan(both).all():
+        bounds = (*np.nanmin(both, axis=0), *np.nanmax(both, axis=0))
+    line_order = spatial_order(line_xy, curve, bounds)
+    pt_order = spatial_order(pt_xy, curve, bounds)
+    return lines_gdf.iloc[line_order], points_gdf.iloc[pt_order], line_order
+
+
+# rough peak bytes per line (geometry objects, endpoint index, bookkeeping) and per point, measured on
+# the benchmark networks, coordinates and the attribute table are counted on top
+LINE_BYTES = 1280
+POINT_BYTES = 256
+
+
+def estimate_working_set(
+    lines_gdf: gpd.GeoDataFrame, points_gdf: typing.Optional[gpd.GeoDataFrame] = None
+) -> int:
+    # rough peak memory of merge_at_points in bytes on top of the inputs, merged lines replace their
+    # members so coordinates are counted twice at most
+    geoms = np.asarray(lines_gdf.geometry)
+    dims = 3 if len(geoms) and shapely.has_z(geoms).any() else 2
+    n_coords = int(shapely.get_num_coordinates(geoms).sum())
+    table = int(lines_gdf.drop(columns=lines_gdf.geometry.name).memory_usage(deep=True).sum())
+    n_points = 0 if points_gdf is None else len(points_gdf)
+    return len(geoms) * LINE_BYTES + 2 * n_coords * dims * 8 + table + n_points * POINT_BYTES
+
+
+def check_memory_budget(needed: int, memory_budget: typing.Optional[int]):
+    if memory_budget is not None and needed > memory_budget:
+        raise MemoryError(
+            f"merge needs about {needed / 2**20:.0f} MiB, over the memory budget of "
+            f"{memory_budget / 2**20:.0f} MiB. Use window_size to merge the input window by window."
+        )
+
+
+def merge_at_points(
+    lines_gdf: gpd.GeoDataFrame,
+    points_gdf: typing.Optional[gpd.GeoDataFrame],
+    tol: float,
+    use_point_id_col: str = None,
+    val_chk_col: typing.Tuple[str, ...] = None,
+    engine: str = "graph",
+    stats: typing.Optional[MergeStats] = None,
+    workers: int = 1,
+    tiles: typing.Optional[int] = None,
+    agg: typing.Optional[typing.Dict[str, str]] = None,
+    errlog: typing.Optional[ErrorLog] = None,
+    metrics: typing.Optional[RunMetrics] = None,
+    matcher: str = "strtree",
+    memory_budget: typing.Optional[int] = None,
+    plan_only: bool = False,
+    spatial_sort: typing.Optional[str] = None,
+    cache_dir: typing.Optional[str] = None,
+    cache_key: typing.Optional[str] = None,
+    line_buffer: typing.Optional[LineBuffer] = None,
+) -> typing.Tuple[gpd.GeoDataFrame, pd.DataFrame]:
+    # points_gdf None derives the joint points from the lines (derive_joint_points), point_id numbers them
+    # matcher picks the endpoint index: "strtree" (shapely), "kdtree" (scipy, optional) or "grid"
+    # (exact cell keys on a precision grid, see _grid_pairs)
+    # pass a MergeStats to read how many merges took the fast, overlay and manual paths
+    # errors are collected per call, pass an ErrorLog to collect them across calls instead
+    # pass a RunMetrics to read per-phase timings, counts and peak memory
+    # workers > 1 runs the graph engine tile by tile (tiles x tiles grid) in a process pool
+    # agg ({column: function}) aggregates the attributes of merged rows, see AGG_FUNCS
+    # memory_budget (bytes) raises MemoryError up front when estimate_working_set is over it
+    # plan_only stops after chain building and returns the plan table of plan_merges instead of lines,
+    # spatial_sort and memory_budget do not apply to it and are ignored with a warning
+    # spatial_sort ("hilbert", "morton") processes lines and points in curve order for memory locality,
+    # row ids and row order of the results still follow the input (only a line end claimed by two points
+    # goes to the first of them in curve order)
+    # cache_dir keeps the endpoint arrays and index of the lines on disk (see endpoint_cache), keyed by
+    # cache_key or, by default, by a fingerprint of the line geometries
+    # line_buffer is a LineBuffer of lines_gdf in row order (see _read_lines), the graph engine merges chains
+    # on it instead of building one from the geometries
+    if engine not in MERGE_ENGINES:
+        raise ValueError(f"engine must be one of {sorted(MERGE_ENGINES)}.")
+    if matcher not in MATCHERS:
+        raise ValueError(f"matcher must be one of {sorted(MATCHERS)}.")
+    if workers > 1 and engine != "graph":
+        raise ValueError("workers > 1 is only supported by the graph engine.")
+    if spatial_sort is not None and spatial_sort not in SPATIAL_CURVES:
+        raise ValueError(f"spatial_sort must be one of {SPATIAL_CURVES}.")
+    agg = check_agg(agg, lines_gdf.columns.drop(lines_gdf.geometry.name))
+    metrics = RunMetrics() if metrics is None else metrics
+    if plan_only:
+        ignored = [
+            k for k, v in (("spatial_sort", spatial_sort), ("memory_budget", memory_budget)) if v is not None
+        ]
+        if ignored:
+            warnings.warn(f"plan_only ignores {', '.join(ignored)}.", stacklevel=2)
+    if memory_budget is not None and not plan_only:
+        needed = estimate_working_set(lines_gdf, points_gdf)
+        metrics.count("estimated_bytes", needed)
+        check_memory_budget(needed, memory_budget)
+    if points_gdf is None:
+        with metrics.phase("derive"):
+            points_gdf = derive_joint_points(lines_gdf, tol)
+        metrics.count("derived_points", len(points_gdf))
+        use_point_id_col = "point_id"
+    if plan_only:
+        return plan_merges(
+            lines_gdf,
+            points_gdf,
+            tol,
+            use_point_id_col,
+            val_chk_col,
+            errlog=errlog,
+            metrics=metrics,
+            matcher=matcher,
+            cache=endpoint_cache(lines_gdf, cache_dir, cache_key, metrics) if cache_dir else None,
+        )
+    rank = None
+    if spatial_sort:
+        pids = points_gdf[use_point_id_col] if use_point_id_col in points_gdf.columns else points_gdf.index
+        with metrics.phase("sort"):
+            lines_gdf, points_gdf, rank = _sort_spatially(lines_gdf, points_gdf, spatial_sort)
+            if line_buffer is not None:
+                line_buffer = line_buffer.take(rank)
+        if cache_key:
+            cache_key = f"{cache_key}-{spatial_sort}"
+    cache = endpoint_cache(lines_gdf, cache_dir, cache_key, metrics) if cache_dir else None
+    stats = MergeStats() if stats is None else stats
+    kwargs = dict(workers=workers, tiles=tiles, buf=line_buffer) if engine == "graph" else {}
+    out_gdf, err_df = MERGE_ENGINES[engine](
+        lines_gdf,
+        points_gdf,
+        tol,
+        use_point_id_col=use_point_id_col,
+        val_chk_col=val_chk_col,
+        stats=stats,
+        agg=agg,
+        errlog=errlog,
+        metrics=metrics,
+        matcher=matcher,
+        rank=rank,
+        cache=cache,
+        **kwargs,
     )
-    out_gdf.to_file(Param.out_lines_path, driver="GPKG")
+    if rank is not None:
+        # error line ids back to input positions, errors in input point order
+        err_df["line_ids"] = [v if v is None else [int(rank[k]) for k in v] for v in err_df["line_ids"]]
+        pos = {}
+        for i, pid in enumerate(pids.tolist()):
+            pos.setdefault(pid, i)
+        err_df = err_df.iloc[
+            np.argsort([pos.get(pid, len(pos)) for pid in err_df["point_id"]], kind="stable")
+        ]
+        err_df = err_df.reset_index(drop=True)
+    print(f"[INFO] merge paths: {stats}")
+    return out_gdf, err_df
+
+
+STATE_VERSION = 1
+
+
+def _relabel_positions(
+    out_gdf: pd.DataFrame, err_df: pd.DataFrame, line_ids: list, column: str = "merged_from"
+):
+    # column (merged_from, or line_ids of a plan) and error line_ids hold row positions of the merged input,
+    # swap them for stable line ids
+    out_gdf = out_gdf.copy()
+    out_gdf[column] = [
+        v if v is None or pd.isna(v) else ",".join(str(line_ids[int(k)]) for k in v.split(","))
+        for v in out_gdf[column]
+    ]
+    err_df = err_df.copy()
+    err_df["line_ids"] = [v if v is None else [line_ids[k] for k in v] for v in err_df["line_ids"]]
+    return out_gdf, err_df
+
+
+def build_merge_state(
+    out_gdf: gpd.GeoDataFrame,
+    err_df: pd.DataFrame,
+    lines_gdf: gpd.GeoDataFrame,
+    tol: float,
+    line_id_col: str,
+    point_id_col: str,
+    val_chk_col: typing.Tuple[str, ...] = tuple(),
+    agg: typing.Optional[typing.Dict[str, str]] = None,
+) -> dict:
+    # chain membership of every output row (same order) keyed to input line and point ids
+    # expects the raw merge_at_points output, merged_from as row positions of lines_gdf
+    if not line_id_col or not point_id_col:
+        raise ValueError("merge state needs stable ids, set line_id_col and point_id_col.")
+    line_ids = lines_gdf[line_id_col].tolist()
+    chains = []
+    for merged_from, points, own in zip(
+        out_gdf["merged_from"], out_gdf["merge_point_id"], out_gdf[line_id_col]
+    ):
+        if merged_from is None or pd.isna(merged_from):
+            chains.append({"lines": [_json_id(own)], "points": []})
+        else:
+            chains.append(
+                {
+                    "lines": [_json_id(line_ids[int(k)]) for k in merged_from.split(",")],
+                    "points": points.split(","),
+                }
+            )
+    errors = [
+        {
+            "point_id": str(pid),
+            "count": int(count),
+            "line_ids": None if ids is None else [_json_id(line_ids[k]) for k in ids],
+            "issue": issue,
+        }
+        for pid, count, ids, issue in zip(
+            err_df["point_id"], err_df["count"], err_df["line_ids"], err_df["issue"]
+        )
+    ]
+    return {
+        "version": STATE_VERSION,
+        "tol": tol,
+        "line_id_col": line_id_col,
+        "point_id_col": point_id_col,
+        "val_chk_col": list(val_chk_col or ()),
+        "agg": dict(agg or {}),
+        "chains": chains,
+        "errors": errors,
+    }
+
+
+def _json_id(v):
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def save_merge_state(state: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+def load_merge_state(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("version") != STATE_VERSION:
+        raise ValueError(f"unsupported merge state version {state.get('version')}.")
+    return state
+
+
+def remerge_incremental(
+    prev_out: gpd.GeoDataFrame,
+    state: dict,
+    lines_gdf: gpd.GeoDataFrame,
+    points_gdf: gpd.GeoDataFrame,
+    changed_line_ids: typing.Iterable,
+    changed_point_ids: typing.Iterable,
+    engine: str = "graph",
+) -> typing.Tuple[gpd.GeoDataFrame, pd.DataFrame, dict]:
+    # recompute only the chains a changed feature set can reach and patch the previous output
+    # prev_out rows and state chains must be in the same order (as written by run with a state path)
+    # changed ids cover inserted, edited and deleted features, ids are compared as strings
+    tol, line_id_col, point_id_col = state["tol"], state["line_id_col"], state["point_id_col"]
+    val_chk_col = tuple(state["val_chk_col"])
+    agg = state.get("agg") or None
+    line_ids = lines_gdf[line_id_col].tolist()
+    line_pos = {str(v): k for k, v in enumerate(line_ids)}
+    pt_ids = [str(v) for v in points_gdf[point_id_col]]
+    pt_pos = {v: k for k, v in enumerate(pt_ids)}
+    chain_of_line = {str(v): c for c, ch in enumerate(state["chains"]) for v in ch["lines"]}
+    chain_of_point = {str(v): c for c, ch in enumerate(state["chains"]) for v in ch["points"]}
+    changed_lines = {str(v) for v in changed_line_ids}
+    changed_points = {str(v) for v in changed_point_ids}
+
+    ends = endpoint_arrays(lines_gdf.geometry)
+    end_tree = shapely.STRtree(shapely.points(ends[0]))
+    pt_xy = _point_xy(np.asarray(points_gdf.geometry))
+    pt_tree = shapely.STRtree(shapely.points(pt_xy))
+
+    # closure: affected lines R, points P near their ends, context lines C only counted at P
+    dirty = {chain_of_line[v] for v in changed_lines if v in chain_of_line}
+    dirty |= {chain_of_point[v] for v in changed_points if v in chain_of_point}
+    R, P, C = set(), set(), set()
+    new_lines = {line_pos[v] for v in changed_lines if v in line_pos}
+    new_points = {pt_pos[v] for v in changed_points if v in pt_pos}
+    # deleted lines have no ends left to search from: use the ends of their previous output rows and
+    # the points of errors that listed them
+    deleted = {chain_of_line[v] for v in changed_lines if v not in line_pos and v in chain_of_line}
+    if deleted:
+        old_ends = endpoint_arrays(prev_out.geometry.iloc[sorted(deleted)])[0]
+        _, found = pt_tree.query(shapely.points(old_ends), predicate="dwithin", distance=tol)
+        new_points |= set(found.tolist())
+    new_points |= {
+        pt_pos[e["point_id"]]
+        for e in state["errors"]
+        if e["point_id"] in pt_pos and changed_lines & {str(v) for v in e["line_ids"] or ()}
+    }
+    new_chains = set(dirty)
+    while new_lines or new_points or new_chains:
+        for c in new_chains:
+            new_lines |= {line_pos[str(v)] for v in state["chains"][c]["lines"] if str(v) in line_pos}
+        new_chains = set()
+        new_lines -= R
+        R |= new_lines
+        if new_lines:
+            near = np.isin(ends[1], list(new_lines))
+            _, found = pt_tree.query(shapely.points(ends[0][near]), predicate="dwithin", distance=tol)
+            new_points |= set(found.tolist())
+        new_points -= P
+        P |= new_points
+        new_lines = set()
+        if new_points:
+            q = np.fromiter(new_points, dtype=np.int64)
+            pt_i, e_i = end_tree.query(shapely.points(pt_xy[q]), predicate="dwithin", distance=tol)
+            hit_pt, hit_line, _ = _nearest_ends(pt_i, e_i, ends, pt_xy[q])
+            for p in range(len(q)):
+                at = hit_line[hit_pt == p].tolist()
+                C.update(at)
+                if len(at) == 2:
+                    new_lines.update(at)
+                    new_chains |= {
+                        chain_of_line[str(line_ids[k])] for k in at if str(line_ids[k]) in chain_of_line
+                    }
+            for p in q:
+                if pt_ids[p] in chain_of_point:
+                    new_chains.add(chain_of_point[pt_ids[p]])
+        new_points = set()
+        new_chains -= dirty
+        dirty |= new_chains
+    dirty |= {chain_of_line[str(line_ids[k])] for k in R if str(line_ids[k]) in chain_of_line}
+
+    # recompute the affected part
+    sub_pos = sorted(R | C)
+    sub_lines = lines_gdf.iloc[sub_pos]
+    sub_points = points_gdf.iloc[sorted(P)]
+    if len(sub_lines) and len(sub_points):
+        sub_out, sub_err = merge_at_points(
+            sub_lines,
+            sub_points,
+            tol,
+            use_point_id_col=point_id_col,
+            val_chk_col=val_chk_col,
+            engine=engine,
+            agg=agg,
+        )
+    else:
+        sub_out = sub_lines.reset_index(drop=True)
+        sub_out = sub_out.assign(merged_from=None, merge_point_id=None, merged_count=pd.NA)
+        sub_err = pd.DataFrame(columns=["point_id", "count", "line_ids", "issue", "geometry"])
+    sub_state = build_merge_state(
+        sub_out, sub_err, sub_lines, tol, line_id_col, point_id_col, val_chk_col, agg
+    )
+    sub_out, _ = _relabel_positions(sub_out, sub_err, sub_lines[line_id_col].tolist())
+    context_only = {str(line_ids[k]) for k in C - R}
+    keep_new = [
+        i
+        for i, ch in enumerate(sub_state["chains"])
+        if not (len(ch["lines"]) == 1 and str(ch["lines"][0]) in context_only)
+    ]
+
+    # patch
+    keep_old = [c for c in range(len(state["chains"])) if c not in dirty]
+    out = pd.concat([prev_out.iloc[keep_old], sub_out.iloc[keep_new]], ignore_index=True)
+    out = gpd.GeoDataFrame(out, geometry=prev_out.geometry.name, crs=prev_out.crs)
+    touched_points = {pt_ids[p] for p in P} | changed_points
+    errors = [e for e in state["errors"] if e["point_id"] not in touched_points] + sub_state["errors"]
+    new_state = dict(
+        state,
+        chains=[state["chains"][c] for c in keep_old] + [sub_state["chains"][i] for i in keep_new],
+        errors=errors,
+    )
+    pt_geom = dict(zip(pt_ids, points_gdf.geometry))
+    err_df = pd.DataFrame(
+        [dict(e, geometry=pt_geom.get(e["point_id"])) for e in errors],
+        columns=["point_id", "count", "line_ids", "issue", "geometry"],
+    )
+    print(
+        f"[INFO] incremental: recomputed {len(dirty)} chains from {len(R)} lines and {len(P)} points, "
+        f"{len(out)} lines, {len(err_df)} errors."
+    )
+    return out, err_df, new_state
+
+
+def run_incremental(Param: Param, changed_line_ids: typing.Iterable, changed_point_ids: typing.Iterable):
+    # patch Param.out_lines_path / out_errors_path / state_path in place after an edit of the inputs
+    if not Param.state_path or not Param.points_path:
+        raise ValueError("incremental mode needs state_path and points_path.")
+    state = load_merge_state(Param.state_path)
+    lines = _read_layer(Param.lines_path)
+    points = _read_layer(Param.points_path)
+    validate_inputs(lines, points, state["tol"], state["point_id_col"], tuple(state["val_chk_col"]))
+    prev_out = _read_layer(Param.out_lines_path)
+    if len(prev_out) != len(state["chains"]):
+        raise ValueError("previous output does not match the merge state.")
+    out_gdf, err_df, state = remerge_incremental(
+        prev_out, state, lines, points, changed_line_ids, changed_point_ids, engine=Param.engine
+    )
+    _write_layer(out_gdf, Param.out_lines_path)
+    _write_errors(err_df, Param.out_errors_path, points.crs)
+    save_merge_state(state, Param.state_path)
+    print(f"[Done] Result patched: {Param.out_lines_path}")
+
+
+PARQUET_EXTS = (".parquet", ".geoparquet")
+# with pyarrow (optional extra "arrow") GPKG / SHP go through pyogrio's Arrow path
+HAS_ARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+def _is_parquet(path: str) -> bool:
+    return os.path.splitext(str(path))[1].lower() in PARQUET_EXTS
+
+
+def _read_layer(path: str, **kwargs) -> gpd.GeoDataFrame:
+    # GeoParquet by file extension, anything else through pyogrio, in bulk as Arrow when available
+    if _is_parquet(path):
+        return gpd.read_parquet(path, **kwargs)
+    return gpd.read_file(path, engine="pyogrio", use_arrow=HAS_ARROW, **kwargs)
+
+
+def _read_lines(path: str) -> typing.Tuple[gpd.GeoDataFrame, typing.Optional[LineBuffer]]:
+    # lines layer plus, for GeoParquet written with geometry_encoding="geoarrow", a LineBuffer straight from
+    # the Arrow coordinates of its geometry column (None otherwise, the graph engine builds one)
+    if HAS_ARROW and _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        geo = json.loads((pq.read_schema(path).metadata or {}).get(b"geo", b"{}"))
+        col = geo.get("primary_column")
+        if geo.get("columns", {}).get(col, {}).get("encoding") == "linestring":
+            table = pq.read_table(path)
+            return gpd.GeoDataFrame.from_arrow(table, geometry=col), LineBuffer.from_arrow(table[col])
+    return _read_layer(path), None
+
+
+def _write_layer(gdf: gpd.GeoDataFrame, path: str, mode: str = "w"):
+    # GeoParquet by file extension, anything else as GPKG
+    if _is_parquet(path):
+        if mode != "w":
+            raise ValueError("GeoParquet output can not be appended.")
+        gdf.to_parquet(path, index=False)
+    else:
+        gdf.to_file(path, driver="GPKG", mode=mode, engine="pyogrio", use_arrow=HAS_ARROW)
+
+
+def _write_table(df: pd.DataFrame, path: str):
+    # attribute-only table, GeoParquet paths get plain Parquet, anything else an OGR table (GPKG, CSV, ...)
+    if _is_parquet(path):
+        df.to_parquet(path, index=False)
+    else:
+        pyogrio.write_dataframe(df, path)
+
+
+def _write_errors(err_df: pd.DataFrame, path: str, crs):
     if len(err_df) > 0:
-        gpd.GeoDataFrame(err_df, geometry="geometry", crs=points.crs).to_file(
-            Param.out_errors_path, driver="GPKG"
+        err_df = err_df.assign(
+            line_ids=[None if v is None else ",".join(map(str, v)) for v in err_df["line_ids"]]
         )
+        _write_layer(gpd.GeoDataFrame(err_df, geometry="geometry", crs=crs), path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+MERGE_COLUMNS = ("merged_from", "merge_point_id", "merged_count")
+
+
+def _window_index(x, y, origin: typing.Tuple[float, float], size: float, nx: int, ny: int):
+    # row-major index of the window holding (x, y), clipped to the grid
+    ix = np.clip(np.floor((np.asarray(x) - origin[0]) / size).astype(np.int64), 0, nx - 1)
+    iy = np.clip(np.floor((np.asarray(y) - origin[1]) / size).astype(np.int64), 0, ny - 1)
+    return iy * nx + ix
+
+
+def _append_layer(gdf: gpd.GeoDataFrame, path: str, first: bool):
+    _write_layer(gdf, path, mode="w" if first else "a")
+
+
+def run_windowed(Param: Param, metrics: typing.Optional[RunMetrics] = None) -> RunMetrics:
+    # out-of-core mode: read both layers in window_size squares (lines with a tol halo), merge and
+    # append finished lines to the output. A line is kept in memory only until the last window its
+    # tol-expanded bbox touches has been read, chains are carried across windows until all members are done.
+    # Joints are accepted in window order, line and point ids are line_id_col / point_id_col values, or the
+    # layer FIDs where those are not set.
+    errlog = ErrorLog()
+    tol, size = Param.tol, Param.window_size
+    if not size or size <= 0:
+        raise ValueError("window_size must be a positive number.")
+    if not Param.points_path:
+        raise ValueError("window_size needs a points layer.")
+    if any(_is_parquet(p) for p in (Param.lines_path, Param.points_path, Param.out_lines_path)):
+        raise ValueError(
+            "window_size needs OGR layers (GPKG, SHP), GeoParquet is not supported in this mode."
+        )
+    sample = _read_layer(Param.lines_path, max_features=1)
+    validate_inputs(
+        sample,
+        _read_layer(Param.points_path, max_features=1),
+        tol,
+        Param.point_id_col,
+        Param.val_chk_col,
+    )
+    if Param.line_id_col and Param.line_id_col not in sample.columns:
+        raise ValueError(f"line_id_col '{Param.line_id_col}' not found in lines_gdf columns.")
+    agg = check_agg(Param.agg, sample.columns.drop(sample.geometry.name))
+    if Param.matcher not in MATCHERS:
+        raise ValueError(f"matcher must be one of {sorted(MATCHERS)}.")
+    lb = pyogrio.read_info(Param.lines_path, force_total_bounds=True)["total_bounds"]
+    pb = pyogrio.read_info(Param.points_path, force_total_bounds=True)["total_bounds"]
+    origin = (min(lb[0], pb[0]), min(lb[1], pb[1]))
+    nx = max(1, math.ceil((max(lb[2], pb[2]) - origin[0]) / size))
+    ny = max(1, math.ceil((max(lb[3], pb[3]) - origin[1]) / size))
+
+    cache = {}  # fid -> (geometry, attribute row, last window)
+    line_key = {}  # fid -> val_chk_col key, keys are shared by all windows through key_of
+    key_of = {}
+    graph = _JointGraph()
+    stats = MergeStats()
+    metrics = RunMetrics() if metrics is None else metrics
+    seen = set()  # fingerprints of the merged lines written so far
+    crs = None
+    first = True
+    n_out = merge_count = 0
+    same_values = None
+    if Param.val_chk_col:
+        same_values = lambda a, b: line_key[a] == line_key[b]
+    labelled = 0  # errors before this position already hold line_id_col values
+
+    def line_label(fid):
+        return cache[fid][1][Param.line_id_col] if Param.line_id_col else fid
+
+    def label_errors():
+        # errors are logged with FIDs, swap them while their lines are still cached
+        nonlocal labelled
+        if Param.line_id_col:
+            errlog.relabel(labelled, lambda fid: [line_label(fid)])
+        labelled = len(errlog)
+
+    def out_row(fid, geom, members=None, joint_ids=None):
+        row = dict(cache[fid][1])
+        merged = members is not None
+        row["merged_from"] = ",".join(str(line_label(m)) for m in members) if merged else None
+        row["merge_point_id"] = ",".join(str(graph.joints[j][0]) for j in joint_ids) if merged else None
+        row["merged_count"] = len(joint_ids) if merged else None
+        row["geometry"] = geom
+        return row
+
+    for w in range(nx * ny):
+        iy, ix = divmod(w, nx)
+        wx0, wy0 = origin[0] + ix * size, origin[1] + iy * size
+        with metrics.phase("read"):
+            lines = _read_layer(
+                Param.lines_path,
+                bbox=(wx0 - tol, wy0 - tol, wx0 + size + tol, wy0 + size + tol),
+                fid_as_index=True,
+            )
+        if len(lines):
+            crs = lines.crs if crs is None else crs
+            b = lines.geometry.bounds
+            last = _window_index(b["maxx"] + tol, b["maxy"] + tol, origin, size, nx, ny)
+            # lines finished in an earlier window can not reach this one
+            lines = lines[last >= w]
+            attrs = lines.drop(columns=lines.geometry.name)
+            for fid, geom, row, lw in zip(
+                lines.index, lines.geometry, attrs.to_dict("records"), last[last >= w]
+            ):
+                if fid not in cache:
+                    cache[fid] = (geom, row, lw)
+            if Param.val_chk_col:
+                cols = list(Param.val_chk_col)
+                missing = attrs[cols].isna().any(axis=1)
+                for fid, values, miss in zip(
+                    lines.index, attrs[cols].itertuples(index=False, name=None), missing
+                ):
+                    if fid not in line_key:
+                        line_key[fid] = -1 - fid if miss else key_of.setdefault(values, len(key_of))
+
+        # points belong to the window they fall in
+        with metrics.phase("read"):
+            points = _read_layer(
+                Param.points_path, bbox=(wx0, wy0, wx0 + size, wy0 + size), fid_as_index=True
+            )
+        points = points[_window_index(points.geometry.x, points.geometry.y, origin, size, nx, ny) == w]
+        if len(points) and len(lines):
+            fids = lines.index.to_numpy()
+            pt_geoms = np.asarray(points.geometry)
+            if Param.point_id_col:
+                pids = points[Param.point_id_col].tolist()
+            else:
+                pids = points.index.tolist()
+            with metrics.phase("endpoints"):
+                ends = endpoint_arrays(lines.geometry)
+            hits = _match_endpoints(ends, _point_xy(pt_geoms), tol, metrics, Param.matcher)
+            with metrics.phase("graph"):
+                for p, line_pos, end_slots in _iter_point_hits(*hits, len(pids)):
+                    if pids[p] not in errlog:
+                        line_ids = [fids[k].item() for k in line_pos]
+                        _add_joint(
+                            graph,
+                            errlog,
+                            pids[p],
+                            pt_geoms[p],
+                            line_ids,
+                            end_slots,
+                            same_values,
+                            Param.val_chk_col,
+                        )
+                label_errors()
+
+        # flush every line and chain that no later window can change
+        rows = []
+        agg_rows, agg_members = [], []
+        for fid in [f for f, (_, _, lw) in cache.items() if lw <= w]:
+            if fid not in cache:
+                continue
+            if fid not in graph.links:
+                rows.append(out_row(fid, cache[fid][0]))
+                del cache[fid]
+                line_key.pop(fid, None)
+                continue
+            members, joint_ids = graph.chain_of(fid, errlog)
+            if any(cache[m][2] > w for m in members):
+                continue
+            geoms = [cache[m][0] for m in members]
+            joints = [graph.joints[j] for j in joint_ids]
+            with metrics.phase("merge"):
+                (pieces,) = _merge_chains([(members, joint_ids, geoms, joints)], tol, stats, errlog)
+            label_errors()
+            in_piece = set()
+            for part_members, part_joints, geom in pieces:
+                in_piece.update(part_members)
+                merge_count += len(part_joints)
+                # drop duplicates
+                key = geometry_fingerprint(geom)
+                if key in seen:
+                    continue
+                seen.add(key)
+                if agg:
+                    agg_rows.append(len(rows))
+                    agg_members.append([cache[m] for m in sorted(part_members)])
+                rows.append(out_row(min(part_members), geom, part_members, part_joints))
+            rows.extend(out_row(m, cache[m][0]) for m in members if m not in in_piece)
+            for m in members:
+                del cache[m]
+                line_key.pop(m, None)
+                del graph.links[m]
+            for j in joint_ids:
+                graph.joints[j] = None
+        if agg_rows:
+            # aggregate all chains finished in this window at once
+            with metrics.phase("materialize"):
+                flat = [m for members in agg_members for m in members]
+                values = aggregate_chains(
+                    pd.DataFrame([row for _, row, _ in flat]),
+                    shapely.length(np.asarray([g for g, _, _ in flat], dtype=object)),
+                    np.repeat(np.arange(len(agg_members)), [len(members) for members in agg_members]),
+                    agg,
+                )
+                for k, vals in zip(agg_rows, values.to_dict("records")):
+                    rows[k].update(vals)
+        if rows:
+            with metrics.phase("write"):
+                out = gpd.GeoDataFrame(rows, geometry="geometry", crs=crs)
+                out["merged_count"] = out["merged_count"].astype("Int64")
+                _append_layer(out, Param.out_lines_path, first)
+            first = False
+            n_out += len(rows)
+        metrics.iteration(window=w, written=len(rows), carried=len(cache), errors=len(errlog))
+        print(f"[INFO] window {w + 1}/{nx * ny}: wrote {len(rows)} lines, {len(cache)} carried over")
+
+    with metrics.phase("write"):
+        _write_errors(errlog.to_frame(), Param.out_errors_path, crs)
+    metrics.count("windows", nx * ny)
+    metrics.count("merges", merge_count)
+    metrics.count("errors", len(errlog))
+    metrics.count("out_lines", n_out)
+    _write_metrics(Param, metrics)
+    print(f"[INFO] merge paths: {stats}")
+    print(f"[Done] {n_out} lines ({merge_count} merges) saved: {Param.out_lines_path}", end=". ")
+    if len(errlog) > 0:
+        print(f"ErrorPoint  {Param.out_errors_path}")
+    return metrics
+
+
+def _estimate_layers(lines_path: str, points_path: typing.Optional[str], sample: int = 1000) -> int:
+    # estimate_working_set from the feature counts and the first sample lines, without reading the layers
+    n_lines = pyogrio.read_info(lines_path)["features"]
+    n_points = pyogrio.read_info(points_path)["features"] if points_path else 0
+    head = _read_layer(lines_path, max_features=max(1, min(n_lines, sample)))
+    per_line = (estimate_working_set(head) / len(head)) if len(head) else 0
+    return int(per_line * n_lines + n_points * POINT_BYTES)
+
+
+def _budget_window_size(Param: Param) -> typing.Optional[float]:
+    # window size that keeps a windowed run within Param.memory_budget, None when a full run fits
+    # where windows are not possible (GeoParquet, no points layer, merge state) the budget is left to
+    # merge_at_points, which fails fast after reading
+    if not Param.points_path or Param.state_path:
+        return None
+    if any(_is_parquet(p) for p in (Param.lines_path, Param.points_path, Param.out_lines_path)):
+        return None
+    needed = _estimate_layers(Param.lines_path, Param.points_path)
+    if needed <= Param.memory_budget:
+        return None
+    # windowed output is only the same as a full run's with stable ids, not row positions vs FIDs
+    if not Param.line_id_col or not Param.point_id_col:
+        raise MemoryError(
+            f"merge needs about {needed / 2**20:.0f} MiB, over the memory budget of "
+            f"{Param.memory_budget / 2**20:.0f} MiB. Set line_id_col and point_id_col to merge the input "
+            "window by window."
+        )
+    lb = pyogrio.read_info(Param.lines_path, force_total_bounds=True)["total_bounds"]
+    pb = pyogrio.read_info(Param.points_path, force_total_bounds=True)["total_bounds"]
+    area = (max(lb[2], pb[2]) - min(lb[0], pb[0])) * (max(lb[3], pb[3]) - min(lb[1], pb[1]))
+    # lines are held until their last window is read, so aim at half the budget per window
+    n_windows = math.ceil(2 * needed / Param.memory_budget)
+    return max(math.sqrt(area / n_windows), 4 * Param.tol)
+
+
+def _write_metrics(Param: Param, metrics: RunMetrics):
+    if Param.metrics_path:
+        metrics.to_json(Param.metrics_path)
+    if Param.prometheus_path:
+        metrics.to_prometheus(Param.prometheus_path)
+
+
+def run_plan(Param: Param, metrics: typing.Optional[RunMetrics] = None) -> RunMetrics:
+    # plan only: writes the plan table of plan_merges to out_lines_path and the predicted errors
+    metrics = RunMetrics() if metrics is None else metrics
+    if Param.window_size:
+        raise ValueError("plan_only is not supported with window_size.")
+    with metrics.phase("read"):
+        lines = _read_layer(Param.lines_path)
+        points = _read_layer(Param.points_path) if Param.points_path else None
+    with metrics.phase("validate"):
+        validate_inputs(lines, points, Param.tol, Param.point_id_col, Param.val_chk_col)
+    if Param.line_id_col and Param.line_id_col not in lines.columns:
+        raise ValueError(f"line_id_col '{Param.line_id_col}' not found in lines_gdf columns.")
+    plan, err_df = merge_at_points(
+        lines,
+        points,
+        Param.tol,
+        use_point_id_col=Param.point_id_col,
+        val_chk_col=Param.val_chk_col,
+        metrics=metrics,
+        matcher=Param.matcher,
+        memory_budget=Param.memory_budget,
+        plan_only=True,
+        spatial_sort=Param.spatial_sort,
+        cache_dir=Param.cache_dir,
+        cache_key=file_fingerprint(Param.lines_path) if Param.cache_dir else None,
+    )
+    if Param.line_id_col:
+        plan, err_df = _relabel_positions(plan, err_df, lines[Param.line_id_col].tolist(), "line_ids")
+    with metrics.phase("write"):
+        _write_table(plan, Param.out_lines_path)
+        _write_errors(err_df, Param.out_errors_path, lines.crs)
+    metrics.count("lines", len(lines))
+    _write_metrics(Param, metrics)
+    print(f"[Done] Plan saved: {Param.out_lines_path}")
+    return metrics
+
+
+def run(Param: Param, metrics: typing.Optional[RunMetrics] = None) -> RunMetrics:
+    # returns the RunMetrics of the run, also written to Param.metrics_path / prometheus_path if set
+    metrics = RunMetrics() if metrics is None else metrics
+    if Param.plan_only:
+        return run_plan(Param, metrics)
+    if Param.memory_budget is not None and not Param.window_size:
+        window_size = _budget_window_size(Param)
+        if window_size:
+            print(f"[INFO] input over the memory budget, merging in windows of {window_size:.1f}")
+            Param = replace(Param, window_size=window_size)
+    if Param.window_size:
+        return run_windowed(Param, metrics)
+    with metrics.phase("read"):
+        lines, line_buffer = _read_lines(Param.lines_path)
+        points = _read_layer(Param.points_path) if Param.points_path else None
+
+    with metrics.phase("validate"):
+        validate_inputs(lines, points, Param.tol, Param.point_id_col, Param.val_chk_col)
+    if Param.line_id_col and Param.line_id_col not in lines.columns:
+        raise ValueError(f"line_id_col '{Param.line_id_col}' not found in lines_gdf columns.")
+    if Param.state_path and points is None:
+        raise ValueError("merge state needs a points layer with stable ids.")
+    out_gdf, err_df = merge_at_points(
+        lines,
+        points,
+        Param.tol,
+        use_point_id_col=Param.point_id_col,
+        val_chk_col=Param.val_chk_col,
+        engine=Param.engine,
+        workers=Param.workers,
+        tiles=Param.tiles,
+        agg=Param.agg,
+        metrics=metrics,
+        matcher=Param.matcher,
+        memory_budget=Param.memory_budget,
+        spatial_sort=Param.spatial_sort,
+        cache_dir=Param.cache_dir,
+        cache_key=file_fingerprint(Param.lines_path) if Param.cache_dir else None,
+        line_buffer=line_buffer,
+    )
+    if Param.state_path:
+        state = build_merge_state(
+            out_gdf,
+            err_df,
+            lines,
+            Param.tol,
+            Param.line_id_col,
+            Param.point_id_col,
+            Param.val_chk_col,
+            Param.agg,
+        )
+        save_merge_state(state, Param.state_path)
+    if Param.line_id_col:
+        out_gdf, err_df = _relabel_positions(out_gdf, err_df, lines[Param.line_id_col].tolist())
+    with metrics.phase("write"):
+        _write_layer(out_gdf, Param.out_lines_path)
+        _write_errors(err_df, Param.out_errors_path, lines.crs)
+    metrics.count("lines", len(lines))
+    if points is not None:
+        metrics.count("points", len(points))
+    metrics.count("out_lines", len(out_gdf))
+    _write_metrics(Param, metrics)
     print(f"[Done] Result saved: {Param.out_lines_path}", end=". ")
     if len(err_df) > 0:
         print(f"ErrorPoint  {Param.out_errors_path}")
+    return metrics
+
+
+def run_job(spec: dict) -> dict:
+    # one job of serve: Param fields plus optional id, incremental, changed_lines and changed_points
+    # returns the response, ok with the run metrics or the error of a failed job, which is never raised
+    spec = dict(spec)
+    job_id = spec.pop("id", None)
+    incremental = spec.pop("incremental", False)
+    changed = (spec.pop("changed_lines", ()), spec.pop("changed_points", ()))
+    try:
+        unknown = set(spec) - {f.name for f in fields(Param)}
+        if unknown:
+            raise ValueError(f"unknown job keys: {', '.join(sorted(unknown))}")
+        if spec.get("val_chk_col"):
+            spec["val_chk_col"] = tuple(spec["val_chk_col"])
+        param = Param(**spec)
+        metrics = None
+        if incremental:
+            run_incremental(param, *changed)
+        else:
+            metrics = run(param).to_dict()
+    except Exception as e:
+        return {"id": job_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+    return {"id": job_id, "ok": True, "metrics": metrics}
+
+
+def _warm_up():
+    # load the lazily imported modules before the first job, so no job pays the import
+    for module in (np, pd, gpd, pyproj, pyogrio, shapely):
+        getattr(module, "__version__", None)
+    importlib.import_module("shapely.ops")
+
+
+def serve(infile: typing.TextIO, outfile: typing.TextIO):
+    # warm worker: one JSON job spec per input line (see run_job), one JSON response line per job, until EOF
+    # jobs print to stderr so that outfile only carries responses
+    _warm_up()
+    for line in infile:
+        if not line.strip():
+            continue
+        try:
+            spec = json.loads(line)
+        except json.JSONDecodeError as e:
+            spec = None
+            response = {"id": None, "ok": False, "error": f"invalid job spec: {e}"}
+        if isinstance(spec, dict):
+            with contextlib.redirect_stdout(sys.stderr):
+                response = run_job(spec)
+        elif spec is not None:
+            response = {"id": None, "ok": False, "error": "invalid job spec: expected a JSON object"}
+        outfile.write(json.dumps(response, default=str) + "\n")
+        outfile.flush()
+
+
+def serve_socket(path: str):
+    # serve on a local (Unix domain) socket, one client connection at a time, jobs run in this process
+    if not hasattr(socket, "AF_UNIX"):
+        raise ValueError("local sockets are not supported on this platform, serve on stdin instead.")
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.unlink(path)  # left behind by a killed worker
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as srv:
+        srv.bind(path)
+        srv.listen()
+        _warm_up()
+        try:
+            while True:
+                conn, _ = srv.accept()
+                with (
+                    conn,
+                    conn.makefile("r", encoding="utf-8") as rf,
+                    conn.makefile("w", encoding="utf-8") as wf,
+                ):
+                    serve(rf, wf)
+        finally:
+            os.unlink(path)
+
+
+def _parse_flag(v: str) -> bool:
+    return v.strip().lower() in ("1", "true", "yes")
+
+
+def _parse_agg(v: str) -> typing.Dict[str, str]:
+    return dict(a.partition("=")[::2] for a in v.split())
+
+
+# CSV manifest cells are text, these columns are converted, empty cells are None
+MANIFEST_TYPES = {
+    "tol": float,
+    "window_size": float,
+    "workers": int,
+    "tiles": int,
+    "memory_budget": lambda v: _parse_bytes(v),
+    "plan_only": _parse_flag,
+    "incremental": _parse_flag,
+    "val_chk_col": str.split,
+    "changed_lines": str.split,
+    "changed_points": str.split,
+    "agg": _parse_agg,
+}
+
+
+def read_manifest(path: str) -> typing.List[dict]:
+    # batch jobs (run_job specs): a JSON list of objects, or a CSV with one job per row and a column per key,
+    # val_chk_col and changed ids space separated, agg as space separated COL=FUNC pairs
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            jobs = json.load(f)
+        if not isinstance(jobs, list) or not all(isinstance(j, dict) for j in jobs):
+            raise ValueError("JSON manifest must be a list of job objects.")
+        return jobs
+    jobs = []
+    required = {f.name for f in fields(Param) if f.default is MISSING and f.default_factory is MISSING}
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for n, row in enumerate(csv.DictReader(f), start=1):
+            job = {}
+            for k, v in row.items():
+                v = v.strip() if v else ""
+                if not v:
+                    # blank cells keep the Param defaults, fields without one (points_path) get None
+                    if k in required:
+                        job[k] = None
+                    continue
+                try:
+                    job[k] = MANIFEST_TYPES.get(k, str)(v)
+                except (ValueError, argparse.ArgumentTypeError) as e:
+                    raise ValueError(f"manifest row {n}, column {k}: {e}")
+            jobs.append(job)
+    return jobs
+
+
+BATCH_COLUMNS = (
+    "id",
+    "lines_path",
+    "ok",
+    "error",
+    "wall_seconds",
+    "read_seconds",
+    "merge_seconds",
+    "write_seconds",
+    "lines",
+    "out_lines",
+    "merges",
+    "errors",
+)
+
+
+def _summary_row(job: dict, response: dict) -> dict:
+    metrics = response.get("metrics") or {}
+    phases, counts = metrics.get("phases", {}), metrics.get("counts", {})
+    return {
+        "id": response["id"],
+        "lines_path": job.get("lines_path"),
+        "ok": response["ok"],
+        "error": response.get("error"),
+        "wall_seconds": metrics.get("wall_seconds"),
+        "read_seconds": phases.get("read"),
+        "merge_seconds": phases.get("merge"),
+        "write_seconds": phases.get("write"),
+        "lines": counts.get("lines"),
+        "out_lines": counts.get("out_lines"),
+        "merges": counts.get("merges"),
+        "errors": counts.get("errors"),
+    }
+
+
+def run_batch(
+    jobs: typing.List[dict], summary_path: typing.Optional[str] = None, workers: int = 1
+) -> pd.DataFrame:
+    # every job (run_job spec, id defaults to its position) on a pool of warm worker processes, each loads
+    # the libraries once, workers 1 runs them in this process. one summary row per job in job order,
+    # failed jobs included, also written to summary_path (CSV, GPKG or Parquet table) if set
+    jobs = [dict(j, id=j.get("id", n)) for n, j in enumerate(jobs)]
+    _warm_up()  # forked workers start with the libraries loaded
+    if workers > 1 and len(jobs) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_warm_up) as pool:
+            responses = list(pool.map(run_job, jobs))
+    else:
+        responses = [run_job(j) for j in jobs]
+    summary = pd.DataFrame([_summary_row(j, r) for j, r in zip(jobs, responses)], columns=list(BATCH_COLUMNS))
+    if summary_path:
+        _write_table(summary, summary_path)
+    return summary
 
 
 def _parse_args():
@@ -326,12 +2738,17 @@ def _parse_args():
         ),
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
-    p.add_argument("--lines", required=True, help="Line layer to be merged (GPKG or SHP)")
-    p.add_argument("--points", required=True, help="Point layer to merge at (GPKG or SHP)")
-    p.add_argument("--out", required=True, help="Merged output as LineString (GPKG or SHP)")
-    p.add_argument("--out-errors", required=True, help="Error log output as Point (GPKG or SHP)")
+    p.add_argument("--lines", help="Line layer to be merged (GPKG, SHP or GeoParquet)")
+    p.add_argument(
+        "--points",
+        default=None,
+        help="Point layer to merge at (GPKG, SHP or GeoParquet). If omitted, every endpoint shared by "
+        "exactly two lines (within tol) is a joint point.",
+    )
+    p.add_argument("--out", help="Merged output as LineString (GPKG, or GeoParquet for .parquet)")
+    p.add_argument("--out-errors", help="Error log output as Point (GPKG, or GeoParquet for .parquet)")
     p.add_argument(
-        "--tol", type=float, required=True, help="Tolerance in meter (projected CRS with meter unit only)."
+        "--tol", type=_positive_float, help="Tolerance in meter (projected CRS with meter unit only)."
     )
     p.add_argument(
         "--point-id-col", default=None, help="Optional Point ID column in points layer, if None, use index."
@@ -342,11 +2759,167 @@ def _parse_args():
         default=(),
         help="Optional column list to check values before merging, if any column value mismatched, skip merging and log as error.",
     )
-    return p.parse_args()
+    p.add_argument(
+        "--engine",
+        choices=("graph", "iterative"),
+        default="graph",
+        help="Merge engine, graph merges every chain in one pass, iterative re-matches pass by pass.",
+    )
+    p.add_argument(
+        "--matcher",
+        choices=tuple(MATCHERS),
+        default="strtree",
+        help="Endpoint index for tolerance matching, kdtree needs scipy, grid joins exact cells of a "
+        "precision grid derived from tol without any spatial index.",
+    )
+    p.add_argument(
+        "--spatial-order",
+        choices=("hilbert", "morton"),
+        default=None,
+        help="Process lines and points along a Hilbert or Morton curve for memory locality, "
+        "ids in the output still refer to the input order.",
+    )
+    p.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Keep the endpoints and endpoint index of --lines in this directory, reruns on an unchanged "
+        "lines file skip extracting and indexing them.",
+    )
+    p.add_argument(
+        "--workers", type=int, default=1, help="Worker processes for tiled parallel merging (graph engine)."
+    )
+    p.add_argument(
+        "--tiles",
+        type=int,
+        default=None,
+        help="Tiles per axis in parallel mode, default ceil(sqrt(4*workers)).",
+    )
+    p.add_argument(
+        "--window-size",
+        type=float,
+        default=None,
+        help="Out-of-core mode: read and merge in square windows of this size (CRS units), "
+        "appending results to the output. Ids are layer FIDs in this mode.",
+    )
+    p.add_argument(
+        "--line-id-col",
+        default=None,
+        help="Stable line ID column listed in merged_from instead of row positions, required with --state.",
+    )
+    p.add_argument(
+        "--state",
+        default=None,
+        help="Merge state JSON (chain membership of every output line), written by a full run "
+        "and patched by --incremental.",
+    )
+    p.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Recompute only chains reachable from --changed-lines/--changed-points and patch --out in place.",
+    )
+    p.add_argument("--changed-lines", nargs="*", default=(), help="Inserted, edited or deleted line IDs.")
+    p.add_argument("--changed-points", nargs="*", default=(), help="Inserted, edited or deleted point IDs.")
+    p.add_argument(
+        "--metrics-json", default=None, help="Write per-phase timings, counts and peak memory as JSON."
+    )
+    p.add_argument(
+        "--metrics-prom", default=None, help="Write the same metrics as a Prometheus node_exporter textfile."
+    )
+    p.add_argument(
+        "--agg",
+        nargs="+",
+        default=(),
+        metavar="COL=FUNC",
+        help=f"Aggregate attributes of merged lines, FUNC one of {', '.join(AGG_FUNCS)} "
+        "(wmean: length-weighted mean). Other columns keep the first line's values.",
+    )
+    p.add_argument(
+        "--plan",
+        action="store_true",
+        help="Dry run: write the merge plan (chain id, line ids, joint point ids) to --out as a table "
+        "and the predicted errors to --out-errors, without merging geometries.",
+    )
+    p.add_argument(
+        "--memory-budget",
+        type=_parse_bytes,
+        default=None,
+        metavar="SIZE",
+        help="Memory budget such as 512M or 8G. Inputs estimated over it are merged in windows "
+        "(see --window-size) when --line-id-col and --point-id-col are set, otherwise they fail up front.",
+    )
+    p.add_argument(
+        "--serve",
+        nargs="?",
+        const="-",
+        default=None,
+        metavar="SOCKET",
+        help="Persistent worker: keep the libraries loaded and run JSON job specs (Param fields, one per line) "
+        "from stdin, or from clients of a local socket at SOCKET, answering one JSON line per job. "
+        "Other arguments are ignored.",
+    )
+    p.add_argument(
+        "--batch",
+        default=None,
+        metavar="MANIFEST",
+        help="Run every job of a manifest (JSON list or CSV of Param fields, e.g. lines_path, points_path, "
+        "out_lines_path, out_errors_path, tol, val_chk_col) on --workers warm processes and write one "
+        "summary row per job to --summary. Other arguments are ignored.",
+    )
+    p.add_argument(
+        "--summary",
+        default=None,
+        help="Batch summary table (timings, merge and error counts per job), default MANIFEST_summary.csv.",
+    )
+    args = p.parse_args()
+    if args.serve is None and args.batch is None:
+        required = {
+            "--lines": args.lines,
+            "--out": args.out,
+            "--out-errors": args.out_errors,
+            "--tol": args.tol,
+        }
+        missing = [o for o, v in required.items() if v is None]
+        if missing:
+            p.error(f"the following arguments are required: {', '.join(missing)}")
+    return args
+
+
+def _positive_float(v: str) -> float:
+    # --tol, checked here so a bad value fails before any library is loaded
+    try:
+        f = float(v)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid float value: '{v}'")
+    if not f > 0:
+        raise argparse.ArgumentTypeError("tol must be a positive number.")
+    return f
+
+
+def _parse_bytes(v: str) -> int:
+    # "8G", "512M", "1.5g" or plain bytes
+    units = {"k": 2**10, "m": 2**20, "g": 2**30, "t": 2**40}
+    v = str(v).strip().lower().removesuffix("b")
+    try:
+        if v and v[-1] in units:
+            return int(float(v[:-1]) * units[v[-1]])
+        return int(float(v))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size '{v}', use e.g. 512M or 8G")
 
 
 def main():
     args = _parse_args()
+    if args.serve is not None:
+        if args.serve == "-":
+            serve(sys.stdin, sys.stdout)
+        else:
+            serve_socket(args.serve)
+        return
+    if args.batch is not None:
+        summary_path = args.summary or f"{os.path.splitext(args.batch)[0]}_summary.csv"
+        summary = run_batch(read_manifest(args.batch), summary_path, workers=args.workers)
+        print(f"[Done] {int(summary['ok'].sum())} of {len(summary)} jobs ok, summary saved: {summary_path}")
+        return
 
     def _norm_none(v):
         if v is None:
@@ -362,8 +2935,25 @@ def main():
         tol=args.tol,
         point_id_col=_norm_none(args.point_id_col),
         val_chk_col=tuple(args.val_chk_col) if args.val_chk_col else tuple(),
+        engine=args.engine,
+        workers=args.workers,
+        tiles=args.tiles,
+        window_size=args.window_size,
+        line_id_col=_norm_none(args.line_id_col),
+        state_path=args.state,
+        agg=dict(a.partition("=")[::2] for a in args.agg) if args.agg else None,
+        metrics_path=args.metrics_json,
+        matcher=args.matcher,
+        prometheus_path=args.metrics_prom,
+        memory_budget=args.memory_budget,
+        plan_only=args.plan,
+        spatial_sort=args.spatial_order,
+        cache_dir=args.cache_dir,
     )
-    run(s)
+    if args.incremental:
+        run_incremental(s, args.changed_lines, args.changed_points)
+    else:
+        run(s)
 
 
 if __name__ == "__main__":
@@ -20,12 +20,25 @@ Linemergejoinpoints 모듈을 위한 종합적인 테스트 스위트입니다
 import unittest
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import LineString, Point
+from shapely.geometry import LineString, MultiLineString, Point
 from jointpointLinemerge import Param, validate_inputs, iter_endpoints, merge_two_lines, merge_at_points, run
+from jointpointLinemerge import endpoint_arrays, MergeStats, ErrorLog, attr_keys, RunMetrics
+from jointpointLinemerge import build_merge_state, remerge_incremental, run_incremental
+from jointpointLinemerge import derive_joint_points, estimate_working_set, geometry_fingerprint, spatial_order
+from jointpointLinemerge import endpoint_cache, file_fingerprint, serve, read_manifest, run_batch, LineBuffer
 import jointpointLinemerge
+import bench_jointpointLinemerge as bench
 import pyproj
 import tempfile
 import os
+import json
+import importlib.util
+import io
+import subprocess
+import sys
+import pyogrio
+from dataclasses import replace
+import shapely
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 from matplotlib.collections import LineCollection
@@ -275,35 +288,64 @@ class TestLineMerge(unittest.TestCase):
 
     def test_errlog_enroll(self):
         """Test error logging functionality"""
-        # Clear existing error log for clean test
-        jointpointLinemerge.errlog.rows.clear()
-        jointpointLinemerge.errlog.pset.clear()
+        errlog = ErrorLog()
 
         # Test enrolling an error
         test_geometry = Point(1, 1)
-        jointpointLinemerge.errlog.enroll(
-            pid=101, count=2, line_ids=[1, 2], issue="Test issue", geometry=test_geometry
-        )
+        errlog.enroll(pid=101, count=2, line_ids=[1, 2], issue="Test issue", geometry=test_geometry)
 
         # Check that error was logged
-        self.assertEqual(len(jointpointLinemerge.errlog.rows), 1)
-        self.assertIn(101, jointpointLinemerge.errlog.pset)
+        self.assertEqual(len(errlog), 1)
+        self.assertIn(101, errlog)
 
         # Test enrolling duplicate - should not add new row
-        jointpointLinemerge.errlog.enroll(
+        errlog.enroll(
             pid=101, count=3, line_ids=[1, 2, 3], issue="Another test issue", geometry=test_geometry
         )
 
         # Should still have only one row
-        self.assertEqual(len(jointpointLinemerge.errlog.rows), 1)
+        self.assertEqual(len(errlog), 1)
 
         # Test enrolling different point - should add new row
-        jointpointLinemerge.errlog.enroll(
-            pid=102, count=1, line_ids=[4], issue="Different issue", geometry=Point(2, 2)
+        errlog.enroll(pid=102, count=1, line_ids=[4], issue="Different issue", geometry=Point(2, 2))
+
+        self.assertEqual(len(errlog), 2)
+        self.assertIn(102, errlog)
+        self.assertEqual(errlog.to_frame()["issue"].tolist(), ["Test issue", "Different issue"])
+
+    def test_errlog_extend_shards(self):
+        """Shards merge in order, a point already logged keeps its first issue"""
+        errlog, shard = ErrorLog(), ErrorLog()
+        errlog.enroll(1, 3, [1, 2, 3], "first", Point(0, 0))
+        shard.enroll(1, 2, [1, 2], "second", Point(0, 0))
+        shard.enroll(2, 1, [4], "third", Point(1, 1))
+        errlog.extend(shard)
+
+        error_df = errlog.to_frame()
+        self.assertEqual(error_df["point_id"].tolist(), [1, 2])
+        self.assertEqual(error_df["issue"].tolist(), ["first", "third"])
+        error_gdf = errlog.to_gdf("EPSG:3857")
+        self.assertEqual(error_gdf["line_ids"].tolist(), ["1,2,3", "4"])
+        self.assertEqual(error_gdf.crs, "EPSG:3857")
+
+    def test_errors_do_not_leak_between_calls(self):
+        """Repeated calls in one process report the same errors"""
+        lines_gdf = gpd.GeoDataFrame(
+            {
+                "geometry": [
+                    LineString([(0, 0), (1, 0)]),
+                    LineString([(1, 0), (2, 0)]),
+                    LineString([(1, 0), (1, 1)]),
+                ]
+            },
+            crs="EPSG:3857",
         )
-
-        self.assertEqual(len(jointpointLinemerge.errlog.rows), 2)
-        self.assertIn(102, jointpointLinemerge.errlog.pset)
+        points_gdf = gpd.GeoDataFrame({"point_id": [7]}, geometry=[Point(1, 0)], crs="EPSG:3857")
+        for engine in ("graph", "iterative", "graph"):
+            _, error_df = merge_at_points(
+                lines_gdf, points_gdf, tol=0.2, use_point_id_col="point_id", engine=engine
+            )
+            self.assertEqual(error_df["point_id"].tolist(), [7])
 
     def test_merge_at_points_with_errors(self):
         """Test merge_at_points with conditions that might generate errors"""
@@ -348,10 +390,6 @@ class TestLineMerge(unittest.TestCase):
             points_data = {"geometry": [Point(1, 1)], "point_id": [101]}
             points_gdf = gpd.GeoDataFrame(points_data, crs="EPSG:3857")
 
-            # Clear error log
-            jointpointLinemerge.errlog.rows.clear()
-            jointpointLinemerge.errlog.pset.clear()
-
             merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=tol)
 
             results.append(
@@ -413,10 +451,6 @@ class TestLineMerge(unittest.TestCase):
             points_data = {"geometry": [scenario["point"]], "point_id": [101]}
             points_gdf = gpd.GeoDataFrame(points_data, crs="EPSG:3857")
 
-            # Clear error log
-            jointpointLinemerge.errlog.rows.clear()
-            jointpointLinemerge.errlog.pset.clear()
-
             merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=0.2)
 
             results.append(
@@ -472,10 +506,6 @@ class TestLineMerge(unittest.TestCase):
                 crs="EPSG:3857",
             )
 
-            # Clear error log
-            jointpointLinemerge.errlog.rows.clear()
-            jointpointLinemerge.errlog.pset.clear()
-
             # Measure performance
             start_time = time.time()
             merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=0.2)
@@ -520,9 +550,6 @@ class TestLineMerge(unittest.TestCase):
             points_data = {"geometry": [Point(1, 1)], "point_id": [101]}
             points_gdf = gpd.GeoDataFrame(points_data, crs="EPSG:3857")
 
-            jointpointLinemerge.errlog.rows.clear()
-            jointpointLinemerge.errlog.pset.clear()
-
             merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=tol)
             success_rates.append(1 if len(error_df) == 0 else 0)
 
@@ -683,6 +710,1170 @@ class TestLineMerge(unittest.TestCase):
         plt.axis("equal")
 
 
+class MergeTestCase(unittest.TestCase):
+    """Shared fixtures of the merge feature tests: small networks and input files for run"""
+
+    @staticmethod
+    def _chain(n, crs="EPSG:3857"):
+        lines_gdf = gpd.GeoDataFrame(
+            {"id": list(range(n)), "geometry": [LineString([(i, 0), (i + 1, 0)]) for i in range(n)]}, crs=crs
+        )
+        points_gdf = gpd.GeoDataFrame(
+            {"point_id": list(range(1, n)), "geometry": [Point(i, 0) for i in range(1, n)]}, crs=crs
+        )
+        return lines_gdf, points_gdf
+
+    @staticmethod
+    def _rows(n_rows, n, crs="EPSG:3857"):
+        lines = [
+            {"LID": f"L{r}_{i}", "geometry": LineString([(i, r * 10), (i + 1, r * 10)])}
+            for r in range(n_rows)
+            for i in range(n)
+        ]
+        points = [
+            {"PID": r * 100 + i, "geometry": Point(i, r * 10)} for r in range(n_rows) for i in range(1, n)
+        ]
+        return gpd.GeoDataFrame(lines, crs=crs), gpd.GeoDataFrame(points, crs=crs)
+
+    @staticmethod
+    def _write_inputs(tmpdir, lines_gdf, points_gdf=None, ext=".gpkg", tag=""):
+        # writes the layers to tmpdir (GeoParquet for ext ".parquet", else GPKG)
+        # returns the lines / points / out / err paths, points None without a points layer
+        paths = {k: os.path.join(tmpdir, f"{k}{tag}{ext}") for k in ("lines", "points", "out", "err")}
+        for key, gdf in (("lines", lines_gdf), ("points", points_gdf)):
+            if gdf is None:
+                paths[key] = None
+            elif ext == ".parquet":
+                gdf.to_parquet(paths[key])
+            else:
+                gdf.to_file(paths[key], driver="GPKG")
+        return paths
+
+    @staticmethod
+    def _param(paths, **kwargs):
+        # Param over the paths of _write_inputs
+        return Param(
+            lines_path=paths["lines"],
+            points_path=paths["points"],
+            out_lines_path=paths["out"],
+            out_errors_path=paths["err"],
+            **kwargs,
+        )
+
+
+class TestGraphMerge(MergeTestCase):
+    """Tests for the single pass graph merge engine and the iterative engine it is checked against"""
+
+    def test_long_chain_single_pass(self):
+        """A chain of segments split at every joint point becomes one line"""
+        lines_gdf, points_gdf = self._chain(12)
+        merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=0.2, use_point_id_col="point_id")
+
+        self.assertEqual(len(merged_gdf), 1)
+        self.assertEqual(len(error_df), 0)
+        self.assertEqual(list(merged_gdf.geometry.iloc[0].coords), [(float(i), 0.0) for i in range(13)])
+        self.assertEqual(merged_gdf["merged_from"].iloc[0], ",".join(str(i) for i in range(12)))
+        self.assertEqual(merged_gdf["merged_count"].iloc[0], 11)
+
+    def test_graph_matches_iterative(self):
+        """Both engines produce the same geometry for a plain chain"""
+        lines_gdf, points_gdf = self._chain(7)
+        graph_gdf, _ = merge_at_points(lines_gdf, points_gdf, tol=0.2, engine="graph")
+        iter_gdf, _ = merge_at_points(lines_gdf, points_gdf, tol=0.2, engine="iterative")
+
+        self.assertEqual(len(graph_gdf), len(iter_gdf))
+        self.assertTrue(graph_gdf.geometry.iloc[0].normalize().equals(iter_gdf.geometry.iloc[0].normalize()))
+
+    def test_chain_split_at_junction_and_value_check(self):
+        """Chains stop at junctions and at attribute boundaries"""
+        lines_gdf = gpd.GeoDataFrame(
+            {
+                "road": ["A", "A", "B", "A"],
+                "geometry": [
+                    LineString([(0, 0), (1, 0)]),
+                    LineString([(1, 0), (2, 0)]),
+                    LineString([(2, 0), (3, 0)]),
+                    LineString([(1, 0), (1, 1)]),
+                ],
+            },
+            crs="EPSG:3857",
+        )
+        points_gdf = gpd.GeoDataFrame({"geometry": [Point(1, 0), Point(2, 0)]}, crs="EPSG:3857")
+        merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=0.2, val_chk_col=("road",))
+
+        self.assertEqual(len(merged_gdf), 4)
+        self.assertEqual(
+            sorted(error_df["issue"]),
+            ["Not exactly 2 lines to merge.", "Value check failed at columns ('road',)."],
+        )
+
+    def test_closed_ring(self):
+        """A ring of segments merges into one closed line, the ring-closing point is logged by both engines"""
+        coords = [(0, 0), (1, 0), (1, 1), (0, 1)]
+        lines_gdf = gpd.GeoDataFrame(
+            {"geometry": [LineString([coords[i], coords[(i + 1) % 4]]) for i in range(4)]}, crs="EPSG:3857"
+        )
+        points_gdf = gpd.GeoDataFrame(
+            {"point_id": [10, 11, 12, 13], "geometry": [Point(c) for c in coords]}, crs="EPSG:3857"
+        )
+        for engine in ("graph", "iterative"):
+            merged_gdf, error_df = merge_at_points(
+                lines_gdf, points_gdf, tol=0.2, use_point_id_col="point_id", engine=engine
+            )
+            self.assertEqual(len(merged_gdf), 1)
+            self.assertTrue(merged_gdf.geometry.iloc[0].is_closed)
+            self.assertEqual(merged_gdf["merge_point_id"].iloc[0], "10,13,12")
+            self.assertEqual(
+                error_df[["point_id", "count", "line_ids", "issue"]].values.tolist(),
+                [[11, 1, [0, 1, 2, 3], "Not exactly 2 lines to merge."]],
+            )
+
+    def test_chain_merge_mixed_orientation(self):
+        """A long chain of segments in random directions merges into the original polyline"""
+        lines_gdf, points_gdf = bench.make_chain(2000)
+        coords = shapely.get_coordinates(lines_gdf.geometry)
+        expected = LineString(np.concatenate([coords[:1], coords[1::2]]))
+        flip = np.random.default_rng(0).random(len(lines_gdf)) < 0.5
+        lines_gdf.loc[flip, "geometry"] = lines_gdf.geometry[flip].reverse()
+        stats = MergeStats()
+        merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=0.2, stats=stats)
+        self.assertEqual(len(merged_gdf), 1)
+        self.assertEqual(len(error_df), 0)
+        self.assertEqual(stats.fast, 1999)
+        self.assertTrue(merged_gdf.geometry[0].equals(expected))
+        self.assertEqual(len(shapely.get_coordinates(merged_gdf.geometry[0])), 2001)
+
+    def test_iterative_engine_tracks_original_rows(self):
+        """The iterative engine reports original row ids and keeps the input columns only"""
+        lines_gdf, points_gdf = self._chain(5)
+        merged_gdf, _ = merge_at_points(lines_gdf, points_gdf, tol=0.2, engine="iterative")
+
+        self.assertEqual(len(merged_gdf), 1)
+        self.assertEqual(sorted(merged_gdf["merged_from"].iloc[0].split(",")), ["0", "1", "2", "3", "4"])
+        self.assertEqual(merged_gdf["merged_count"].iloc[0], 4)
+        self.assertEqual(
+            list(merged_gdf.columns), ["id", "merged_from", "merge_point_id", "merged_count", "geometry"]
+        )
+
+    def test_iterative_schedules_whole_chains(self):
+        """The iterative engine merges whole chains in one pass and matches the graph engine"""
+        lines_gdf, points_gdf = self._chain(64)
+        metrics = RunMetrics()
+        merged_gdf, _ = merge_at_points(lines_gdf, points_gdf, tol=0.2, engine="iterative", metrics=metrics)
+        self.assertEqual(len(merged_gdf), 1)
+        # one merging pass, one pass that finds nothing left
+        self.assertEqual([it["merges"] for it in metrics.iterations], [63, 0])
+
+        lines_gdf, points_gdf = bench.make_grid(2000)
+        graph_gdf, graph_err = merge_at_points(lines_gdf, points_gdf, tol=0.2, engine="graph")
+        iter_gdf, iter_err = merge_at_points(lines_gdf, points_gdf, tol=0.2, engine="iterative")
+        pd.testing.assert_frame_equal(graph_gdf, iter_gdf)
+        pd.testing.assert_frame_equal(graph_err, iter_err)
+
+    def test_iterative_retry_error_ids(self):
+        """A point retried on a later pass logs the input rows of the merged line it meets"""
+        lines_gdf = gpd.GeoDataFrame(
+            {
+                "LINK_ID": ["X", "W", "Y", "Z"],
+                "geometry": [
+                    LineString([(0, 0), (1, 0)]),
+                    LineString([(0.85, 0), (0.85, -5)]),
+                    LineString([(1.15, 0), (3, 0)]),
+                    LineString([(3, 0), (4, 0)]),
+                ],
+            },
+            crs="EPSG:3857",
+        )
+        points_gdf = gpd.GeoDataFrame(
+            {"NODE_ID": [1, 2, 3], "geometry": [Point(0.92, 0), Point(1.07, 0), Point(3, 0)]}, crs="EPSG:3857"
+        )
+        _, error_df = merge_at_points(
+            lines_gdf, points_gdf, tol=0.2, use_point_id_col="NODE_ID", engine="iterative"
+        )
+        self.assertEqual(error_df["point_id"].tolist(), [2])
+        self.assertEqual(error_df["line_ids"].tolist(), [[2, 3]])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf, points_gdf)
+            run(
+                self._param(
+                    paths,
+                    tol=0.2,
+                    engine="iterative",
+                    line_id_col="LINK_ID",
+                    point_id_col="NODE_ID",
+                    state_path=os.path.join(tmpdir, "state.json"),
+                )
+            )
+            self.assertEqual(gpd.read_file(paths["err"])["line_ids"].tolist(), ["Y,Z"])
+
+    def test_unknown_engine(self):
+        lines_gdf, points_gdf = self._chain(2)
+        with self.assertRaises(ValueError):
+            merge_at_points(lines_gdf, points_gdf, tol=0.2, engine="nope")
+
+
+class TestEndpointMatching(MergeTestCase):
+    """Tests for endpoint extraction and the bulk point matchers"""
+
+    def test_endpoint_arrays(self):
+        """Endpoints of all lines are extracted at once with their end slots"""
+        geoms = [
+            LineString([(0, 0), (1, 0), (2, 0)]),
+            MultiLineString([[(5, 5), (6, 6)], [(7, 7), (8, 8)]]),
+        ]
+        xy, line_idx, end_slot = endpoint_arrays(geoms)
+
+        self.assertEqual(xy.tolist(), [[0, 0], [2, 0], [5, 5], [6, 6], [7, 7], [8, 8]])
+        self.assertEqual(line_idx.tolist(), [0, 0, 1, 1, 1, 1])
+        self.assertEqual(end_slot.tolist(), [0, 1, 0, 1, 2, 3])
+
+    def test_bulk_matching_nearest_end(self):
+        """A short line with both ends in tol joins at its nearest end"""
+        lines_gdf = gpd.GeoDataFrame(
+            {"geometry": [LineString([(0, 0), (1, 0)]), LineString([(1, 0), (1.1, 0)])]}, crs="EPSG:3857"
+        )
+        points_gdf = gpd.GeoDataFrame({"geometry": [Point(1, 0), Point(50, 50)]}, crs="EPSG:3857")
+        merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=0.2)
+
+        self.assertEqual(len(merged_gdf), 1)
+        self.assertEqual(merged_gdf["merged_from"].iloc[0], "0,1")
+        self.assertEqual(len(error_df), 0)
+
+    @unittest.skipUnless(importlib.util.find_spec("scipy"), "scipy not installed")
+    def test_kdtree_matcher(self):
+        """The KD-tree matcher returns int incidence arrays and the same merge as the STRtree matcher"""
+        lines_gdf, points_gdf = bench.make_clustered(2000, seed=3)
+        ends = endpoint_arrays(lines_gdf.geometry)
+        pt_xy = np.column_stack([points_gdf.geometry.x, points_gdf.geometry.y])
+        pt_i, e_i = jointpointLinemerge._query_endpoints(ends[0], pt_xy, 0.2, "kdtree")
+        self.assertEqual(pt_i.dtype.kind, "i")
+        self.assertEqual(e_i.dtype.kind, "i")
+        ref_pt, ref_e = jointpointLinemerge._query_endpoints(ends[0], pt_xy, 0.2, "strtree")
+        self.assertEqual(
+            sorted(zip(pt_i.tolist(), e_i.tolist())), sorted(zip(ref_pt.tolist(), ref_e.tolist()))
+        )
+
+        strtree_gdf, strtree_err = merge_at_points(lines_gdf, points_gdf, tol=0.2, use_point_id_col="NODE_ID")
+        kdtree_gdf, kdtree_err = merge_at_points(
+            lines_gdf, points_gdf, tol=0.2, use_point_id_col="NODE_ID", matcher="kdtree"
+        )
+        pd.testing.assert_frame_equal(strtree_gdf, kdtree_gdf)
+        pd.testing.assert_frame_equal(strtree_err, kdtree_err)
+        with self.assertRaises(ValueError):
+            merge_at_points(lines_gdf, points_gdf, tol=0.2, matcher="nope")
+
+    def test_grid_matcher(self):
+        """The precision-grid matcher finds the STRtree pairs, also across a corner of its grid cells"""
+        lines_gdf, points_gdf = bench.make_clustered(2000, seed=3)
+        ends = endpoint_arrays(lines_gdf.geometry)
+        cell = jointpointLinemerge.GRID_CELL * 0.2
+        # points on a cell corner, in the diagonal neighbour cell of an endpoint within tol and far away
+        extra = np.array([[cell * 3, cell * 5], [cell * 3 - 0.09, cell * 5 + 0.05], [-1e6, 1e6]])
+        end_xy = np.concatenate([ends[0], [[cell * 3 + 0.1, cell * 5 - 0.01]]])
+        pt_xy = np.concatenate([np.column_stack([points_gdf.geometry.x, points_gdf.geometry.y]), extra])
+        pt_i, e_i = jointpointLinemerge._query_endpoints(end_xy, pt_xy, 0.2, "grid")
+        ref_pt, ref_e = jointpointLinemerge._query_endpoints(end_xy, pt_xy, 0.2, "strtree")
+        pairs = sorted(zip(pt_i.tolist(), e_i.tolist()))
+        self.assertEqual(pairs, sorted(zip(ref_pt.tolist(), ref_e.tolist())))
+        self.assertEqual(len(pairs), len(set(pairs)))
+        self.assertIn((len(pt_xy) - 2, len(end_xy) - 1), pairs)
+        # an extent too large for exact cell keys falls back to hashed cells
+        far = np.concatenate([end_xy, [[1e18, 1e18]]])
+        pt_i, e_i = jointpointLinemerge._query_endpoints(far, pt_xy, 0.2, "grid")
+        self.assertEqual(sorted(zip(pt_i.tolist(), e_i.tolist())), pairs)
+
+        strtree_gdf, strtree_err = merge_at_points(lines_gdf, points_gdf, tol=0.2, use_point_id_col="NODE_ID")
+        grid_gdf, grid_err = merge_at_points(
+            lines_gdf, points_gdf, tol=0.2, use_point_id_col="NODE_ID", matcher="grid"
+        )
+        pd.testing.assert_frame_equal(strtree_gdf, grid_gdf)
+        pd.testing.assert_frame_equal(strtree_err, grid_err)
+
+
+class TestCoordinateMerge(MergeTestCase):
+    """Tests for the coordinate-level fast path and the flat coordinate buffer"""
+
+    def test_merge_two_lines_fast_path(self):
+        """Lines sharing one endpoint are concatenated without the overlay path"""
+        stats = MergeStats()
+        merged = merge_two_lines(
+            LineString([(1, 1), (2, 2)]), LineString([(0, 0), (1.05, 1)]), snap_tol=0.1, stats=stats
+        )
+        self.assertEqual(list(merged.coords), [(0.0, 0.0), (1.05, 1.0), (2.0, 2.0)])
+
+        merged = merge_two_lines(
+            LineString([(0, 0), (1, 0)]), LineString([(2, 0), (1, 0)]), snap_tol=0.1, stats=stats
+        )
+        self.assertEqual(list(merged.coords), [(0.0, 0.0), (1.0, 0.0), (2.0, 0.0)])
+        self.assertEqual((stats.fast, stats.overlay, stats.manual), (2, 0, 0))
+
+    def test_merge_two_lines_overlay_fallback(self):
+        """Two lines touching at both ends are left to the overlay path"""
+        stats = MergeStats()
+        merged = merge_two_lines(
+            LineString([(0, 0), (1, 0), (1, 1)]),
+            LineString([(1, 1), (0, 1), (0, 0)]),
+            snap_tol=0.1,
+            stats=stats,
+        )
+        self.assertTrue(merged.is_closed)
+        self.assertEqual((stats.fast, stats.overlay + stats.manual), (0, 1))
+
+    def test_line_buffer(self):
+        """LineBuffer holds plain LineStrings as coordinates plus offsets, chains join views of its rows"""
+        geoms = [
+            LineString([(1, 0), (2, 0), (3, 0)]),
+            MultiLineString([[(5, 5), (6, 6)]]),
+            LineString([(4, 0, 1), (3, 0, 2)]),
+            None,
+            LineString([(1, 0), (0, 0)]),
+            LineString([(4, 0), (3, 0)]),
+            LineString([(-1, 0), (0, 0)]),
+        ]
+        buf = LineBuffer.from_geoms(geoms)
+        self.assertEqual(buf.plain.tolist(), [True, False, True, False, True, True, True])
+        self.assertEqual(buf.has_z.tolist(), [False, False, True, False, False, False, False])
+        self.assertEqual(buf.offsets.tolist(), [0, 3, 3, 5, 5, 7, 9, 11])
+        self.assertIsNone(buf.endpoint_arrays())
+        # prepended reversed, appended reversed, prepended as is
+        chain = jointpointLinemerge._CoordChain(buf.coords_of(0))
+        for row in (4, 5, 6):
+            self.assertTrue(chain.join(buf.coords_of(row), 0.01))
+        self.assertFalse(chain.join(buf.coords_of(2), 0.01))  # 3D line on a 2D chain
+        self.assertFalse(chain.join(None, 0.01))
+        expected = [[-1, 0], [0, 0], [1, 0], [2, 0], [3, 0], [4, 0]]
+        self.assertEqual(chain.coords().tolist(), expected)
+
+        plain_geoms = [geoms[0], geoms[4], geoms[2]]
+        for a, b in zip(LineBuffer.from_geoms(plain_geoms).endpoint_arrays(), endpoint_arrays(plain_geoms)):
+            np.testing.assert_array_equal(a, b)
+
+    @unittest.skipUnless(jointpointLinemerge.HAS_ARROW, "pyarrow not installed")
+    def test_line_buffer_arrow(self):
+        """GeoArrow-encoded GeoParquet lines are merged on a buffer over their Arrow coordinates"""
+        lines_gdf, points_gdf = bench.make_clustered(300, seed=5)
+        results = {}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for encoding in ("WKB", "geoarrow"):
+                paths = self._write_inputs(tmpdir, None, points_gdf, ".parquet", encoding)
+                paths["lines"] = os.path.join(tmpdir, f"lines{encoding}.parquet")
+                lines_gdf.to_parquet(paths["lines"], geometry_encoding=encoding)
+                read, buf = jointpointLinemerge._read_lines(paths["lines"])
+                if encoding == "WKB":
+                    self.assertIsNone(buf)
+                else:
+                    ref = LineBuffer.from_geoms(lines_gdf.geometry)
+                    np.testing.assert_array_equal(buf.coords, ref.coords)
+                    np.testing.assert_array_equal(buf.offsets, ref.offsets)
+                    np.testing.assert_array_equal(buf.plain, ref.plain)
+                    self.assertEqual(read.index.tolist(), lines_gdf.index.tolist())
+                run(self._param(paths, tol=0.2, spatial_sort="hilbert"))
+                results[encoding] = gpd.read_parquet(paths["out"])
+        wkb_out, arrow_out = results["WKB"], results["geoarrow"]
+        self.assertLess(len(wkb_out), len(lines_gdf))
+        self.assertEqual(arrow_out["merged_from"].tolist(), wkb_out["merged_from"].tolist())
+        self.assertTrue(arrow_out.geometry.geom_equals_exact(wkb_out.geometry, 0).all())
+
+
+class TestParallelMerge(MergeTestCase):
+    """Tests for the tiled process pool mode"""
+
+    def test_parallel_matches_serial(self):
+        """Tiled process pool merging gives the serial result, chains crossing tile seams included"""
+        lines_gdf, points_gdf = self._chain(40)
+        extra = gpd.GeoDataFrame(
+            {
+                "geometry": [
+                    LineString([(10, 0), (10, 5)]),
+                    LineString([(30, 5), (30, 10)]),
+                    LineString([(30, 10), (31, 12)]),
+                    MultiLineString([[(40, 0), (41, 0)]]),  # sent to the workers as WKB
+                ],
+            },
+            crs="EPSG:3857",
+        )
+        lines_gdf = pd.concat([lines_gdf, extra.assign(id=[100, 101, 102, 103])], ignore_index=True)
+        points_gdf = pd.concat(
+            [
+                points_gdf,
+                gpd.GeoDataFrame(
+                    {"point_id": [500, 501]}, geometry=[Point(30, 10), Point(40, 0)], crs="EPSG:3857"
+                ),
+            ],
+            ignore_index=True,
+        )
+        serial_gdf, serial_err = merge_at_points(lines_gdf, points_gdf, tol=0.2, use_point_id_col="point_id")
+        parallel_gdf, parallel_err = merge_at_points(
+            lines_gdf, points_gdf, tol=0.2, use_point_id_col="point_id", workers=2, tiles=4
+        )
+
+        self.assertEqual(len(serial_gdf), 4)
+        pd.testing.assert_frame_equal(serial_gdf, parallel_gdf)
+        pd.testing.assert_frame_equal(serial_err, parallel_err)
+
+
+class TestWindowedRun(MergeTestCase):
+    """Tests for the out-of-core windowed mode"""
+
+    def test_run_windowed(self):
+        """Windowed out-of-core run carries chains across windows and matches the in-memory merge"""
+        lines_gdf, points_gdf = self._chain(40)
+        branch = gpd.GeoDataFrame(
+            {"id": [100], "geometry": [LineString([(20, 0), (20, 9)])]}, crs="EPSG:3857"
+        )
+        lines_gdf = pd.concat([lines_gdf, branch], ignore_index=True)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf, points_gdf)
+            run(self._param(paths, tol=0.2, point_id_col="point_id", window_size=3.0))
+            out_lines_gdf = gpd.read_file(paths["out"])
+            out_errors_gdf = gpd.read_file(paths["err"])
+
+        merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=0.2, use_point_id_col="point_id")
+        self.assertEqual(len(out_lines_gdf), 3)
+        self.assertEqual(
+            sorted(g.normalize().wkb for g in out_lines_gdf.geometry),
+            sorted(g.normalize().wkb for g in merged_gdf.geometry),
+        )
+        self.assertEqual(out_errors_gdf["point_id"].tolist(), error_df["point_id"].tolist())
+
+    def test_run_windowed_aggregates_like_in_memory(self):
+        """Windowed mode aggregates finished chains with the same functions"""
+        lines_gdf, points_gdf = self._chain(9)
+        agg = {"id": "sum"}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf, points_gdf)
+            run(self._param(paths, tol=0.2, point_id_col="point_id", window_size=3.0, agg=agg))
+            out_lines_gdf = gpd.read_file(paths["out"])
+
+        merged_gdf, _ = merge_at_points(lines_gdf, points_gdf, tol=0.2, use_point_id_col="point_id", agg=agg)
+        self.assertEqual(out_lines_gdf["id"].tolist(), [36])
+        self.assertEqual(merged_gdf["id"].tolist(), [36])
+
+    def test_run_windowed_value_check(self):
+        """Windowed mode splits chains where the check columns change"""
+        lines_gdf, points_gdf = self._chain(6)
+        lines_gdf["road"] = ["a", "a", "a", "b", "b", "b"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf, points_gdf)
+            run(self._param(paths, tol=0.2, point_id_col="point_id", val_chk_col=("road",), window_size=2.0))
+            out_lines_gdf = gpd.read_file(paths["out"])
+            out_errors_gdf = gpd.read_file(paths["err"])
+
+        self.assertEqual(sorted(out_lines_gdf["road"].tolist()), ["a", "b"])
+        self.assertEqual(sorted(out_lines_gdf.geometry.length.tolist()), [3.0, 3.0])
+        self.assertEqual(out_errors_gdf["point_id"].tolist(), [3])
+
+
+class TestIncrementalMerge(MergeTestCase):
+    """Tests for the merge state and incremental re-merge"""
+
+    def test_remerge_incremental_matches_full_run(self):
+        """Only chains reached by the changed features are recomputed, the result equals a full rerun"""
+        lines_gdf, points_gdf = self._rows(3, 8)
+        out_gdf, err_df = merge_at_points(lines_gdf, points_gdf, tol=0.2, use_point_id_col="PID")
+        state = build_merge_state(out_gdf, err_df, lines_gdf, 0.2, "LID", "PID")
+        out_gdf = out_gdf.assign(merged_from=None)
+
+        # drop a joint point on the first row, add a branch on the second row
+        points_gdf = points_gdf[points_gdf["PID"] != 4]
+        branch = gpd.GeoDataFrame(
+            [{"LID": "NEW", "geometry": LineString([(3, 10), (3, 15)])}], crs="EPSG:3857"
+        )
+        lines_gdf = pd.concat([lines_gdf, branch], ignore_index=True)
+        patched_gdf, patched_err, patched_state = remerge_incremental(
+            out_gdf, state, lines_gdf, points_gdf, ["NEW"], [4]
+        )
+        full_gdf, full_err = merge_at_points(lines_gdf, points_gdf, tol=0.2, use_point_id_col="PID")
+
+        self.assertEqual(
+            sorted(g.normalize().wkb for g in patched_gdf.geometry),
+            sorted(g.normalize().wkb for g in full_gdf.geometry),
+        )
+        self.assertEqual(sorted(patched_err["point_id"]), sorted(str(p) for p in full_err["point_id"]))
+        self.assertEqual(len(patched_state["chains"]), len(patched_gdf))
+        # the third row was not touched
+        self.assertIn(
+            {"lines": [f"L2_{i}" for i in range(8)], "points": [str(200 + i) for i in range(1, 8)]},
+            patched_state["chains"],
+        )
+
+        # delete the branch again, the point it blocked merges its row back
+        lines_gdf = lines_gdf[lines_gdf["LID"] != "NEW"].reset_index(drop=True)
+        patched_gdf, patched_err, _ = remerge_incremental(
+            patched_gdf, patched_state, lines_gdf, points_gdf, ["NEW"], []
+        )
+        full_gdf, full_err = merge_at_points(lines_gdf, points_gdf, tol=0.2, use_point_id_col="PID")
+        self.assertEqual(
+            sorted(g.normalize().wkb for g in patched_gdf.geometry),
+            sorted(g.normalize().wkb for g in full_gdf.geometry),
+        )
+        self.assertEqual(sorted(patched_err["point_id"]), sorted(str(p) for p in full_err["point_id"]))
+
+    def test_run_incremental(self):
+        """run writes a merge state that run_incremental patches in place"""
+        lines_gdf, points_gdf = self._rows(2, 5)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf, points_gdf)
+            param = self._param(
+                paths,
+                tol=0.2,
+                point_id_col="PID",
+                line_id_col="LID",
+                state_path=os.path.join(tmpdir, "state.json"),
+            )
+            run(param)
+            self.assertEqual(len(gpd.read_file(param.out_lines_path)), 2)
+
+            points_gdf[points_gdf["PID"] != 102].to_file(param.points_path, driver="GPKG")
+            run_incremental(param, [], [102])
+            out_lines_gdf = gpd.read_file(param.out_lines_path)
+
+        self.assertEqual(len(out_lines_gdf), 3)
+        self.assertEqual(
+            sorted(out_lines_gdf["merged_from"]), ["L0_0,L0_1,L0_2,L0_3,L0_4", "L1_0,L1_1", "L1_2,L1_3,L1_4"]
+        )
+
+
+class TestAggregation(MergeTestCase):
+    """Tests for attribute aggregation and value check keys"""
+
+    def test_aggregate_merged_attributes(self):
+        """agg evaluates sum, mean, wmean, min, max, first_input, last_input and concat over each chain"""
+        lines_gdf = gpd.GeoDataFrame(
+            {
+                "v": [1.0, 2.0, 6.0, 10.0],
+                "name": ["a", "b", "c", "d"],
+                "geometry": [
+                    LineString([(0, 0), (1, 0)]),
+                    LineString([(1, 0), (4, 0)]),
+                    LineString([(4, 0), (5, 0)]),
+                    LineString([(0, 5), (1, 5)]),
+                ],
+            },
+            crs="EPSG:3857",
+        )
+        points_gdf = gpd.GeoDataFrame(
+            {"point_id": [1, 2]}, geometry=[Point(1, 0), Point(4, 0)], crs="EPSG:3857"
+        )
+        for fn, expected in [
+            ("sum", 9.0),
+            ("mean", 3.0),
+            ("wmean", 2.6),
+            ("min", 1.0),
+            ("max", 6.0),
+            ("first_input", 1.0),
+            ("last_input", 6.0),
+        ]:
+            for engine in ("graph", "iterative"):
+                merged_gdf, _ = merge_at_points(
+                    lines_gdf, points_gdf, tol=0.2, use_point_id_col="point_id", engine=engine, agg={"v": fn}
+                )
+                row = merged_gdf[merged_gdf["merged_from"].notna()].iloc[0]
+                self.assertAlmostEqual(row["v"], expected, msg=f"{fn} ({engine})")
+                # untouched rows keep their own values
+                self.assertEqual(merged_gdf.loc[merged_gdf["merged_from"].isna(), "v"].tolist(), [10.0])
+
+        merged_gdf, _ = merge_at_points(
+            lines_gdf, points_gdf, tol=0.2, use_point_id_col="point_id", agg={"name": "concat", "v": "sum"}
+        )
+        row = merged_gdf[merged_gdf["merged_from"].notna()].iloc[0]
+        self.assertEqual(row["name"], "a,b,c")
+        self.assertEqual(row["v"], 9.0)
+
+        # first_input / last_input follow the input rows, not the chain
+        merged_gdf, _ = merge_at_points(
+            lines_gdf.iloc[[2, 0, 3, 1]],
+            points_gdf,
+            tol=0.2,
+            use_point_id_col="point_id",
+            agg={"v": "first_input", "name": "last_input"},
+        )
+        row = merged_gdf[merged_gdf["merged_from"].notna()].iloc[0]
+        self.assertEqual((row["v"], row["name"]), (6.0, "b"))
+
+    def test_aggregate_invalid_spec(self):
+        lines_gdf, points_gdf = self._chain(2)
+        with self.assertRaises(ValueError):
+            merge_at_points(lines_gdf, points_gdf, tol=0.2, agg={"nope": "sum"})
+        with self.assertRaises(ValueError):
+            merge_at_points(lines_gdf, points_gdf, tol=0.2, agg={"id": "median"})
+
+    def test_attr_keys(self):
+        """Rows with equal check values share a key, a missing value never matches"""
+        table = pd.DataFrame({"a": [1, 1, 2, 1, None, None], "b": ["x", "x", "x", "y", "x", "x"]})
+        keys = attr_keys(table, ("a", "b"))
+        self.assertEqual(keys.dtype, np.int64)
+        self.assertEqual(keys[0], keys[1])
+        self.assertEqual(len(set(keys[[0, 2, 3, 4, 5]].tolist())), 5)
+        self.assertTrue((attr_keys(table, ()) == 0).all())
+
+
+class TestRunMetrics(MergeTestCase):
+    """Tests for RunMetrics instrumentation"""
+
+    def test_run_metrics(self):
+        """merge_at_points reports phases, counts and iterations through RunMetrics and its callback"""
+        lines_gdf, points_gdf = self._chain(6)
+        points_gdf = pd.concat(
+            [points_gdf, gpd.GeoDataFrame({"point_id": [99]}, geometry=[Point(0, 0)], crs="EPSG:3857")],
+            ignore_index=True,
+        )
+        for engine in ("graph", "iterative"):
+            events = []
+            metrics = RunMetrics(callback=events.append)
+            merge_at_points(
+                lines_gdf, points_gdf, tol=0.2, use_point_id_col="point_id", engine=engine, metrics=metrics
+            )
+            for phase in ("endpoints", "index", "match", "merge", "dedup", "materialize"):
+                self.assertIn(phase, metrics.phases, f"{phase} ({engine})")
+            self.assertEqual(metrics.counts["merges"], 5)
+            self.assertEqual(metrics.counts["errors"], 1)
+            self.assertEqual(sum(it["merges"] for it in metrics.iterations), 5)
+            self.assertIn("iteration", {e["event"] for e in events})
+            self.assertIn("phase", {e["event"] for e in events})
+
+    def test_run_writes_metrics(self):
+        """run writes the metrics as JSON and as a Prometheus textfile"""
+        lines_gdf, points_gdf = self._chain(4)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf, points_gdf)
+            metrics = run(
+                self._param(
+                    paths,
+                    tol=0.2,
+                    point_id_col="point_id",
+                    metrics_path=os.path.join(tmpdir, "metrics.json"),
+                    prometheus_path=os.path.join(tmpdir, "metrics.prom"),
+                )
+            )
+            with open(os.path.join(tmpdir, "metrics.json"), encoding="utf-8") as f:
+                written = json.load(f)
+            with open(os.path.join(tmpdir, "metrics.prom"), encoding="utf-8") as f:
+                prom = f.read()
+
+        for phase in ("read", "validate", "match", "merge", "write"):
+            self.assertIn(phase, written["phases"])
+        self.assertEqual(written["counts"]["out_lines"], 1)
+        self.assertEqual(metrics.counts["merges"], 3)
+        self.assertIn('jointpoint_linemerge_phase_seconds{phase="merge"}', prom)
+        self.assertIn('jointpoint_linemerge_count{name="merges"} 3', prom)
+        if written["peak_rss_bytes"] is not None:
+            self.assertGreaterEqual(written["peak_rss_growth_bytes"], 0)
+            self.assertLessEqual(written["peak_rss_growth_bytes"], written["peak_rss_bytes"])
+            self.assertIn("jointpoint_linemerge_peak_rss_growth_bytes", prom)
+
+
+class TestGeoParquetIO(MergeTestCase):
+    """Tests for the GeoParquet input and output path"""
+
+    @unittest.skipUnless(jointpointLinemerge.HAS_ARROW, "pyarrow not installed")
+    def test_run_geoparquet_io(self):
+        """GeoParquet input and output are chosen by file extension and give the GPKG result"""
+        lines_gdf, points_gdf = self._chain(5)
+        lines_gdf["road"] = "a"
+        points_gdf = pd.concat(
+            [points_gdf, gpd.GeoDataFrame({"point_id": [99]}, geometry=[Point(0, 0)], crs="EPSG:3857")],
+            ignore_index=True,
+        )
+        results = {}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for ext in (".gpkg", ".parquet"):
+                paths = self._write_inputs(tmpdir, lines_gdf, points_gdf, ext)
+                run(self._param(paths, tol=0.2, point_id_col="point_id"))
+                read = gpd.read_file if ext == ".gpkg" else gpd.read_parquet
+                results[ext] = (read(paths["out"]), read(paths["err"]))
+            with self.assertRaises(ValueError):
+                paths = dict(
+                    paths, out=os.path.join(tmpdir, "out_w.gpkg"), err=os.path.join(tmpdir, "err_w.gpkg")
+                )
+                run(self._param(paths, tol=0.2, window_size=2.0))
+
+        gpkg_out, gpkg_err = results[".gpkg"]
+        parquet_out, parquet_err = results[".parquet"]
+        self.assertEqual(len(parquet_out), 1)
+        self.assertTrue(parquet_out.geometry.geom_equals(gpkg_out.geometry).all())
+        self.assertEqual(parquet_out["merged_from"].tolist(), gpkg_out["merged_from"].tolist())
+        self.assertEqual(parquet_out["road"].tolist(), ["a"])
+        self.assertEqual(parquet_err["point_id"].tolist(), gpkg_err["point_id"].tolist())
+
+
+class TestDerivedPoints(MergeTestCase):
+    """Tests for joint points derived from the line network"""
+
+    def test_derive_joint_points(self):
+        """Joint points are endpoints shared by exactly two lines within tol, junctions and dead ends are skipped"""
+        lines_gdf = gpd.GeoDataFrame(
+            geometry=[
+                LineString([(0, 0), (1, 0)]),
+                LineString([(1.1, 0), (2, 0)]),  # gap within tol
+                LineString([(2, 0), (3, 0)]),
+                LineString([(3, 0), (4, 0)]),  # T junction at (3, 0)
+                LineString([(3, 0), (3, 1)]),
+                LineString([(10, 0), (11, 0), (11, 1), (10, 0)]),  # ring, one line
+            ],
+            crs="EPSG:3857",
+        )
+        points_gdf = derive_joint_points(lines_gdf, tol=0.2)
+        self.assertEqual([(p.x, p.y) for p in points_gdf.geometry], [(1.0, 0.0), (2.0, 0.0)])
+        self.assertEqual(points_gdf["point_id"].tolist(), [0, 1])
+
+        merged_gdf, error_df = merge_at_points(lines_gdf, None, tol=0.2)
+        self.assertEqual(len(merged_gdf), 4)
+        self.assertEqual(merged_gdf["merged_from"].dropna().tolist(), ["0,1,2"])
+        self.assertEqual(len(error_df), 0)
+
+    def test_derived_points_match_explicit_points(self):
+        """Dissolving pseudo-nodes without a points layer equals merging at the same points given explicitly"""
+        lines_gdf, _ = bench.make_grid(400)
+        points_gdf = derive_joint_points(lines_gdf, tol=0.2)
+        self.assertGreater(len(points_gdf), 0)
+        derived_gdf, derived_err = merge_at_points(lines_gdf, None, tol=0.2)
+        explicit_gdf, explicit_err = merge_at_points(
+            lines_gdf, points_gdf, tol=0.2, use_point_id_col="point_id"
+        )
+        pd.testing.assert_frame_equal(derived_gdf, explicit_gdf)
+        self.assertEqual(len(derived_err), 0)
+
+    def test_run_without_points_layer(self):
+        """run derives the joint points when points_path is None"""
+        lines_gdf, _ = self._chain(5)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf)
+            metrics = run(self._param(paths, tol=0.2))
+            out_gdf = gpd.read_file(paths["out"])
+        self.assertEqual(len(out_gdf), 1)
+        self.assertEqual(metrics.counts["derived_points"], 4)
+
+
+class TestMemoryBudget(MergeTestCase):
+    """Tests for the memory budget and the spill to windows"""
+
+    def test_memory_budget(self):
+        """A working set estimated over memory_budget fails fast, run spills to windows when it can"""
+        lines_gdf, points_gdf = self._chain(6)
+        needed = estimate_working_set(lines_gdf, points_gdf)
+        self.assertGreater(needed, 0)
+        with self.assertRaises(MemoryError):
+            merge_at_points(lines_gdf, points_gdf, tol=0.2, memory_budget=needed - 1)
+        merged_gdf, _ = merge_at_points(lines_gdf, points_gdf, tol=0.2, memory_budget=needed)
+        self.assertEqual(len(merged_gdf), 1)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf, points_gdf)
+            param = self._param(paths, tol=0.2, line_id_col="id", point_id_col="point_id", memory_budget=1024)
+            metrics = run(param)
+            out_lines_gdf = gpd.read_file(paths["out"])
+            self.assertIn("windows", metrics.counts)
+            self.assertEqual(len(out_lines_gdf), 1)
+            with self.assertRaises(MemoryError):
+                run(replace(param, points_path=None))
+            # without stable ids windows would number lines by FID instead of row position
+            with self.assertRaises(MemoryError):
+                run(replace(param, line_id_col=None))
+
+    def test_memory_budget_keeps_ids(self):
+        """A run spilled to windows by memory_budget writes the same ids as a full run"""
+        lines_gdf, points_gdf = self._chain(7)
+        lines_gdf["id"] = [f"L{i}" for i in range(7)]
+        # a third line at point 2 makes an error
+        lines_gdf = pd.concat(
+            [
+                lines_gdf,
+                gpd.GeoDataFrame({"id": ["L7"]}, geometry=[LineString([(2, 0), (2, 1)])], crs=lines_gdf.crs),
+            ],
+            ignore_index=True,
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf, points_gdf)
+            results = []
+            for budget in (None, 1000):
+                param = self._param(
+                    dict(
+                        paths,
+                        out=os.path.join(tmpdir, f"out{budget}.gpkg"),
+                        err=os.path.join(tmpdir, f"err{budget}.gpkg"),
+                    ),
+                    tol=0.2,
+                    line_id_col="id",
+                    point_id_col="point_id",
+                    memory_budget=budget,
+                )
+                run(param)
+                out_lines_gdf = gpd.read_file(param.out_lines_path)
+                err_gdf = gpd.read_file(param.out_errors_path)
+                results.append(
+                    (
+                        sorted(
+                            zip(
+                                out_lines_gdf["merged_from"].fillna(""),
+                                out_lines_gdf["merge_point_id"].fillna(""),
+                            )
+                        ),
+                        sorted(zip(err_gdf["point_id"], err_gdf["line_ids"])),
+                    )
+                )
+                # a rerun without errors leaves no stale errors layer
+                lines_gdf.iloc[:7].to_file(os.path.join(tmpdir, "clean.gpkg"), driver="GPKG")
+                run(replace(param, lines_path=os.path.join(tmpdir, "clean.gpkg")))
+                self.assertFalse(os.path.exists(param.out_errors_path))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][0], [("", ""), ("L0,L1", "1"), ("L2,L3,L4,L5,L6", "3,4,5,6")])
+        self.assertEqual(results[0][1], [(2, "L1,L2,L7")])
+
+
+class TestDeduplication(MergeTestCase):
+    """Tests for duplicate removal of merged lines"""
+
+    def test_geometry_fingerprint(self):
+        """Fingerprints ignore direction and differences below the precision grid"""
+        line = LineString([(0, 0), (1, 0), (2, 1)])
+        self.assertEqual(geometry_fingerprint(line), geometry_fingerprint(line.reverse()))
+        self.assertEqual(
+            geometry_fingerprint(line), geometry_fingerprint(LineString([(0, 0), (1, 1e-9), (2, 1)]))
+        )
+        self.assertNotEqual(
+            geometry_fingerprint(line), geometry_fingerprint(LineString([(0, 0), (1, 0.1), (2, 1)]))
+        )
+        self.assertNotEqual(
+            geometry_fingerprint(line),
+            geometry_fingerprint(MultiLineString([[(0, 0), (1, 0)], [(1, 0), (2, 1)]])),
+        )
+        self.assertEqual(geometry_fingerprint(None), geometry_fingerprint(LineString()))
+
+    def test_dedup_reversed_duplicate(self):
+        """A merged line equal to an existing line in reverse is dropped, the existing line is kept"""
+        lines_gdf = gpd.GeoDataFrame(
+            {
+                "id": [0, 1, 2],
+                "geometry": [
+                    LineString([(2, 0), (1, 0), (0, 0)]),
+                    LineString([(0, 0), (1, 0)]),
+                    LineString([(1, 0), (2, 0)]),
+                ],
+            },
+            crs="EPSG:3857",
+        )
+        points_gdf = gpd.GeoDataFrame({"geometry": [Point(1, 0)]}, crs="EPSG:3857")
+        for engine in ("graph", "iterative"):
+            metrics = RunMetrics()
+            merged_gdf, _ = merge_at_points(lines_gdf, points_gdf, tol=0.2, engine=engine, metrics=metrics)
+            self.assertEqual(merged_gdf["id"].tolist(), [0])
+            self.assertEqual(metrics.counts["duplicates"], 1)
+
+
+class TestMergePlan(MergeTestCase):
+    """Tests for the plan-only dry run"""
+
+    def test_plan_matches_merge(self):
+        """The plan lists the chains and errors a full merge produces, without merged geometries"""
+        lines_gdf, points_gdf = bench.make_grid(400)
+        lines_gdf["road"] = np.arange(len(lines_gdf)) % 7 == 0
+        merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=0.2, val_chk_col=("road",))
+        plan_df, plan_err_df = merge_at_points(
+            lines_gdf, points_gdf, tol=0.2, val_chk_col=("road",), plan_only=True
+        )
+        merged = merged_gdf[merged_gdf["merged_from"].notna()]
+        self.assertEqual(list(plan_df.columns), ["chain_id", "line_ids", "point_ids", "merged_count"])
+        self.assertEqual(plan_df["line_ids"].tolist(), merged["merged_from"].tolist())
+        self.assertEqual(plan_df["point_ids"].tolist(), merged["merge_point_id"].tolist())
+        self.assertEqual(plan_df["merged_count"].tolist(), merged["merged_count"].tolist())
+        pd.testing.assert_frame_equal(plan_err_df, error_df)
+        with self.assertWarnsRegex(UserWarning, "plan_only ignores spatial_sort, memory_budget"):
+            warned_df, _ = merge_at_points(
+                lines_gdf, points_gdf, tol=0.2, plan_only=True, spatial_sort="hilbert", memory_budget=1
+            )
+        self.assertEqual(
+            len(warned_df), len(merge_at_points(lines_gdf, points_gdf, tol=0.2, plan_only=True)[0])
+        )
+
+    def test_run_plan(self):
+        """run with plan_only writes the plan table with stable line ids and the predicted errors"""
+        lines_gdf, points_gdf = self._chain(4)
+        # a branch at point 2
+        lines_gdf = pd.concat(
+            [lines_gdf, gpd.GeoDataFrame({"geometry": [LineString([(2, 0), (2, 1)])]}, crs=lines_gdf.crs)],
+            ignore_index=True,
+        )
+        lines_gdf["id"] = [10, 11, 12, 13, 14]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf, points_gdf)
+            run(self._param(paths, tol=0.2, point_id_col="point_id", line_id_col="id", plan_only=True))
+            plan_df = pyogrio.read_dataframe(paths["out"])
+            err_gdf = gpd.read_file(paths["err"])
+        self.assertEqual(plan_df["line_ids"].tolist(), ["10,11", "12,13"])
+        self.assertEqual(plan_df["point_ids"].tolist(), ["1", "3"])
+        self.assertEqual(err_gdf["point_id"].tolist(), [2])
+        self.assertEqual(err_gdf["line_ids"].tolist(), ["11,12,14"])
+
+
+class TestSpatialOrder(MergeTestCase):
+    """Tests for the Hilbert / Morton processing order"""
+
+    def test_spatial_order(self):
+        """Hilbert and Morton orders visit neighbouring cells first and keep ties in input order"""
+        xy = np.array([[1, 1], [0, 0], [1, 0], [0, 1], [0, 0]], dtype=float)
+        self.assertEqual(spatial_order(xy, "hilbert").tolist(), [1, 4, 3, 0, 2])
+        self.assertEqual(spatial_order(xy, "morton").tolist(), [1, 4, 2, 3, 0])
+        self.assertEqual(spatial_order(np.array([[np.nan, np.nan], [5, 5]]), "hilbert").tolist(), [1, 0])
+        with self.assertRaises(ValueError):
+            spatial_order(xy, "peano")
+
+    def test_spatial_sort_keeps_results(self):
+        """Processing in curve order gives the same output, in input ids, as processing in file order"""
+        lines_gdf, points_gdf = bench.make_grid(2000)
+        rng = np.random.default_rng(0)
+        lines_gdf = lines_gdf.iloc[rng.permutation(len(lines_gdf))].reset_index(drop=True)
+        points_gdf = points_gdf.iloc[rng.permutation(len(points_gdf))].reset_index(drop=True)
+        lines_gdf["id"] = np.arange(len(lines_gdf))
+        agg = {"id": "concat"}
+        for engine in ("graph", "iterative"):
+            merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=0.2, engine=engine, agg=agg)
+            for curve in ("hilbert", "morton"):
+                sorted_gdf, sorted_err = merge_at_points(
+                    lines_gdf, points_gdf, tol=0.2, engine=engine, agg=agg, spatial_sort=curve
+                )
+                pd.testing.assert_frame_equal(sorted_gdf, merged_gdf)
+                pd.testing.assert_frame_equal(sorted_err, error_df)
+
+
+class TestEndpointCache(MergeTestCase):
+    """Tests for the on-disk endpoint cache"""
+
+    def test_endpoint_cache(self):
+        """The endpoint cache is built once, memory-mapped on reuse and gives the same matches"""
+        lines_gdf, points_gdf = bench.make_grid(2000)
+        merged_gdf, error_df = merge_at_points(lines_gdf, points_gdf, tol=0.2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for hit in (False, True):
+                metrics = RunMetrics()
+                cached_gdf, cached_err = merge_at_points(
+                    lines_gdf, points_gdf, tol=0.2, cache_dir=tmpdir, metrics=metrics
+                )
+                self.assertEqual(metrics.counts.get("cache_hits", 0), int(hit))
+                pd.testing.assert_frame_equal(cached_gdf, merged_gdf)
+                pd.testing.assert_frame_equal(cached_err, error_df)
+            cache = endpoint_cache(lines_gdf, tmpdir)
+            self.assertIsInstance(cache.xy, np.memmap)
+            # any tol works with the same cache
+            end_xy = endpoint_arrays(lines_gdf.geometry)[0]
+            pt_xy = np.column_stack([points_gdf.geometry.x, points_gdf.geometry.y])
+            for tol in (0.2, 60.0):
+                expected = jointpointLinemerge._strtree_pairs(end_xy, pt_xy, tol, RunMetrics())
+                self.assertEqual(
+                    sorted(zip(*cache.pairs(pt_xy, tol, RunMetrics()))), sorted(zip(*map(list, expected)))
+                )
+            # other geometry, other cache entry
+            lines_gdf.loc[0, "geometry"] = LineString([(0, 0), (1, 1)])
+            metrics = RunMetrics()
+            merge_at_points(lines_gdf, points_gdf, tol=0.2, cache_dir=tmpdir, metrics=metrics)
+            self.assertEqual(metrics.counts["cache_misses"], 1)
+            # a miss removes the least recently used entries past max_entries, a hit counts as a use
+            lru_dir = os.path.join(tmpdir, "lru")
+            os.makedirs(lru_dir)
+            for key in ("a", "b", "a", "c"):
+                endpoint_cache(lines_gdf, lru_dir, key, max_entries=2)
+            self.assertEqual(sorted(os.listdir(lru_dir)), ["endpoints-a", "endpoints-c"])
+
+    def test_endpoint_cache_iterative_spatial_sort(self):
+        """The iterative engine matches cached ends of a spatially sorted table to the right lines"""
+        lines_gdf, points_gdf = bench.make_chain(30)
+        lines_gdf = lines_gdf.sample(frac=1, random_state=0).reset_index(drop=True)
+        expected_gdf, expected_err = merge_at_points(
+            lines_gdf, points_gdf, tol=0.2, engine="iterative", spatial_sort="hilbert"
+        )
+        self.assertEqual(len(expected_gdf), 1)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for _ in range(2):
+                merged_gdf, error_df = merge_at_points(
+                    lines_gdf,
+                    points_gdf,
+                    tol=0.2,
+                    engine="iterative",
+                    spatial_sort="hilbert",
+                    cache_dir=tmpdir,
+                )
+                pd.testing.assert_frame_equal(merged_gdf, expected_gdf)
+                pd.testing.assert_frame_equal(error_df, expected_err)
+
+    def test_run_endpoint_cache_invalidated_on_change(self):
+        """run keys the cache by the lines file, rewriting the file invalidates it"""
+        lines_gdf, points_gdf = self._chain(5)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf, points_gdf)
+            param = self._param(
+                paths, tol=0.2, point_id_col="point_id", cache_dir=os.path.join(tmpdir, "cache")
+            )
+            self.assertEqual(run(param).counts["cache_misses"], 1)
+            self.assertEqual(run(param).counts["cache_hits"], 1)
+            key = file_fingerprint(paths["lines"])
+            lines_gdf.iloc[:3].to_file(paths["lines"], driver="GPKG")
+            self.assertNotEqual(file_fingerprint(paths["lines"]), key)
+            self.assertEqual(run(param).counts["cache_misses"], 1)
+            self.assertEqual(len(gpd.read_file(paths["out"])), 1)
+
+
+class TestServeAndBatch(MergeTestCase):
+    """Tests for lazy imports, the --serve worker and batch manifests"""
+
+    def test_cli_lazy_imports(self):
+        """Importing the module and rejecting arguments load none of the heavy libraries"""
+        code = (
+            "import importlib.util, sys, jointpointLinemerge\n"
+            "print(sorted(m for m in ('numpy', 'pandas', 'geopandas', 'pyproj') "
+            "if m in sys.modules and not isinstance(sys.modules[m], importlib.util._LazyModule)))\n"
+            "sys.argv = ['jointpoint-linemerge', '--lines', 'a', '--out', 'b', '--out-errors', 'c', '--tol', '0']\n"
+            "jointpointLinemerge.main()\n"
+        )
+        proc = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(jointpointLinemerge.__file__)),
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(proc.stdout.strip(), "[]")
+        self.assertEqual(proc.returncode, 2)
+        self.assertIn("tol must be a positive number", proc.stderr)
+
+    def test_serve(self):
+        """serve runs one job per JSON line and answers each, failed jobs do not stop the worker"""
+        lines_gdf, points_gdf = self._chain(4)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self._write_inputs(tmpdir, lines_gdf, points_gdf)
+            job = {
+                "lines_path": paths["lines"],
+                "points_path": paths["points"],
+                "out_lines_path": paths["out"],
+                "out_errors_path": paths["err"],
+                "tol": 0.2,
+                "point_id_col": "point_id",
+            }
+            jobs = [
+                json.dumps(dict(job, id="a")),
+                "not json",
+                json.dumps(dict(job, id="b", tol=-1)),
+                json.dumps(dict(job, id="c", nope=1)),
+                "",
+                json.dumps(dict(job, id="d", engine="iterative")),
+            ]
+            out = io.StringIO()
+            serve(io.StringIO("\n".join(jobs) + "\n"), out)
+            responses = [json.loads(r) for r in out.getvalue().splitlines()]
+            self.assertEqual([r["id"] for r in responses], ["a", None, "b", "c", "d"])
+            self.assertEqual([r["ok"] for r in responses], [True, False, False, False, True])
+            self.assertIn("tol must be a positive number", responses[2]["error"])
+            self.assertIn("nope", responses[3]["error"])
+            self.assertEqual(responses[4]["metrics"]["counts"]["out_lines"], 1)
+            self.assertEqual(len(gpd.read_file(paths["out"])), 1)
+
+    def test_run_batch(self):
+        """A CSV manifest runs on a warm pool, one summary row per job in manifest order, blank cells keep defaults"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rows = []
+            for n in (3, 5):
+                lines_gdf, points_gdf = self._chain(n)
+                paths = self._write_inputs(tmpdir, lines_gdf, points_gdf, tag=n)
+                engine = "iterative" if n == 5 else ""
+                rows.append(
+                    [
+                        f"area{n}",
+                        paths["lines"],
+                        paths["points"],
+                        paths["out"],
+                        paths["err"],
+                        "0.2",
+                        "",
+                        engine,
+                        "",
+                        " ",
+                    ]
+                )
+            rows.append(
+                [
+                    "missing",
+                    os.path.join(tmpdir, "nope.gpkg"),
+                    "",
+                    "x.gpkg",
+                    "y.gpkg",
+                    "0.2",
+                    "a b",
+                    "",
+                    "",
+                    "",
+                ]
+            )
+            manifest = os.path.join(tmpdir, "jobs.csv")
+            with open(manifest, "w", encoding="utf-8") as f:
+                f.write(
+                    "id,lines_path,points_path,out_lines_path,out_errors_path,tol,val_chk_col,engine,matcher,workers\n"
+                )
+                f.write("\n".join(",".join(r) for r in rows) + "\n")
+            jobs = read_manifest(manifest)
+            self.assertEqual(jobs[0]["tol"], 0.2)
+            for key in ("val_chk_col", "engine", "matcher", "workers"):
+                self.assertNotIn(key, jobs[0])
+            self.assertEqual(jobs[1]["engine"], "iterative")
+            self.assertIsNone(jobs[2]["points_path"])
+            self.assertEqual(jobs[2]["val_chk_col"], ["a", "b"])
+            summary_path = os.path.join(tmpdir, "summary.csv")
+            summary = run_batch(jobs, summary_path, workers=2)
+            self.assertEqual(summary["id"].tolist(), ["area3", "area5", "missing"])
+            self.assertEqual(summary["ok"].tolist(), [True, True, False])
+            self.assertEqual(summary["merges"].tolist()[:2], [2, 4])
+            self.assertEqual(summary["out_lines"].tolist()[:2], [1, 1])
+            self.assertTrue((summary["wall_seconds"][:2] > 0).all())
+            self.assertIn("nope.gpkg", summary["error"][2])
+            self.assertEqual(len(pd.read_csv(summary_path)), 3)
+            self.assertEqual(len(gpd.read_file(os.path.join(tmpdir, "out5.gpkg"))), 1)
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    """Tests for the synthetic network generators and baseline comparison of the benchmark suite"""
+
+    def test_generators_size(self):
+        """Every network generator returns the requested number of segments and joint points"""
+        for name, make in bench.NETWORKS.items():
+            lines_gdf, points_gdf = make(500)
+            self.assertEqual(len(lines_gdf), 500, name)
+            self.assertGreater(len(points_gdf), 0, name)
+            self.assertTrue(lines_gdf.geometry.is_valid.all(), name)
+
+    def test_run_case(self):
+        """A case reports wall time, phase times, peak RSS and counts for both targets"""
+        result = bench.run_case("chain", 200, "merge_at_points")
+        self.assertEqual(result["counts"]["out_lines"], 1)
+        self.assertIn("merge", result["phases_s"])
+        self.assertIn("match", result["phases_s"])
+        self.assertGreater(result["peak_rss_mb"], 0)
+        result = bench.run_case("grid", 200, "DLV.run")
+        self.assertGreater(result["counts"]["overlaps"], 0)
+
+    def test_compare_to_baseline(self):
+        """Cases slower or bigger than the baseline beyond the tolerance are flagged"""
+        base = {
+            "target": "merge_at_points",
+            "network": "grid",
+            "size": 1000,
+            "wall_s": 1.0,
+            "peak_rss_mb": 100.0,
+        }
+        self.assertEqual(bench.compare_to_baseline([dict(base, wall_s=1.2)], [base]), [])
+        regressions = bench.compare_to_baseline([dict(base, wall_s=2.0, peak_rss_mb=90.0)], [base])
+        self.assertEqual(
+            [(r["case"], r["metric"]) for r in regressions], [("merge_at_points/grid/1000", "wall_s")]
+        )
+        self.assertEqual(bench.compare_to_baseline([dict(base, size=10)], [base]), [])
+        # no peak RSS where the resource module is missing
+        self.assertEqual(bench.compare_to_baseline([dict(base, peak_rss_mb=None)], [base]), [])
+
+    def test_speedups(self):
+        """Pooled cases are keyed by worker count and compared with the serial run of the same case"""
+        base = {"target": "merge_at_points", "network": "clustered", "size": 1000, "wall_s": 4.0}
+        results = [base, dict(base, workers=4, wall_s=2.0), dict(base, size=10, workers=2, wall_s=1.0)]
+        self.assertEqual(bench.case_key(results[1]), "merge_at_points/clustered/1000/w4")
+        self.assertEqual(bench.speedups(results), {"merge_at_points/clustered/1000/w4": 2.0})
+
+
 if __name__ == "__main__":
     # Run standard unit tests
     print("🧪 표준 단위 테스트를 실행합니다냥...")